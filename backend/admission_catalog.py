@@ -0,0 +1,138 @@
+"""
+Каталог направлений подготовки в памяти процесса.
+
+Абитуриенты постоянно листают направления, а сами направления меняются несколько раз
+в год. Каталог загружается из admission_directions одним запросом и хранится в виде
+индексов: по (university_id, education_level) — список в порядке названий, и по id.
+Для каждого списка и каждого направления заранее сериализован JSON (http_cache.JSONPayload),
+поэтому GET /api/admission/directions и /api/admission/directions/{id} в обычном режиме
+не обращаются к БД и не сериализуют ответ заново.
+
+Сортировка (code, name, cost_per_year) и фильтр по экзамену выполняются над индексом;
+результат каждого варианта запоминается (не больше MAX_VARIANTS вариантов).
+
+Эндпоинтов, изменяющих направления, нет — их правят вручную в БД. Свежесть каталога определяет
+только TTL: изменения подхватываются не позже чем через ADMISSION_CATALOG_TTL секунд
+(по умолчанию 600; 0 — каталог загружается один раз до перезапуска процесса).
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import http_cache
+import repository as repo
+
+CATALOG_TTL = float(os.environ.get("ADMISSION_CATALOG_TTL", 600.0))
+SORT_FIELDS = ("code", "name", "cost_per_year")
+MAX_VARIANTS = 1024
+
+ListingKey = Tuple[int, str]
+
+
+def _sorted(items: List[Dict], field: str, descending: bool) -> List[Dict]:
+    # Направления без значения поля — в конце списка при любом порядке
+    present = [d for d in items if d.get(field) is not None]
+    missing = [d for d in items if d.get(field) is None]
+    return sorted(present, key=lambda d: d[field], reverse=descending) + missing
+
+
+class AdmissionCatalog:
+    """Индексы направлений и готовые JSON-ответы; перезагрузка по TTL."""
+
+    def __init__(self, ttl: float = CATALOG_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._load_lock: Optional[asyncio.Lock] = None
+        self._loaded_at: Optional[float] = None
+        self._listings: Dict[ListingKey, List[Dict]] = {}
+        self._listing_payloads: Dict[ListingKey, http_cache.JSONPayload] = {}
+        self._direction_payloads: Dict[int, http_cache.JSONPayload] = {}
+        self._variants: Dict[Tuple, http_cache.JSONPayload] = {}
+        self._stats = {"hits": 0, "loads": 0, "last_load_ms": 0.0}
+
+    def _is_fresh(self) -> bool:
+        if self._loaded_at is None:
+            return False
+        return not self.ttl or time.monotonic() - self._loaded_at < self.ttl
+
+    def _build(self, directions: List[Dict]):
+        listings: Dict[ListingKey, List[Dict]] = {}
+        for direction in directions:
+            listings.setdefault((direction["university_id"], direction["education_level"]), []).append(direction)
+        listing_payloads = {key: http_cache.json_payload({"directions": items}) for key, items in listings.items()}
+        direction_payloads = {direction["id"]: http_cache.json_payload(direction) for direction in directions}
+        with self._lock:
+            self._listings = listings
+            self._listing_payloads = listing_payloads
+            self._direction_payloads = direction_payloads
+            self._variants = {}
+            self._loaded_at = time.monotonic()
+
+    async def _ensure_loaded(self):
+        if self._is_fresh():
+            with self._lock:
+                self._stats["hits"] += 1
+            return
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            # Пока ждали замок, каталог мог загрузить другой запрос
+            if self._is_fresh():
+                return
+            started = time.monotonic()
+            directions = await repo.applications.get_all_directions()
+            # Тяжёлая сериализация всех ответов — не на event loop
+            await asyncio.to_thread(self._build, directions)
+            with self._lock:
+                self._stats["loads"] += 1
+                self._stats["last_load_ms"] = (time.monotonic() - started) * 1000
+
+    async def listing(self, university_id: int, education_level: str, sort: Optional[str] = None,
+                      descending: bool = False, exam: Optional[str] = None) -> http_cache.JSONPayload:
+        """Готовый ответ {"directions": [...]} для (вуз, уровень) с необязательной сортировкой и фильтром."""
+        if sort is not None and sort not in SORT_FIELDS:
+            raise ValueError(f"Invalid sort field. Must be one of {list(SORT_FIELDS)}")
+        await self._ensure_loaded()
+        key = (university_id, education_level)
+        if sort is None and not descending and not exam:
+            payload = self._listing_payloads.get(key)
+            return payload if payload is not None else http_cache.json_payload({"directions": []})
+
+        # Снимок текущей загрузки: вариант сохраняется в словарь той же загрузки каталога
+        variants, listings = self._variants, self._listings
+        variant = (key, sort, descending, exam)
+        payload = variants.get(variant)
+        if payload is None:
+            items = listings.get(key, [])
+            if exam:
+                items = [d for d in items if exam in (d.get("required_exams") or [])]
+            if sort is not None:
+                items = _sorted(items, sort, descending)
+            elif descending:
+                items = items[::-1]
+            payload = http_cache.json_payload({"directions": items})
+            with self._lock:
+                if len(variants) >= MAX_VARIANTS:
+                    variants.clear()
+                variants[variant] = payload
+        return payload
+
+    async def direction(self, direction_id: int) -> Optional[http_cache.JSONPayload]:
+        """Готовый ответ для одного направления или None."""
+        await self._ensure_loaded()
+        return self._direction_payloads.get(direction_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /api/metrics."""
+        with self._lock:
+            out = dict(self._stats)
+            out["listings"] = len(self._listings)
+            out["directions"] = len(self._direction_payloads)
+            out["variants"] = len(self._variants)
+        out["ttl"] = self.ttl
+        return out
+
+
+catalog = AdmissionCatalog()
@@ -0,0 +1,51 @@
+"""Общие помощники бенчмарков: временный каталог с БД и замер времени."""
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@contextmanager
+def temp_database():
+    """
+    Импортировать database с каталогом data/ во временной папке.
+    database.DB_DIR относительный, поэтому достаточно сменить cwd до импорта.
+    """
+    tmp = tempfile.mkdtemp(prefix="max-bench-")
+    cwd = os.getcwd()
+    os.chdir(tmp)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    os.environ.pop("DATABASE_URL", None)
+    try:
+        import database
+        database.DATABASE_URL = ""
+        database.USE_PG = False
+        database.init_databases()
+        yield database
+    finally:
+        import db_pool
+        db_pool.close_all()
+        os.chdir(cwd)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def measure(fn: Callable, repeat: int = 20) -> Dict[str, float]:
+    """Прогнать fn repeat раз, вернуть медиану и p95 в миллисекундах."""
+    fn()  # прогрев
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[max(0, int(len(samples) * 0.95) - 1)],
+    }
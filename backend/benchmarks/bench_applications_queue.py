@@ -0,0 +1,81 @@
+"""
+Бенчмарк очереди заявлений на проверку (database.get_pending_applications_page без HTTP-слоя).
+
+legacy  — прежний путь без несуществующего в universities.db JOIN users: все заявления
+          в статусе pending одним запросом без индекса, json.loads для каждой строки.
+current — database.get_pending_applications_page: страница из 50 заявлений по индексу
+          applications(university_id, status, created_at, id) и пакетный запрос пользователей.
+
+Таблица содержит заявления нескольких вузов, часть из них уже проверена.
+"""
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import temp_database, measure  # noqa: E402
+
+PENDING_COUNTS = [500, 2_000, 10_000, 50_000]
+OTHER_APPLICATIONS = 50_000
+PAGE_SIZE = 50
+
+
+def legacy_pending(database, university_id):
+    with database.sqlite_connection(database.UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT a.*, d.name as direction_name, d.code as direction_code
+            FROM applications a NOT INDEXED
+            LEFT JOIN admission_directions d ON a.direction_id = d.id
+            WHERE a.university_id = ? AND a.status = 'pending'
+            ORDER BY a.created_at ASC
+        """, (university_id,))
+        applications = []
+        for row in cursor.fetchall():
+            app = dict(row)
+            app["personal_info"] = json.loads(app["personal_info"])
+            app["exam_scores"] = json.loads(app["exam_scores"])
+            applications.append(app)
+    return applications
+
+
+def seed(database, university_id, count, rnd, users):
+    personal = {"first_name": "Иван", "last_name": "Иванов", "phone": "+79990000000", "email": "a@example.com"}
+    scores = {"Математика": 80, "Русский язык": 90, "Информатика": 85}
+    rows = [(rnd.choice(users), university_id, 1, "бакалавриат", json.dumps(personal, ensure_ascii=False),
+             json.dumps(scores, ensure_ascii=False), rnd.choice(["pending", "approved", "rejected"]),
+             f"2026-0{rnd.randint(1, 8)}-{rnd.randint(10, 28)} 12:{rnd.randint(10, 59)}:00")
+            for _ in range(count)]
+    with database.sqlite_connection(database.UNIVERSITIES_DB_PATH) as conn:
+        conn.executemany("""
+            INSERT INTO applications (user_id, university_id, direction_id, education_level,
+                                      personal_info, exam_scores, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+
+def main():
+    rnd = random.Random(42)
+    with temp_database() as database:
+        with database.sqlite_connection(database.USERS_DB_PATH) as conn:
+            conn.executemany("INSERT INTO users (max_user_id, first_name, role) VALUES (?, 'Абитуриент', 'applicant')",
+                             [(500_000 + i,) for i in range(5_000)])
+            users = [row[0] for row in conn.execute("SELECT id FROM users").fetchall()]
+        seed(database, 999, OTHER_APPLICATIONS, rnd, users)
+        print(f"{'pending':>8} | {'legacy all':>11} | {'page first':>11} | {'page deep':>10} | {'speedup':>7}")
+        for uid, pending in enumerate(PENDING_COUNTS, start=1):
+            seed(database, uid, pending * 3, rnd, users)  # ~треть — в статусе pending
+            legacy = measure(lambda: legacy_pending(database, uid), repeat=5)
+            first = measure(lambda: database.get_pending_applications_page(uid, None, PAGE_SIZE))
+            cursor_value = None
+            for _ in range(5):
+                cursor_value = database.get_pending_applications_page(uid, cursor_value, PAGE_SIZE)["next_cursor"]
+            deep = measure(lambda: database.get_pending_applications_page(uid, cursor_value, PAGE_SIZE))
+            speedup = legacy["median_ms"] / first["median_ms"]
+            print(f"{pending:>8} | {legacy['median_ms']:>8.1f} ms | {first['median_ms']:>8.2f} ms | "
+                  f"{deep['median_ms']:>7.2f} ms | {speedup:>6.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Бенчмарк загрузки конфигурации блоков (database.get_university_config без HTTP-слоя и кэша).
+
+legacy  — прежний путь: запрос разделов, затем SELECT * FROM blocks на каждый раздел,
+          без составных индексов.
+current — database.get_university_config: один LEFT JOIN по индексам
+          sections(university_id, role, order_index) и blocks(section_id, order_index).
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import temp_database, measure  # noqa: E402
+
+SECTION_COUNTS = [5, 20, 50, 100]
+BLOCKS_PER_SECTION = 8
+OTHER_UNIVERSITIES = 30  # фон: конфигурации других вузов в тех же таблицах
+ROLE = "student"
+
+
+def seed(database, university_id, sections):
+    rnd = random.Random(university_id)
+    for i in range(sections):
+        section_id = database.add_section(university_id, ROLE, f"Раздел {i}")
+        for k in range(BLOCKS_PER_SECTION):
+            database.add_block(section_id, rnd.choice(["news", "schedule", "lms", "services"]), f"Блок {k}")
+
+
+def legacy_config(database, university_id):
+    with database.sqlite_connection(database.CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM sections NOT INDEXED
+            WHERE university_id = ? AND role = ?
+            ORDER BY order_index ASC
+        """, (university_id, ROLE))
+        sections = []
+        for section_row in cursor.fetchall():
+            section = dict(section_row)
+            cursor.execute("SELECT * FROM blocks NOT INDEXED WHERE section_id = ? ORDER BY order_index ASC",
+                           (section["id"],))
+            section["blocks"] = [dict(row) for row in cursor.fetchall()]
+            sections.append(section)
+    return sections
+
+
+def main():
+    with temp_database() as database:
+        for uid in range(100, 100 + OTHER_UNIVERSITIES):
+            seed(database, uid, 10)
+        targets = {}
+        for n, uid in zip(SECTION_COUNTS, range(1000, 1000 + len(SECTION_COUNTS))):
+            seed(database, uid, n)
+            targets[n] = uid
+        # оба пути должны отдавать одинаковое дерево
+        for uid in targets.values():
+            assert legacy_config(database, uid) == database.get_university_config(uid, ROLE)["sections"]
+        print(f"{'sections':>8} | {'legacy median':>14} | {'current median':>15} | {'speedup':>7}")
+        for n, uid in targets.items():
+            legacy = measure(lambda: legacy_config(database, uid))
+            current = measure(lambda: database.get_university_config(uid, ROLE))
+            speedup = legacy["median_ms"] / current["median_ms"] if current["median_ms"] else float("inf")
+            print(f"{n:>8} | {legacy['median_ms']:>11.2f} ms | {current['median_ms']:>12.2f} ms | {speedup:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
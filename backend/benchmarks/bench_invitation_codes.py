@@ -0,0 +1,65 @@
+"""
+Бенчмарк генерации кодов приглашения (database.generate_invitation_codes_batch без HTTP-слоя).
+
+legacy  — прежний путь: на каждый код SELECT-проверка уникальности и отдельный INSERT.
+current — database.generate_invitation_codes_batch: кандидаты уникальны в памяти,
+          вставка executemany + INSERT OR IGNORE, повтор только для совпавших кодов.
+
+Для каждого размера пакета — время и коды/сек; legacy для 100k не запускается (слишком долго).
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import temp_database  # noqa: E402
+
+BATCH_SIZES = [1_000, 5_000, 20_000, 100_000]
+LEGACY_MAX = 20_000
+PREFILL = 50_000  # уже выданные коды в таблице
+
+
+def legacy_generate(database, count):
+    with database.sqlite_connection(database.UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        codes = []
+        for _ in range(count):
+            while True:
+                code = database.generate_invitation_code()
+                cursor.execute("SELECT id FROM invitation_codes WHERE code = ?", (code,))
+                if cursor.fetchone() is None:
+                    break
+            cursor.execute("""
+                INSERT INTO invitation_codes (code, university_id, role, generated_by_user_id)
+                VALUES (?, ?, ?, ?)
+            """, (code, 1, "student", 1))
+            codes.append(code)
+    return codes
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    with temp_database() as database:
+        database.generate_invitation_codes_batch(1, "student", 1, PREFILL)
+        print(f"{'codes':>8} | {'legacy':>10} | {'legacy codes/s':>14} | {'current':>10} | {'current codes/s':>15}")
+        for size in BATCH_SIZES:
+            legacy_cell = rate_cell = "—"
+            if size <= LEGACY_MAX:
+                codes, elapsed = timed(lambda: legacy_generate(database, size))
+                assert len(set(codes)) == size
+                legacy_cell, rate_cell = f"{elapsed * 1000:.0f} ms", f"{size / elapsed:,.0f}"
+            codes, elapsed = timed(lambda: database.generate_invitation_codes_batch(1, "student", 1, size))
+            assert len(set(codes)) == size
+            print(f"{size:>8} | {legacy_cell:>10} | {rate_cell:>14} | {elapsed * 1000:>7.0f} ms | {size / elapsed:>15,.0f}")
+        with database.sqlite_connection(database.UNIVERSITIES_DB_PATH) as conn:
+            total, distinct = conn.execute("SELECT COUNT(*), COUNT(DISTINCT code) FROM invitation_codes").fetchone()
+        assert total == distinct
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Бенчмарк списка кодов приглашения (database.get_invitation_codes_* без HTTP-слоя).
+
+legacy  — прежний путь: get_invitation_codes_by_university, все коды вуза одним SELECT *.
+page    — database.get_invitation_codes_page: одна страница (100 кодов) по курсору,
+          первая и «глубокая» (из середины списка).
+summary — database.get_invitation_codes_summary: только количество по ролям.
+
+Таблица наполняется кодами нескольких вузов; половина кодов целевого вуза использована.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import temp_database, measure  # noqa: E402
+
+CODES_PER_UNIVERSITY = [1_000, 10_000, 50_000, 200_000]
+OTHER_UNIVERSITY_CODES = 20_000
+PAGE_SIZE = 100
+
+
+def seed(database, university_id, count):
+    codes = database.generate_invitation_codes_batch(university_id, "student", 1, count)
+    with database.sqlite_connection(database.UNIVERSITIES_DB_PATH) as conn:
+        conn.executemany("""
+            UPDATE invitation_codes SET used_by_user_id = ?, used_at = datetime('now', ?)
+            WHERE code = ?
+        """, [(i, f"-{i} seconds", code) for i, code in enumerate(codes[::2])])
+
+
+def deep_cursor(database, university_id, used):
+    """Курсор на середину списка — страница из глубины не должна быть медленнее первой."""
+    cursor_value = None
+    for _ in range(5):
+        cursor_value = database.get_invitation_codes_page(university_id, used, None, cursor_value, 1000)["next_cursor"]
+    return cursor_value
+
+
+def main():
+    with temp_database() as database:
+        seed(database, 999, OTHER_UNIVERSITY_CODES)
+        print(f"{'codes':>8} | {'legacy all':>11} | {'page first':>11} | {'page deep':>10} | "
+              f"{'used deep':>10} | {'summary':>9}")
+        for uid, count in enumerate(CODES_PER_UNIVERSITY, start=1):
+            seed(database, uid, count)
+            legacy = measure(lambda: database.get_invitation_codes_by_university(uid), repeat=5)
+            first = measure(lambda: database.get_invitation_codes_page(uid, None, None, None, PAGE_SIZE))
+            cursor_all, cursor_used = deep_cursor(database, uid, None), deep_cursor(database, uid, True)
+            deep = measure(lambda: database.get_invitation_codes_page(uid, None, None, cursor_all, PAGE_SIZE))
+            used_deep = measure(lambda: database.get_invitation_codes_page(uid, True, None, cursor_used, PAGE_SIZE))
+            summary = measure(lambda: database.get_invitation_codes_summary(uid), repeat=5)
+            print(f"{count:>8} | {legacy['median_ms']:>8.1f} ms | {first['median_ms']:>8.2f} ms | "
+                  f"{deep['median_ms']:>7.2f} ms | {used_deep['median_ms']:>7.2f} ms | {summary['median_ms']:>6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Бенчмарк одновременного использования кодов приглашения (без HTTP-слоя).
+
+legacy  — прежний путь /api/invitation/use: SELECT свободного кода, затем UPDATE,
+          и отдельным вызовом — обновление пользователя.
+current — database.redeem_invitation_code: условный UPDATE ... RETURNING и обновление
+          пользователя до фиксации транзакции с кодом.
+
+Каждый код пытаются использовать два разных пользователя одновременно (день зачисления:
+один код разослали дважды). Потоки имитируют пул потоков репозитория. Для каждого пути —
+успешные использования/сек, ошибки БД и проверка согласованности: ни один код не засчитан
+дважды, у каждого привязанного пользователя код действительно занят им.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import temp_database  # noqa: E402
+
+CODES = 2_000
+CLAIMS_PER_CODE = 2
+THREAD_COUNTS = [1, 4, 16]
+
+
+def legacy_redeem(database, code, user_id, max_user_id):
+    with database.sqlite_connection(database.UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM invitation_codes WHERE code = ? AND used_by_user_id IS NULL", (code,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        code_data = dict(row)
+        cursor.execute("""
+            UPDATE invitation_codes SET used_by_user_id = ?, used_at = CURRENT_TIMESTAMP WHERE id = ?
+        """, (user_id, code_data["id"]))
+    database.update_user_with_invitation_code(max_user_id, code_data["id"], code_data["role"], code_data["university_id"])
+    return code_data
+
+
+def seed_users(database, first_max_id, count):
+    with database.sqlite_connection(database.USERS_DB_PATH) as conn:
+        conn.executemany("INSERT INTO users (max_user_id, first_name, role) VALUES (?, 'Bench', NULL)",
+                         [(first_max_id + i,) for i in range(count)])
+        rows = conn.execute("SELECT id, max_user_id FROM users WHERE max_user_id >= ? ORDER BY max_user_id",
+                            (first_max_id,)).fetchall()
+    return [(row[0], row[1]) for row in rows]
+
+
+def run(database, redeem, threads, base_max_id):
+    codes = database.generate_invitation_codes_batch(7, "student", 1, CODES)
+    users = seed_users(database, base_max_id, CODES * CLAIMS_PER_CODE)
+    attempts = [(code, *users[i * CLAIMS_PER_CODE + k]) for i, code in enumerate(codes) for k in range(CLAIMS_PER_CODE)]
+    random.Random(threads).shuffle(attempts)
+    lock = threading.Lock()
+    outcome = {"ok": 0, "rejected": 0, "errors": 0}
+    winners = {}
+
+    def attempt(item):
+        code, user_id, max_user_id = item
+        try:
+            result = redeem(database, code, user_id, max_user_id)
+        except Exception:
+            with lock:
+                outcome["errors"] += 1
+            return
+        with lock:
+            if result is None:
+                outcome["rejected"] += 1
+            else:
+                outcome["ok"] += 1
+                winners.setdefault(code, []).append(user_id)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(attempt, attempts))
+    elapsed = time.perf_counter() - start
+
+    double = sum(1 for claimed in winners.values() if len(claimed) > 1)
+    # Пользователь привязан к коду, которым на самом деле владеет кто-то другой (или никто)
+    with database.sqlite_connection(database.UNIVERSITIES_DB_PATH) as conn:
+        owner = dict(conn.execute("SELECT id, used_by_user_id FROM invitation_codes WHERE university_id = 7").fetchall())
+    with database.sqlite_connection(database.USERS_DB_PATH) as conn:
+        linked = conn.execute("SELECT id, invitation_code_id FROM users WHERE max_user_id >= ? AND invitation_code_id IS NOT NULL",
+                              (base_max_id,)).fetchall()
+    mismatched = sum(1 for user_id, code_id in linked if owner.get(code_id) != user_id)
+    with database.sqlite_connection(database.UNIVERSITIES_DB_PATH) as conn:
+        conn.execute("DELETE FROM invitation_codes WHERE university_id = 7")
+    return outcome, elapsed, double, mismatched
+
+
+def main():
+    with temp_database() as database:
+        print(f"{'path':>7} | {'threads':>7} | {'ok':>5} | {'rejected':>8} | {'errors':>6} | "
+              f"{'redeems/s':>9} | {'double':>6} | {'mismatched':>10}")
+        base = 1_000_000
+        for threads in THREAD_COUNTS:
+            for name, redeem in (("legacy", legacy_redeem),
+                                 ("current", lambda db, *args: db.redeem_invitation_code(*args))):
+                outcome, elapsed, double, mismatched = run(database, redeem, threads, base)
+                base += CODES * CLAIMS_PER_CODE
+                print(f"{name:>7} | {threads:>7} | {outcome['ok']:>5} | {outcome['rejected']:>8} | "
+                      f"{outcome['errors']:>6} | {outcome['ok'] / elapsed:>9,.0f} | {double:>6} | {mismatched:>10}")
+                if name == "current":
+                    assert outcome["ok"] == CODES and outcome["errors"] == 0 and not double and not mismatched
+
+
+if __name__ == "__main__":
+    main()
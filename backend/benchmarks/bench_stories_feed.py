@@ -0,0 +1,75 @@
+"""
+Бенчмарк ленты историй (GET /api/stories/feed без HTTP-слоя).
+
+legacy  — прежний путь: список историй, запрос обложки на каждую историю,
+          автор на каждую историю, два запроса реакций.
+current — database.get_stories_feed (обложка, реакции, user_reacted в одном запросе)
+          + database.get_users_by_ids (авторы одним запросом).
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _common import temp_database, measure  # noqa: E402
+
+PAGE_SIZES = [10, 25, 50, 100]
+STORIES = 200
+AUTHORS = 60
+VIEWER_ID = 1
+
+
+def seed(database):
+    for i in range(AUTHORS):
+        database.create_user({"max_user_id": 500000 + i, "first_name": f"Автор {i}", "last_name": "Тестов"})
+    rnd = random.Random(42)
+    for i in range(STORIES):
+        slides = [{"type": "image", "media_url": f"stories/{i}/{k}.jpg"} for k in range(rnd.randint(1, 5))]
+        story_id = database.create_story(rnd.randint(1, AUTHORS), 1, slides)
+        for user_id in rnd.sample(range(1, AUTHORS + 1), rnd.randint(0, 20)):
+            database.toggle_story_reaction(story_id, user_id)
+
+
+def legacy_feed(database, limit):
+    with database.sqlite_connection(database.UNIVERSITIES_DB_PATH) as conn:
+        rows = conn.execute("""
+            SELECT s.* FROM stories s
+            WHERE s.expires_at > datetime('now') AND s.status = 'published'
+            ORDER BY CASE WHEN s.university_id = ? THEN 0 ELSE 1 END, s.created_at DESC
+            LIMIT ? OFFSET 0
+        """, (1, limit)).fetchall()
+        items = []
+        for row in rows:
+            s = dict(row)
+            first = conn.execute("SELECT media_url, type FROM story_slides WHERE story_id = ? ORDER BY position LIMIT 1",
+                                 (s["id"],)).fetchone()
+            s["cover_url"] = first["media_url"] if first and first["media_url"] else None
+            items.append(s)
+    story_ids = [s["id"] for s in items]
+    counts = database.get_story_reaction_counts(story_ids)
+    reacted = database.get_user_reacted_story_ids(VIEWER_ID, story_ids)
+    return [(s, database.get_user_by_id(s["author_id"]), counts.get(s["id"], 0), s["id"] in reacted) for s in items]
+
+
+def current_feed(database, limit):
+    items = database.get_stories_feed(1, limit=limit, offset=0, viewer_id=VIEWER_ID)
+    authors = database.get_users_by_ids([s["author_id"] for s in items])
+    return [(s, authors.get(s["author_id"]), s["reaction_count"], s["user_reacted"]) for s in items]
+
+
+def main():
+    with temp_database() as database:
+        seed(database)
+        # оба пути должны отдавать одинаковые данные
+        assert [(s["id"], s["cover_url"], a["id"], c, r) for s, a, c, r in legacy_feed(database, 50)] == \
+               [(s["id"], s["cover_url"], a["id"], c, r) for s, a, c, r in current_feed(database, 50)]
+        print(f"{'page':>6} | {'legacy median':>14} | {'current median':>15} | {'speedup':>7}")
+        for size in PAGE_SIZES:
+            legacy = measure(lambda: legacy_feed(database, size))
+            current = measure(lambda: current_feed(database, size))
+            speedup = legacy["median_ms"] / current["median_ms"] if current["median_ms"] else float("inf")
+            print(f"{size:>6} | {legacy['median_ms']:>11.2f} ms | {current['median_ms']:>12.2f} ms | {speedup:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
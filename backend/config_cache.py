@@ -0,0 +1,80 @@
+"""
+Кэш конфигурации блоков университета в памяти процесса.
+
+GET /api/universities/{id}/blocks вызывается при каждом запуске мини-приложения,
+а разделы и блоки меняются только из админ-панели. Ответы кэшируются по ключу
+(вид, university_id, role) вместе с номером версии; любой админ-мутатор
+(название/цвет/порядок/добавление/удаление разделов и блоков) вызывает bump(),
+и все записи со старой версией считаются устаревшими. Попадание в кэш не трогает БД.
+
+CONFIG_CACHE_TTL — страховочное время жизни записи в секундах (по умолчанию 300;
+0 — без ограничения): при нескольких воркерах uvicorn bump() виден только своему процессу.
+"""
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+CACHE_TTL = float(os.environ.get("CONFIG_CACHE_TTL", 300.0))
+
+
+class ConfigCache:
+    """Версионированный кэш: запись действительна, пока не изменилась версия и не истёк TTL."""
+
+    def __init__(self, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._version = 0
+        self._entries: Dict[Hashable, Tuple[int, float, Any]] = {}
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def bump(self):
+        """Конфигурация изменилась: сбросить все закэшированные ответы."""
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._stats["invalidations"] += 1
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                version, expires_at, value = entry
+                if version == self._version and (not expires_at or now < expires_at):
+                    self._stats["hits"] += 1
+                    return value
+                del self._entries[key]
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key: Hashable, value: Any, version: int):
+        """Сохранить значение, загруженное при версии version (если версия успела смениться — не сохранять)."""
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else 0.0
+        with self._lock:
+            if version == self._version:
+                self._entries[key] = (version, expires_at, value)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.get(key)
+        if value is None:
+            version = self._version
+            value = await loader()
+            self.put(key, value, version)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /api/metrics."""
+        with self._lock:
+            out = dict(self._stats)
+            out["version"] = self._version
+            out["entries"] = len(self._entries)
+        out["ttl"] = self.ttl
+        return out
+
+
+cache = ConfigCache()
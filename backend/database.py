@@ -4,11 +4,14 @@
 """
 import sqlite3
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import json
 import secrets
 import string
+from contextlib import contextmanager
+
+import db_pool
 
 try:
     import psycopg2
@@ -67,6 +70,18 @@ CONFIG_DB_PATH = os.path.join(DB_DIR, "config.db")
 os.makedirs(DB_DIR, exist_ok=True)
 
 
+def sqlite_connection(path: str):
+    """Соединение SQLite из пула (постоянное для потока). Commit на выходе, rollback при ошибке."""
+    return db_pool.sqlite_pool.connection(path)
+
+
+@contextmanager
+def pg_connection():
+    """Соединение PostgreSQL из пула. Commit на выходе, rollback при ошибке."""
+    with db_pool.get_pg_pool(DATABASE_URL).connection() as conn:
+        yield conn
+
+
 def init_databases():
     """Инициализация всех баз данных"""
     init_users_db()
@@ -80,47 +95,13 @@ def init_databases():
 def init_users_db():
     """Инициализация базы данных пользователей (SQLite и при наличии DATABASE_URL — PostgreSQL)."""
     _load_env_database()
-    conn = sqlite3.connect(USERS_DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            max_user_id INTEGER UNIQUE NOT NULL,
-            first_name TEXT NOT NULL,
-            last_name TEXT,
-            username TEXT,
-            photo_url TEXT,
-            language_code TEXT,
-            role TEXT,
-            university_id INTEGER DEFAULT 1,
-            invitation_code_id INTEGER,  -- ID кода приглашения, если использован
-            can_change_role BOOLEAN DEFAULT 1,  -- Может ли менять роль (0 для пользователей с кодом)
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    # Таблица суперадминов приложения
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS superadmins (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            max_user_id INTEGER UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+    with sqlite_connection(USERS_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    conn.commit()
-    conn.close()
-
-    if USE_PG:
-        pg_conn = psycopg2.connect(DATABASE_URL)
-        pg_conn.autocommit = True
-        cur = pg_conn.cursor()
-        cur.execute("""
+        cursor.execute("""
             CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                max_user_id BIGINT UNIQUE NOT NULL,
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                max_user_id INTEGER UNIQUE NOT NULL,
                 first_name TEXT NOT NULL,
                 last_name TEXT,
                 username TEXT,
@@ -128,387 +109,463 @@ def init_users_db():
                 language_code TEXT,
                 role TEXT,
                 university_id INTEGER DEFAULT 1,
-                invitation_code_id INTEGER,
-                can_change_role BOOLEAN DEFAULT true,
+                invitation_code_id INTEGER,  -- ID кода приглашения, если использован
+                can_change_role BOOLEAN DEFAULT 1,  -- Может ли менять роль (0 для пользователей с кодом)
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
-        cur.execute("""
+    
+        # Таблица суперадминов приложения
+        cursor.execute("""
             CREATE TABLE IF NOT EXISTS superadmins (
-                id SERIAL PRIMARY KEY,
-                max_user_id BIGINT UNIQUE NOT NULL,
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                max_user_id INTEGER UNIQUE NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
-        cur.close()
-        pg_conn.close()
+
+    if USE_PG:
+        with pg_connection() as pg_conn:
+            cur = pg_conn.cursor()
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    id SERIAL PRIMARY KEY,
+                    max_user_id BIGINT UNIQUE NOT NULL,
+                    first_name TEXT NOT NULL,
+                    last_name TEXT,
+                    username TEXT,
+                    photo_url TEXT,
+                    language_code TEXT,
+                    role TEXT,
+                    university_id INTEGER DEFAULT 1,
+                    invitation_code_id INTEGER,
+                    can_change_role BOOLEAN DEFAULT true,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS superadmins (
+                    id SERIAL PRIMARY KEY,
+                    max_user_id BIGINT UNIQUE NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cur.close()
 
 
 def init_universities_db():
     """Инициализация базы данных университетов"""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS universities (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            short_name TEXT,
-            description TEXT,
-            admin_user_id INTEGER,  -- ID администратора университета
-            created_by_superadmin_id INTEGER,  -- ID суперадмина, создавшего университет
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    # Таблица кодов приглашения
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS invitation_codes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            code TEXT UNIQUE NOT NULL,
-            university_id INTEGER NOT NULL,
-            role TEXT NOT NULL,
-            generated_by_user_id INTEGER,  -- ID админа, сгенерировавшего код
-            used_by_user_id INTEGER,  -- ID пользователя, использовавшего код
-            used_at TIMESTAMP,
-            expires_at TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (university_id) REFERENCES universities(id),
-            FOREIGN KEY (generated_by_user_id) REFERENCES users(id)
-        )
-    """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS universities (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                short_name TEXT,
+                description TEXT,
+                admin_user_id INTEGER,  -- ID администратора университета
+                created_by_superadmin_id INTEGER,  -- ID суперадмина, создавшего университет
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
     
-    # Таблица регистраций на мероприятия
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS event_registrations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            event_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,  -- max_user_id из таблицы users
-            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(event_id, user_id),
-            FOREIGN KEY (user_id) REFERENCES users(max_user_id)
-        )
-    """)
+        # Таблица кодов приглашения
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS invitation_codes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                code TEXT UNIQUE NOT NULL,
+                university_id INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                generated_by_user_id INTEGER,  -- ID админа, сгенерировавшего код
+                used_by_user_id INTEGER,  -- ID пользователя, использовавшего код
+                used_at TIMESTAMP,
+                expires_at TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (university_id) REFERENCES universities(id),
+                FOREIGN KEY (generated_by_user_id) REFERENCES users(id)
+            )
+        """)
+        # Индексы под постраничные списки кодов (get_invitation_codes_page): все коды, по роли,
+        # неиспользованные (по id) и использованные (по used_at, пустой used_at — в конце) — частичные индексы
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_invitation_codes_university ON invitation_codes(university_id, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_invitation_codes_university_role ON invitation_codes(university_id, role, id)")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_invitation_codes_unused ON invitation_codes(university_id, id)
+            WHERE used_by_user_id IS NULL
+        """)
+        # Прежний индекс по used_at без COALESCE не подходит под порядок страницы
+        cursor.execute("DROP INDEX IF EXISTS idx_invitation_codes_used")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_invitation_codes_used_at
+            ON invitation_codes(university_id, COALESCE(used_at, ''), id)
+            WHERE used_by_user_id IS NOT NULL
+        """)
     
-    # Добавляем дефолтный университет если его нет
-    cursor.execute("SELECT COUNT(*) FROM universities WHERE id = 1")
-    if cursor.fetchone()[0] == 0:
+        # Таблица регистраций на мероприятия
         cursor.execute("""
-            INSERT INTO universities (id, name, short_name, description)
-            VALUES (1, 'Российская академия народного хозяйства', 'РАНХиГС', 
-                    'Федеральное государственное бюджетное образовательное учреждение высшего образования')
+            CREATE TABLE IF NOT EXISTS event_registrations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,  -- max_user_id из таблицы users
+                registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(event_id, user_id),
+                FOREIGN KEY (user_id) REFERENCES users(max_user_id)
+            )
         """)
     
-    conn.commit()
-    conn.close()
+        # Добавляем дефолтный университет если его нет
+        cursor.execute("SELECT COUNT(*) FROM universities WHERE id = 1")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("""
+                INSERT INTO universities (id, name, short_name, description)
+                VALUES (1, 'Российская академия народного хозяйства', 'РАНХиГС', 
+                        'Федеральное государственное бюджетное образовательное учреждение высшего образования')
+            """)
 
 
 def init_events_db():
     """Инициализация базы данных мероприятий и регистраций"""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    # Таблица мероприятий
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            date TEXT NOT NULL,
-            location TEXT,
-            organizer TEXT,
-            university_id INTEGER NOT NULL,
-            created_by_user_id INTEGER,  -- ID админа, создавшего мероприятие
-            images TEXT,  -- JSON массив URL изображений
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (university_id) REFERENCES universities(id),
-            FOREIGN KEY (created_by_user_id) REFERENCES users(id)
-        )
-    """)
-    
-    # Таблица регистраций на мероприятия
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS event_registrations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            event_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,  -- max_user_id из таблицы users
-            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(event_id, user_id),
-            FOREIGN KEY (event_id) REFERENCES events(id)
-        )
-    """)
+        # Таблица мероприятий
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                description TEXT,
+                date TEXT NOT NULL,
+                location TEXT,
+                organizer TEXT,
+                university_id INTEGER NOT NULL,
+                created_by_user_id INTEGER,  -- ID админа, создавшего мероприятие
+                images TEXT,  -- JSON массив URL изображений
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (university_id) REFERENCES universities(id),
+                FOREIGN KEY (created_by_user_id) REFERENCES users(id)
+            )
+        """)
     
-    conn.commit()
-    conn.close()
+        # Таблица регистраций на мероприятия
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS event_registrations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,  -- max_user_id из таблицы users
+                registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(event_id, user_id),
+                FOREIGN KEY (event_id) REFERENCES events(id)
+            )
+        """)
+
+
+def _add_missing_columns(cursor, table: str, columns: Dict[str, str]) -> bool:
+    """Миграция старых баз: ALTER TABLE ADD COLUMN для отсутствующих колонок. True, если что-то добавлено."""
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()}
+    added = False
+    for name, ddl in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+            added = True
+    return added
 
 
 def init_stories_db():
     """Инициализация таблиц для сервиса историй (stories)."""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS stories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            author_id INTEGER NOT NULL,
-            university_id INTEGER NOT NULL,
-            status TEXT NOT NULL DEFAULT 'published',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP NOT NULL,
-            view_count INTEGER DEFAULT 0,
-            slide_count INTEGER NOT NULL DEFAULT 0
-        )
-    """)
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_stories_expires_at ON stories(expires_at)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_stories_author_created ON stories(author_id, created_at)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_stories_university_status_created ON stories(university_id, status, created_at)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stories (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                author_id INTEGER NOT NULL,
+                university_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'published',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expires_at TIMESTAMP NOT NULL,
+                view_count INTEGER DEFAULT 0,
+                slide_count INTEGER NOT NULL DEFAULT 0,
+                cover_url TEXT,  -- media_url первого слайда (денормализовано)
+                thumb_url TEXT,  -- уменьшенная WebP-обложка первого слайда (денормализовано)
+                reaction_count INTEGER NOT NULL DEFAULT 0  -- число строк story_reactions (денормализовано)
+            )
+        """)
+        # Денормализованные колонки в старых базах добавляются и заполняются
+        added_columns = _add_missing_columns(cursor, "stories", {
+            "cover_url": "TEXT",
+            "thumb_url": "TEXT",
+            "reaction_count": "INTEGER NOT NULL DEFAULT 0",
+        })
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stories_expires_at ON stories(expires_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stories_author_created ON stories(author_id, created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stories_university_status_created ON stories(university_id, status, created_at)")
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS story_slides (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            story_id INTEGER NOT NULL,
-            position INTEGER NOT NULL,
-            type TEXT NOT NULL,
-            media_url TEXT,
-            text TEXT,
-            duration_sec REAL,
-            FOREIGN KEY (story_id) REFERENCES stories(id) ON DELETE CASCADE
-        )
-    """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS story_slides (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                story_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                type TEXT NOT NULL,
+                media_url TEXT,
+                text TEXT,
+                duration_sec REAL,
+                thumb_url TEXT,   -- WebP-превью (фото или кадр видео)
+                poster_url TEXT,  -- кадр-постер для видео
+                blob_sha256 TEXT, -- файл в общем хранилище story_media_blobs (NULL — старый файл в stories/{id}/)
+                FOREIGN KEY (story_id) REFERENCES stories(id) ON DELETE CASCADE
+            )
+        """)
+        _add_missing_columns(cursor, "story_slides", {"thumb_url": "TEXT", "poster_url": "TEXT", "blob_sha256": "TEXT"})
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_story_slides_story_position ON story_slides(story_id, position)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_story_slides_blob ON story_slides(blob_sha256)")
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS story_views (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            story_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            slide_reached INTEGER,
-            UNIQUE(story_id, user_id),
-            FOREIGN KEY (story_id) REFERENCES stories(id)
-        )
-    """)
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_story_views_story_user ON story_views(story_id, user_id)")
+        # Медиа историй по хэшу содержимого: одинаковые загрузки хранятся одним файлом
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS story_media_blobs (
+                sha256 TEXT PRIMARY KEY,
+                ext TEXT NOT NULL,
+                size INTEGER NOT NULL DEFAULT 0,
+                ref_count INTEGER NOT NULL DEFAULT 0,  -- число слайдов, ссылающихся на файл
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_story_media_blobs_unreferenced ON story_media_blobs(sha256) WHERE ref_count <= 0")
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS story_reactions (
-            story_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (story_id, user_id),
-            FOREIGN KEY (story_id) REFERENCES stories(id) ON DELETE CASCADE
-        )
-    """)
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_story_reactions_story ON story_reactions(story_id)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS story_views (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                story_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                slide_reached INTEGER,
+                UNIQUE(story_id, user_id),
+                FOREIGN KEY (story_id) REFERENCES stories(id)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_story_views_story_user ON story_views(story_id, user_id)")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS story_reactions (
+                story_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (story_id, user_id),
+                FOREIGN KEY (story_id) REFERENCES stories(id) ON DELETE CASCADE
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_story_reactions_story ON story_reactions(story_id)")
 
-    conn.commit()
-    conn.close()
+    if added_columns:
+        reconcile_story_counters()
 
 
 def init_applications_db():
     """Инициализация базы данных заявлений абитуриентов"""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    # Таблица направлений подготовки
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS admission_directions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            university_id INTEGER NOT NULL,
-            education_level TEXT NOT NULL,  -- бакалавриат, магистратура, аспирантура
-            code TEXT NOT NULL,  -- Код направления (например, 09.03.01)
-            name TEXT NOT NULL,
-            description TEXT,
-            image_url TEXT,  -- URL изображения или null для градиента
-            gradient_color TEXT,  -- Цвет градиента если нет изображения
-            required_exams TEXT,  -- JSON массив ЕГЭ (например, ["Математика", "Русский язык", "Информатика"])
-            cost_per_year INTEGER,  -- Стоимость обучения в год
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (university_id) REFERENCES universities(id)
-        )
-    """)
-    
-    # Таблица заявлений абитуриентов
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS applications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            university_id INTEGER NOT NULL,
-            direction_id INTEGER NOT NULL,
-            education_level TEXT NOT NULL,
-            status TEXT DEFAULT 'pending',  -- pending, approved, rejected
-            personal_info TEXT,  -- JSON с личной информацией
-            exam_scores TEXT,  -- JSON с баллами ЕГЭ
-            application_file_url TEXT,  -- URL прикрепленного файла заявления
-            reviewed_by_user_id INTEGER,  -- ID админа, проверившего заявление
-            review_notes TEXT,  -- Комментарий при проверке
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            reviewed_at TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (university_id) REFERENCES universities(id),
-            FOREIGN KEY (direction_id) REFERENCES admission_directions(id)
-        )
-    """)
+        # Таблица направлений подготовки
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS admission_directions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                university_id INTEGER NOT NULL,
+                education_level TEXT NOT NULL,  -- бакалавриат, магистратура, аспирантура
+                code TEXT NOT NULL,  -- Код направления (например, 09.03.01)
+                name TEXT NOT NULL,
+                description TEXT,
+                image_url TEXT,  -- URL изображения или null для градиента
+                gradient_color TEXT,  -- Цвет градиента если нет изображения
+                required_exams TEXT,  -- JSON массив ЕГЭ (например, ["Математика", "Русский язык", "Информатика"])
+                cost_per_year INTEGER,  -- Стоимость обучения в год
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (university_id) REFERENCES universities(id)
+            )
+        """)
     
-    conn.commit()
-    conn.close()
+        # Таблица заявлений абитуриентов
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS applications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                university_id INTEGER NOT NULL,
+                direction_id INTEGER NOT NULL,
+                education_level TEXT NOT NULL,
+                status TEXT DEFAULT 'pending',  -- pending, approved, rejected
+                personal_info TEXT,  -- JSON с личной информацией
+                exam_scores TEXT,  -- JSON с баллами ЕГЭ
+                application_file_url TEXT,  -- URL прикрепленного файла заявления
+                reviewed_by_user_id INTEGER,  -- ID админа, проверившего заявление
+                review_notes TEXT,  -- Комментарий при проверке
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                reviewed_at TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                FOREIGN KEY (university_id) REFERENCES universities(id),
+                FOREIGN KEY (direction_id) REFERENCES admission_directions(id)
+            )
+        """)
+        # Очередь на проверку: заявления вуза в статусе по порядку подачи (get_pending_applications_page)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_applications_university_status_created
+            ON applications(university_id, status, created_at, id)
+        """)
     
     # Добавляем мок-данные для направлений если их нет
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM admission_directions WHERE university_id = 1")
-    if cursor.fetchone()[0] == 0:
-        mock_directions = [
-            {
-                "university_id": 1,
-                "education_level": "бакалавриат",
-                "code": "09.03.01",
-                "name": "Информатика и вычислительная техника",
-                "description": "Подготовка специалистов в области разработки программного обеспечения, системного администрирования и информационных технологий",
-                "image_url": None,
-                "gradient_color": "#4A90E2",
-                "required_exams": json.dumps(["Математика", "Русский язык", "Информатика"]),
-                "cost_per_year": 250000
-            },
-            {
-                "university_id": 1,
-                "education_level": "бакалавриат",
-                "code": "38.03.01",
-                "name": "Экономика",
-                "description": "Изучение экономических процессов, финансового анализа и управления экономическими системами",
-                "image_url": None,
-                "gradient_color": "#50C878",
-                "required_exams": json.dumps(["Математика", "Русский язык", "Обществознание"]),
-                "cost_per_year": 220000
-            },
-            {
-                "university_id": 1,
-                "education_level": "бакалавриат",
-                "code": "01.03.02",
-                "name": "Прикладная математика и информатика",
-                "description": "Математическое моделирование, алгоритмы и вычислительные методы",
-                "image_url": None,
-                "gradient_color": "#FF6B6B",
-                "required_exams": json.dumps(["Математика", "Русский язык", "Информатика"]),
-                "cost_per_year": 240000
-            },
-            {
-                "university_id": 1,
-                "education_level": "магистратура",
-                "code": "09.04.01",
-                "name": "Информатика и вычислительная техника",
-                "description": "Углубленное изучение современных информационных технологий и систем",
-                "image_url": None,
-                "gradient_color": "#9B59B6",
-                "required_exams": json.dumps(["Математика", "Русский язык"]),
-                "cost_per_year": 280000
-            },
-            {
-                "university_id": 1,
-                "education_level": "аспирантура",
-                "code": "09.06.01",
-                "name": "Информатика и вычислительная техника",
-                "description": "Научно-исследовательская деятельность в области информатики",
-                "image_url": None,
-                "gradient_color": "#E67E22",
-                "required_exams": json.dumps([]),
-                "cost_per_year": 300000
-            }
-        ]
-        
-        for direction in mock_directions:
-            cursor.execute("""
-                INSERT INTO admission_directions 
-                (university_id, education_level, code, name, description, image_url, gradient_color, required_exams, cost_per_year)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                direction["university_id"],
-                direction["education_level"],
-                direction["code"],
-                direction["name"],
-                direction["description"],
-                direction["image_url"],
-                direction["gradient_color"],
-                direction["required_exams"],
-                direction["cost_per_year"]
-            ))
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM admission_directions WHERE university_id = 1")
+        if cursor.fetchone()[0] == 0:
+            mock_directions = [
+                {
+                    "university_id": 1,
+                    "education_level": "бакалавриат",
+                    "code": "09.03.01",
+                    "name": "Информатика и вычислительная техника",
+                    "description": "Подготовка специалистов в области разработки программного обеспечения, системного администрирования и информационных технологий",
+                    "image_url": None,
+                    "gradient_color": "#4A90E2",
+                    "required_exams": json.dumps(["Математика", "Русский язык", "Информатика"]),
+                    "cost_per_year": 250000
+                },
+                {
+                    "university_id": 1,
+                    "education_level": "бакалавриат",
+                    "code": "38.03.01",
+                    "name": "Экономика",
+                    "description": "Изучение экономических процессов, финансового анализа и управления экономическими системами",
+                    "image_url": None,
+                    "gradient_color": "#50C878",
+                    "required_exams": json.dumps(["Математика", "Русский язык", "Обществознание"]),
+                    "cost_per_year": 220000
+                },
+                {
+                    "university_id": 1,
+                    "education_level": "бакалавриат",
+                    "code": "01.03.02",
+                    "name": "Прикладная математика и информатика",
+                    "description": "Математическое моделирование, алгоритмы и вычислительные методы",
+                    "image_url": None,
+                    "gradient_color": "#FF6B6B",
+                    "required_exams": json.dumps(["Математика", "Русский язык", "Информатика"]),
+                    "cost_per_year": 240000
+                },
+                {
+                    "university_id": 1,
+                    "education_level": "магистратура",
+                    "code": "09.04.01",
+                    "name": "Информатика и вычислительная техника",
+                    "description": "Углубленное изучение современных информационных технологий и систем",
+                    "image_url": None,
+                    "gradient_color": "#9B59B6",
+                    "required_exams": json.dumps(["Математика", "Русский язык"]),
+                    "cost_per_year": 280000
+                },
+                {
+                    "university_id": 1,
+                    "education_level": "аспирантура",
+                    "code": "09.06.01",
+                    "name": "Информатика и вычислительная техника",
+                    "description": "Научно-исследовательская деятельность в области информатики",
+                    "image_url": None,
+                    "gradient_color": "#E67E22",
+                    "required_exams": json.dumps([]),
+                    "cost_per_year": 300000
+                }
+            ]
         
-        conn.commit()
-    conn.close()
+            for direction in mock_directions:
+                cursor.execute("""
+                    INSERT INTO admission_directions 
+                    (university_id, education_level, code, name, description, image_url, gradient_color, required_exams, cost_per_year)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    direction["university_id"],
+                    direction["education_level"],
+                    direction["code"],
+                    direction["name"],
+                    direction["description"],
+                    direction["image_url"],
+                    direction["gradient_color"],
+                    direction["required_exams"],
+                    direction["cost_per_year"]
+                ))
 
 
 def init_config_db():
     """Инициализация базы данных конфигураций"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    cursor = conn.cursor()
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    # Таблица разделов (sections)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS sections (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            university_id INTEGER NOT NULL,
-            role TEXT NOT NULL,
-            name TEXT NOT NULL,
-            order_index INTEGER DEFAULT 0,
-            header_color TEXT DEFAULT '#0088CC',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+        # Таблица разделов (sections)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sections (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                university_id INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                name TEXT NOT NULL,
+                order_index INTEGER DEFAULT 0,
+                header_color TEXT DEFAULT '#0088CC',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
     
-    # Таблица блоков (blocks)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS blocks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            section_id INTEGER NOT NULL,
-            block_type TEXT NOT NULL,
-            name TEXT NOT NULL,
-            order_index INTEGER DEFAULT 0,
-            config TEXT,  -- JSON конфигурация блока
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (section_id) REFERENCES sections(id) ON DELETE CASCADE
-        )
-    """)
+        # Таблица блоков (blocks)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS blocks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                section_id INTEGER NOT NULL,
+                block_type TEXT NOT NULL,
+                name TEXT NOT NULL,
+                order_index INTEGER DEFAULT 0,
+                config TEXT,  -- JSON конфигурация блока
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (section_id) REFERENCES sections(id) ON DELETE CASCADE
+            )
+        """)
     
-    # Таблица шаблонов (templates)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS templates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            role TEXT NOT NULL,
-            config TEXT NOT NULL,  -- JSON конфигурация шаблона
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+        # Таблица шаблонов (templates)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS templates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                description TEXT,
+                role TEXT NOT NULL,
+                config TEXT NOT NULL,  -- JSON конфигурация шаблона
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
     
-    # Таблица кастомных блоков (custom_blocks) для модерации
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS custom_blocks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            university_id INTEGER NOT NULL,
-            submitted_by_user_id INTEGER NOT NULL,
-            block_type TEXT NOT NULL,
-            name TEXT NOT NULL,
-            description TEXT,
-            code TEXT NOT NULL,  -- JavaScript код виджета
-            config_schema TEXT,  -- JSON схема конфигурации
-            status TEXT DEFAULT 'pending',  -- pending, approved, rejected
-            reviewed_by_user_id INTEGER,
-            review_notes TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            reviewed_at TIMESTAMP,
-            FOREIGN KEY (university_id) REFERENCES universities(id),
-            FOREIGN KEY (submitted_by_user_id) REFERENCES users(id)
-        )
-    """)
+        # Таблица кастомных блоков (custom_blocks) для модерации
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS custom_blocks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                university_id INTEGER NOT NULL,
+                submitted_by_user_id INTEGER NOT NULL,
+                block_type TEXT NOT NULL,
+                name TEXT NOT NULL,
+                description TEXT,
+                code TEXT NOT NULL,  -- JavaScript код виджета
+                config_schema TEXT,  -- JSON схема конфигурации
+                status TEXT DEFAULT 'pending',  -- pending, approved, rejected
+                reviewed_by_user_id INTEGER,
+                review_notes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                reviewed_at TIMESTAMP,
+                FOREIGN KEY (university_id) REFERENCES universities(id),
+                FOREIGN KEY (submitted_by_user_id) REFERENCES users(id)
+            )
+        """)
     
-    # Инициализация дефолтных разделов и блоков
-    init_default_config(cursor)
+        # Дерево конфигурации (разделы роли -> блоки) читается одним запросом по этим индексам
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sections_university_role_order ON sections(university_id, role, order_index)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_blocks_section_order ON blocks(section_id, order_index)")
     
-    conn.commit()
-    conn.close()
+        # Инициализация дефолтных разделов и блоков
+        init_default_config(cursor)
 
 
 def init_default_config(cursor):
@@ -586,47 +643,78 @@ def init_default_config(cursor):
 def get_user(max_user_id: int) -> Optional[Dict]:
     """Получить пользователя по MAX user ID"""
     if USE_PG:
-        conn = psycopg2.connect(DATABASE_URL, cursor_factory=pg_extras.RealDictCursor)
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM users WHERE max_user_id = %s", (max_user_id,))
-        row = cur.fetchone()
-        conn.close()
+        with pg_connection() as conn:
+            cur = conn.cursor(cursor_factory=pg_extras.RealDictCursor)
+            cur.execute("SELECT * FROM users WHERE max_user_id = %s", (max_user_id,))
+            row = cur.fetchone()
         return dict(row) if row else None
-    conn = sqlite3.connect(USERS_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE max_user_id = ?", (max_user_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with sqlite_connection(USERS_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users WHERE max_user_id = ?", (max_user_id,))
+        row = cursor.fetchone()
+
     return dict(row) if row else None
 
 
 def get_user_by_id(internal_id: int) -> Optional[Dict]:
     """Получить пользователя по внутреннему ID (id в таблице users)."""
     if USE_PG:
-        conn = psycopg2.connect(DATABASE_URL, cursor_factory=pg_extras.RealDictCursor)
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM users WHERE id = %s", (internal_id,))
-        row = cur.fetchone()
-        conn.close()
+        with pg_connection() as conn:
+            cur = conn.cursor(cursor_factory=pg_extras.RealDictCursor)
+            cur.execute("SELECT * FROM users WHERE id = %s", (internal_id,))
+            row = cur.fetchone()
         return dict(row) if row else None
-    conn = sqlite3.connect(USERS_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE id = ?", (internal_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with sqlite_connection(USERS_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users WHERE id = ?", (internal_id,))
+        row = cursor.fetchone()
+
     return dict(row) if row else None
 
 
+def get_users_by_ids(internal_ids: List[int]) -> Dict[int, Dict]:
+    """Пакетно получить пользователей по внутренним ID. Возвращает словарь id -> пользователь."""
+    ids = list({int(i) for i in internal_ids if i is not None})
+    if not ids:
+        return {}
+    if USE_PG:
+        with pg_connection() as conn:
+            cur = conn.cursor(cursor_factory=pg_extras.RealDictCursor)
+            cur.execute("SELECT * FROM users WHERE id = ANY(%s)", (ids,))
+            rows = cur.fetchall()
+        return {row["id"]: dict(row) for row in rows}
+    with sqlite_connection(USERS_DB_PATH) as conn:
+        placeholders = ",".join("?" * len(ids))
+        rows = conn.execute(f"SELECT * FROM users WHERE id IN ({placeholders})", ids).fetchall()
+    return {row["id"]: dict(row) for row in rows}
+
+
 def create_user(user_data: Dict) -> Dict:
     """Создать нового пользователя"""
     if USE_PG:
-        conn = psycopg2.connect(DATABASE_URL)
-        cur = conn.cursor()
-        cur.execute("""
+        with pg_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO users (max_user_id, first_name, last_name, username, photo_url, language_code, role, university_id, invitation_code_id, can_change_role)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                user_data["max_user_id"],
+                user_data["first_name"],
+                user_data.get("last_name"),
+                user_data.get("username"),
+                user_data.get("photo_url"),
+                user_data.get("language_code"),
+                user_data.get("role"),
+                user_data.get("university_id", 1),
+                user_data.get("invitation_code_id"),
+                user_data.get("can_change_role", True),
+            ))
+        return get_user(user_data["max_user_id"])
+    with sqlite_connection(USERS_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
             INSERT INTO users (max_user_id, first_name, last_name, username, photo_url, language_code, role, university_id, invitation_code_id, can_change_role)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             user_data["max_user_id"],
             user_data["first_name"],
@@ -637,79 +725,50 @@ def create_user(user_data: Dict) -> Dict:
             user_data.get("role"),
             user_data.get("university_id", 1),
             user_data.get("invitation_code_id"),
-            user_data.get("can_change_role", True),
+            user_data.get("can_change_role", 1)
         ))
-        conn.commit()
-        conn.close()
-        return get_user(user_data["max_user_id"])
-    conn = sqlite3.connect(USERS_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO users (max_user_id, first_name, last_name, username, photo_url, language_code, role, university_id, invitation_code_id, can_change_role)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        user_data["max_user_id"],
-        user_data["first_name"],
-        user_data.get("last_name"),
-        user_data.get("username"),
-        user_data.get("photo_url"),
-        user_data.get("language_code"),
-        user_data.get("role"),
-        user_data.get("university_id", 1),
-        user_data.get("invitation_code_id"),
-        user_data.get("can_change_role", 1)
-    ))
-    conn.commit()
-    conn.close()
+
     return get_user(user_data["max_user_id"])
 
 
 def update_user_with_invitation_code(max_user_id: int, invitation_code_id: int, role: str, university_id: int):
     """Обновить пользователя после использования кода приглашения"""
     if USE_PG:
-        conn = psycopg2.connect(DATABASE_URL)
-        cur = conn.cursor()
-        cur.execute("""
+        with pg_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE users 
+                SET role = %s, university_id = %s, invitation_code_id = %s, can_change_role = false, updated_at = CURRENT_TIMESTAMP
+                WHERE max_user_id = %s
+            """, (role, university_id, invitation_code_id, max_user_id))
+        return
+    with sqlite_connection(USERS_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
             UPDATE users 
-            SET role = %s, university_id = %s, invitation_code_id = %s, can_change_role = false, updated_at = CURRENT_TIMESTAMP
-            WHERE max_user_id = %s
+            SET role = ?, university_id = ?, invitation_code_id = ?, can_change_role = 0, updated_at = CURRENT_TIMESTAMP
+            WHERE max_user_id = ?
         """, (role, university_id, invitation_code_id, max_user_id))
-        conn.commit()
-        conn.close()
-        return
-    conn = sqlite3.connect(USERS_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE users 
-        SET role = ?, university_id = ?, invitation_code_id = ?, can_change_role = 0, updated_at = CURRENT_TIMESTAMP
-        WHERE max_user_id = ?
-    """, (role, university_id, invitation_code_id, max_user_id))
-    conn.commit()
-    conn.close()
 
 
 def update_user_role(max_user_id: int, role: str, university_id: int = 1):
     """Обновить роль пользователя"""
     if USE_PG:
-        conn = psycopg2.connect(DATABASE_URL)
-        cur = conn.cursor()
-        cur.execute("""
+        with pg_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE users 
+                SET role = %s, university_id = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE max_user_id = %s
+            """, (role, university_id, max_user_id))
+        return
+    with sqlite_connection(USERS_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
             UPDATE users 
-            SET role = %s, university_id = %s, updated_at = CURRENT_TIMESTAMP
-            WHERE max_user_id = %s
+            SET role = ?, university_id = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE max_user_id = ?
         """, (role, university_id, max_user_id))
-        conn.commit()
-        conn.close()
-        return
-    conn = sqlite3.connect(USERS_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE users 
-        SET role = ?, university_id = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE max_user_id = ?
-    """, (role, university_id, max_user_id))
-    conn.commit()
-    conn.close()
 
 
 def update_user_profile(
@@ -722,88 +781,125 @@ def update_user_profile(
 ):
     """Обновить профиль пользователя (имя, фамилия, аватар из MAX)."""
     if USE_PG:
-        conn = psycopg2.connect(DATABASE_URL)
-        cur = conn.cursor()
-        cur.execute("""
+        with pg_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE users SET
+                    first_name = COALESCE(%s, first_name),
+                    last_name = COALESCE(%s, last_name),
+                    username = COALESCE(%s, username),
+                    photo_url = COALESCE(%s, photo_url),
+                    language_code = COALESCE(%s, language_code),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE max_user_id = %s
+            """, (first_name, last_name, username, photo_url, language_code, max_user_id))
+        return
+    with sqlite_connection(USERS_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
             UPDATE users SET
-                first_name = COALESCE(%s, first_name),
-                last_name = COALESCE(%s, last_name),
-                username = COALESCE(%s, username),
-                photo_url = COALESCE(%s, photo_url),
-                language_code = COALESCE(%s, language_code),
+                first_name = COALESCE(?, first_name),
+                last_name = COALESCE(?, last_name),
+                username = COALESCE(?, username),
+                photo_url = COALESCE(?, photo_url),
+                language_code = COALESCE(?, language_code),
                 updated_at = CURRENT_TIMESTAMP
-            WHERE max_user_id = %s
+            WHERE max_user_id = ?
         """, (first_name, last_name, username, photo_url, language_code, max_user_id))
-        conn.commit()
-        conn.close()
-        return
-    conn = sqlite3.connect(USERS_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE users SET
-            first_name = COALESCE(?, first_name),
-            last_name = COALESCE(?, last_name),
-            username = COALESCE(?, username),
-            photo_url = COALESCE(?, photo_url),
-            language_code = COALESCE(?, language_code),
-            updated_at = CURRENT_TIMESTAMP
-        WHERE max_user_id = ?
-    """, (first_name, last_name, username, photo_url, language_code, max_user_id))
-    conn.commit()
-    conn.close()
 
 
 def is_superadmin(max_user_id: int) -> bool:
     """Проверить, является ли пользователь суперадмином."""
     if USE_PG:
-        conn = psycopg2.connect(DATABASE_URL)
-        cur = conn.cursor()
-        cur.execute("SELECT 1 FROM superadmins WHERE max_user_id = %s LIMIT 1", (max_user_id,))
-        row = cur.fetchone()
-        conn.close()
+        with pg_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT 1 FROM superadmins WHERE max_user_id = %s LIMIT 1", (max_user_id,))
+            row = cur.fetchone()
         return row is not None
-    conn = sqlite3.connect(USERS_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM superadmins WHERE max_user_id = ? LIMIT 1", (max_user_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with sqlite_connection(USERS_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM superadmins WHERE max_user_id = ? LIMIT 1", (max_user_id,))
+        row = cursor.fetchone()
+
     return row is not None
 
 
+# ============ ФУНКЦИИ ДЛЯ РАБОТЫ С УНИВЕРСИТЕТАМИ ============
+
+def get_university(university_id: int) -> Optional[Dict]:
+    """Получить университет по ID"""
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        row = conn.execute("SELECT * FROM universities WHERE id = ?", (university_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def get_all_universities() -> List[Dict]:
+    """Получить все университеты"""
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        rows = conn.execute("SELECT * FROM universities ORDER BY id").fetchall()
+    return [dict(row) for row in rows]
+
+
+def create_university(name: str, short_name: str, description: str,
+                      created_by_superadmin_id: int, admin_user_id: int) -> int:
+    """Создать университет; пользователь admin_user_id (MAX ID) становится его администратором"""
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO universities (name, short_name, description, admin_user_id, created_by_superadmin_id)
+            VALUES (?, ?, ?, ?, ?)
+        """, (name, short_name, description, admin_user_id, created_by_superadmin_id))
+        university_id = cursor.lastrowid
+    update_user_role(admin_user_id, "admin", university_id)
+    return university_id
+
+
+def set_university_admin(university_id: int, admin_user_id: int) -> bool:
+    """Назначить администратора университета (MAX ID пользователя). False — университета нет"""
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.execute("UPDATE universities SET admin_user_id = ? WHERE id = ?", (admin_user_id, university_id))
+        updated = cursor.rowcount > 0
+    if updated:
+        update_user_role(admin_user_id, "admin", university_id)
+    return updated
+
+
 # ============ ФУНКЦИИ ДЛЯ РАБОТЫ С КОНФИГУРАЦИЕЙ ============
 
+_BLOCK_COLUMNS = ("id", "section_id", "block_type", "name", "order_index", "config", "created_at", "updated_at")
+
+
 def get_university_config(university_id: int, role: str) -> Dict:
-    """Получить конфигурацию университета для роли"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    # Получаем разделы
-    cursor.execute("""
-        SELECT * FROM sections 
-        WHERE university_id = ? AND role = ?
-        ORDER BY order_index ASC
-    """, (university_id, role))
+    """
+    Получить конфигурацию университета для роли.
+    Разделы и их блоки загружаются одним запросом (LEFT JOIN) и собираются в дерево за один проход.
+    """
+    block_select = ", ".join(f"b.{col} AS b_{col}" for col in _BLOCK_COLUMNS)
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT s.*, {block_select}
+            FROM sections s
+            LEFT JOIN blocks b ON b.section_id = s.id
+            WHERE s.university_id = ? AND s.role = ?
+            ORDER BY s.order_index ASC, s.id ASC, b.order_index ASC, b.id ASC
+        """, (university_id, role))
+        rows = cursor.fetchall()
     
     sections = []
-    for section_row in cursor.fetchall():
-        section = dict(section_row)
-        
-        # Получаем блоки раздела
-        cursor.execute("""
-            SELECT * FROM blocks 
-            WHERE section_id = ?
-            ORDER BY order_index ASC
-        """, (section["id"],))
-        
-        section["blocks"] = [dict(row) for row in cursor.fetchall()]
-        sections.append(section)
+    current = None
+    for row in rows:
+        data = dict(row)
+        if current is None or current["id"] != data["id"]:
+            current = {k: v for k, v in data.items() if not k.startswith("b_")}
+            current["blocks"] = []
+            sections.append(current)
+        if data["b_id"] is not None:
+            current["blocks"].append({col: data[f"b_{col}"] for col in _BLOCK_COLUMNS})
     
     # Получаем цвет хедера (из первого раздела или дефолтный)
     header_color = sections[0]["header_color"] if sections else "#0088CC"
     
-    conn.close()
-    
     return {
         "sections": sections,
         "header_color": header_color,
@@ -813,150 +909,182 @@ def get_university_config(university_id: int, role: str) -> Dict:
 
 def update_section_name(section_id: int, name: str):
     """Обновить название раздела"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    cursor = conn.cursor()
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute("""
-        UPDATE sections 
-        SET name = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    """, (name, section_id))
-    
-    conn.commit()
-    conn.close()
+        cursor.execute("""
+            UPDATE sections 
+            SET name = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (name, section_id))
 
 
 def update_header_color(university_id: int, role: str, color: str):
     """Обновить цвет хедера для роли"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    cursor = conn.cursor()
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute("""
-        UPDATE sections 
-        SET header_color = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE university_id = ? AND role = ?
-    """, (color, university_id, role))
-    
-    conn.commit()
-    conn.close()
-
-
-def reorder_blocks(block_ids: List[int]):
-    """Изменить порядок блоков"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    cursor = conn.cursor()
-    
-    for index, block_id in enumerate(block_ids):
         cursor.execute("""
-            UPDATE blocks 
-            SET order_index = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (index, block_id))
-    
-    conn.commit()
-    conn.close()
+            UPDATE sections 
+            SET header_color = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE university_id = ? AND role = ?
+        """, (color, university_id, role))
+
+
+def _update_changed_order(cursor, table: str, positions: Dict[int, int]) -> int:
+    """Записать order_index только тем строкам table, у которых он изменился. Возвращает число обновлённых."""
+    if not positions:
+        return 0
+    ids = list(positions)
+    placeholders = ",".join("?" * len(ids))
+    cursor.execute(f"SELECT id, order_index FROM {table} WHERE id IN ({placeholders})", ids)
+    changed = [(positions[row[0]], row[0]) for row in cursor.fetchall() if row[1] != positions[row[0]]]
+    cursor.executemany(f"""
+        UPDATE {table}
+        SET order_index = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    """, changed)
+    return len(changed)
+
+
+def _move_items(cursor, table: str, group_columns: Tuple[str, ...], moves: List[Tuple[int, int]]) -> int:
+    """
+    Применить перемещения (id, новая позиция) внутри группы (раздел для блоков, вуз+роль для разделов):
+    порядок группы пересчитывается целиком, записываются только изменившиеся строки.
+    """
+    if not moves:
+        return 0
+    columns = ", ".join(group_columns)
+    ids = list({item_id for item_id, _ in moves})
+    placeholders = ",".join("?" * len(ids))
+    cursor.execute(f"SELECT id, {columns} FROM {table} WHERE id IN ({placeholders})", ids)
+    group_of = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    groups: Dict[tuple, List[Tuple[int, int]]] = {}
+    for item_id, position in moves:
+        if item_id in group_of:
+            groups.setdefault(group_of[item_id], []).append((item_id, position))
+    where = " AND ".join(f"{col} = ?" for col in group_columns)
+    updated = 0
+    for key, group_moves in groups.items():
+        cursor.execute(f"SELECT id FROM {table} WHERE {where} ORDER BY order_index ASC, id ASC", key)
+        order = [row[0] for row in cursor.fetchall()]
+        for item_id, position in group_moves:
+            order.remove(item_id)
+            order.insert(max(0, min(position, len(order))), item_id)
+        updated += _update_changed_order(cursor, table, {item_id: i for i, item_id in enumerate(order)})
+    return updated
+
+
+def reorder_blocks(block_ids: List[int]) -> int:
+    """Изменить порядок блоков по полному списку id. Возвращает число блоков, у которых изменился порядок."""
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        return _update_changed_order(conn.cursor(), "blocks", {block_id: i for i, block_id in enumerate(block_ids)})
+
+
+def reorder_sections(section_ids: List[int]) -> int:
+    """Изменить порядок разделов по полному списку id. Возвращает число разделов, у которых изменился порядок."""
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        return _update_changed_order(conn.cursor(), "sections", {section_id: i for i, section_id in enumerate(section_ids)})
+
+
+def move_blocks(moves: List[Tuple[int, int]]) -> int:
+    """Переместить блоки: moves — (block_id, новая позиция в разделе). Возвращает число обновлённых блоков."""
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        return _move_items(conn.cursor(), "blocks", ("section_id",), moves)
+
+
+def move_sections(moves: List[Tuple[int, int]]) -> int:
+    """Переместить разделы: moves — (section_id, новая позиция среди разделов роли). Возвращает число обновлённых."""
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        return _move_items(conn.cursor(), "sections", ("university_id", "role"), moves)
 
 
 def add_block(section_id: int, block_type: str, name: str, order_index: Optional[int] = None):
     """Добавить блок в раздел"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    cursor = conn.cursor()
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    # Если order_index не указан, добавляем в конец
-    if order_index is None:
-        cursor.execute("SELECT MAX(order_index) FROM blocks WHERE section_id = ?", (section_id,))
-        result = cursor.fetchone()
-        order_index = (result[0] + 1) if result[0] is not None else 0
+        # Если order_index не указан, добавляем в конец
+        if order_index is None:
+            cursor.execute("SELECT MAX(order_index) FROM blocks WHERE section_id = ?", (section_id,))
+            result = cursor.fetchone()
+            order_index = (result[0] + 1) if result[0] is not None else 0
     
-    cursor.execute("""
-        INSERT INTO blocks (section_id, block_type, name, order_index)
-        VALUES (?, ?, ?, ?)
-    """, (section_id, block_type, name, order_index))
+        cursor.execute("""
+            INSERT INTO blocks (section_id, block_type, name, order_index)
+            VALUES (?, ?, ?, ?)
+        """, (section_id, block_type, name, order_index))
     
-    block_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+        block_id = cursor.lastrowid
     
     return block_id
 
 
 def delete_block(block_id: int):
     """Удалить блок"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("DELETE FROM blocks WHERE id = ?", (block_id,))
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    conn.commit()
-    conn.close()
+        cursor.execute("DELETE FROM blocks WHERE id = ?", (block_id,))
 
 
 def add_section(university_id: int, role: str, name: str, header_color: str = "#0088CC") -> int:
     """Добавить новый раздел"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    cursor = conn.cursor()
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    # Определяем order_index (добавляем в конец)
-    cursor.execute("""
-        SELECT MAX(order_index) FROM sections 
-        WHERE university_id = ? AND role = ?
-    """, (university_id, role))
-    result = cursor.fetchone()
-    order_index = (result[0] + 1) if result[0] is not None else 0
+        # Определяем order_index (добавляем в конец)
+        cursor.execute("""
+            SELECT MAX(order_index) FROM sections 
+            WHERE university_id = ? AND role = ?
+        """, (university_id, role))
+        result = cursor.fetchone()
+        order_index = (result[0] + 1) if result[0] is not None else 0
     
-    cursor.execute("""
-        INSERT INTO sections (university_id, role, name, order_index, header_color)
-        VALUES (?, ?, ?, ?, ?)
-    """, (university_id, role, name, order_index, header_color))
+        cursor.execute("""
+            INSERT INTO sections (university_id, role, name, order_index, header_color)
+            VALUES (?, ?, ?, ?, ?)
+        """, (university_id, role, name, order_index, header_color))
     
-    section_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+        section_id = cursor.lastrowid
     
     return section_id
 
 
 def delete_section(section_id: int):
     """Удалить раздел (блоки удалятся каскадно)"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    cursor = conn.cursor()
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute("DELETE FROM sections WHERE id = ?", (section_id,))
-    
-    conn.commit()
-    conn.close()
+        cursor.execute("DELETE FROM sections WHERE id = ?", (section_id,))
 
 
 def get_templates(role: Optional[str] = None) -> List[Dict]:
     """Получить шаблоны"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    if role:
-        cursor.execute("SELECT * FROM templates WHERE role = ? ORDER BY created_at DESC", (role,))
-    else:
-        cursor.execute("SELECT * FROM templates ORDER BY created_at DESC")
+        if role:
+            cursor.execute("SELECT * FROM templates WHERE role = ? ORDER BY created_at DESC", (role,))
+        else:
+            cursor.execute("SELECT * FROM templates ORDER BY created_at DESC")
     
-    templates = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+        templates = [dict(row) for row in cursor.fetchall()]
     
     return templates
 
 
 def save_template(name: str, description: str, role: str, config: Dict) -> int:
     """Сохранить шаблон"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    cursor = conn.cursor()
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute("""
-        INSERT INTO templates (name, description, role, config)
-        VALUES (?, ?, ?, ?)
-    """, (name, description, role, json.dumps(config)))
+        cursor.execute("""
+            INSERT INTO templates (name, description, role, config)
+            VALUES (?, ?, ?, ?)
+        """, (name, description, role, json.dumps(config)))
     
-    template_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+        template_id = cursor.lastrowid
     
     return template_id
 
@@ -966,55 +1094,51 @@ def save_template(name: str, description: str, role: str, config: Dict) -> int:
 def submit_custom_block(university_id: int, submitted_by_user_id: int, block_type: str, 
                        name: str, description: str, code: str, config_schema: Dict) -> int:
     """Отправить кастомный блок на модерацию"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    cursor = conn.cursor()
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute("""
-        INSERT INTO custom_blocks 
-        (university_id, submitted_by_user_id, block_type, name, description, code, config_schema, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, 'pending')
-    """, (
-        university_id,
-        submitted_by_user_id,
-        block_type,
-        name,
-        description,
-        code,
-        json.dumps(config_schema)
-    ))
-    
-    block_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+        cursor.execute("""
+            INSERT INTO custom_blocks 
+            (university_id, submitted_by_user_id, block_type, name, description, code, config_schema, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 'pending')
+        """, (
+            university_id,
+            submitted_by_user_id,
+            block_type,
+            name,
+            description,
+            code,
+            json.dumps(config_schema)
+        ))
+    
+        block_id = cursor.lastrowid
     
     return block_id
 
 
 def get_pending_custom_blocks() -> List[Dict]:
     """Получить список кастомных блоков на модерации"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT cb.*, u.first_name, u.last_name, u.username, u.university_id
-        FROM custom_blocks cb
-        LEFT JOIN users u ON cb.submitted_by_user_id = u.id
-        WHERE cb.status = 'pending'
-        ORDER BY cb.created_at ASC
-    """)
-    
-    blocks = []
-    for row in cursor.fetchall():
-        block = dict(row)
-        if block.get("config_schema"):
-            try:
-                block["config_schema"] = json.loads(block["config_schema"])
-            except:
-                block["config_schema"] = {}
-        blocks.append(block)
+        cursor.execute("""
+            SELECT cb.*, u.first_name, u.last_name, u.username, u.university_id
+            FROM custom_blocks cb
+            LEFT JOIN users u ON cb.submitted_by_user_id = u.id
+            WHERE cb.status = 'pending'
+            ORDER BY cb.created_at ASC
+        """)
     
-    conn.close()
+        blocks = []
+        for row in cursor.fetchall():
+            block = dict(row)
+            if block.get("config_schema"):
+                try:
+                    block["config_schema"] = json.loads(block["config_schema"])
+                except:
+                    block["config_schema"] = {}
+            blocks.append(block)
+
     return blocks
 
 
@@ -1023,61 +1147,54 @@ def review_custom_block(block_id: int, reviewed_by_user_id: int, status: str, re
     if status not in ['approved', 'rejected']:
         raise ValueError("Status must be 'approved' or 'rejected'")
     
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        UPDATE custom_blocks 
-        SET status = ?, reviewed_by_user_id = ?, review_notes = ?, reviewed_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    """, (status, reviewed_by_user_id, review_notes, block_id))
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    conn.commit()
-    conn.close()
+        cursor.execute("""
+            UPDATE custom_blocks 
+            SET status = ?, reviewed_by_user_id = ?, review_notes = ?, reviewed_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (status, reviewed_by_user_id, review_notes, block_id))
 
 
 def get_approved_custom_blocks(university_id: Optional[int] = None) -> List[Dict]:
     """Получить одобренные кастомные блоки"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    if university_id:
-        cursor.execute("""
-            SELECT * FROM custom_blocks 
-            WHERE status = 'approved' AND university_id = ?
-            ORDER BY created_at DESC
-        """, (university_id,))
-    else:
-        cursor.execute("""
-            SELECT * FROM custom_blocks 
-            WHERE status = 'approved'
-            ORDER BY created_at DESC
-        """)
-    
-    blocks = []
-    for row in cursor.fetchall():
-        block = dict(row)
-        if block.get("config_schema"):
-            try:
-                block["config_schema"] = json.loads(block["config_schema"])
-            except:
-                block["config_schema"] = {}
-        blocks.append(block)
-    
-    conn.close()
+        if university_id:
+            cursor.execute("""
+                SELECT * FROM custom_blocks 
+                WHERE status = 'approved' AND university_id = ?
+                ORDER BY created_at DESC
+            """, (university_id,))
+        else:
+            cursor.execute("""
+                SELECT * FROM custom_blocks 
+                WHERE status = 'approved'
+                ORDER BY created_at DESC
+            """)
+    
+        blocks = []
+        for row in cursor.fetchall():
+            block = dict(row)
+            if block.get("config_schema"):
+                try:
+                    block["config_schema"] = json.loads(block["config_schema"])
+                except:
+                    block["config_schema"] = {}
+            blocks.append(block)
+
     return blocks
 
 
 def get_custom_block_by_id(block_id: int) -> Optional[Dict]:
     """Получить кастомный блок по ID"""
-    conn = sqlite3.connect(CONFIG_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with sqlite_connection(CONFIG_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM custom_blocks WHERE id = ?", (block_id,))
-    row = cursor.fetchone()
-    conn.close()
+        cursor.execute("SELECT * FROM custom_blocks WHERE id = ?", (block_id,))
+        row = cursor.fetchone()
     
     if row:
         block = dict(row)
@@ -1094,36 +1211,30 @@ def get_custom_block_by_id(block_id: int) -> Optional[Dict]:
 
 def register_for_event(event_id: int, user_id: int) -> bool:
     """Зарегистрировать пользователя на мероприятие"""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute("""
-            INSERT INTO event_registrations (event_id, user_id)
-            VALUES (?, ?)
-        """, (event_id, user_id))
-        conn.commit()
-        conn.close()
-        return True
-    except sqlite3.IntegrityError:
-        # Уже зарегистрирован
-        conn.close()
-        return False
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO event_registrations (event_id, user_id)
+                VALUES (?, ?)
+            """, (event_id, user_id))
+            return True
+        except sqlite3.IntegrityError:
+            # Уже зарегистрирован
+            return False
 
 
 def get_user_event_registrations(user_id: int) -> List[int]:
     """Получить список ID мероприятий, на которые зарегистрирован пользователь"""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT event_id FROM event_registrations
-        WHERE user_id = ?
-    """, (user_id,))
+        cursor.execute("""
+            SELECT event_id FROM event_registrations
+            WHERE user_id = ?
+        """, (user_id,))
     
-    event_ids = [row["event_id"] for row in cursor.fetchall()]
-    conn.close()
+        event_ids = [row["event_id"] for row in cursor.fetchall()]
     
     return event_ids
 
@@ -1135,131 +1246,232 @@ def generate_invitation_code() -> str:
     alphabet = string.ascii_uppercase + string.digits
     return ''.join(secrets.choice(alphabet) for _ in range(8))
 
+_CODE_ALPHABET = (string.ascii_uppercase + string.digits).encode()
+_CODE_LENGTH = 8
+# Байт b < 252 (= 36 * 7) -> символ алфавита b % 36, байты 252..255 отбрасываются: распределение равномерное
+_CODE_BYTE_LIMIT = 256 - 256 % len(_CODE_ALPHABET)
+_CODE_TRANSLATE = bytes(_CODE_ALPHABET[b % len(_CODE_ALPHABET)] for b in range(_CODE_BYTE_LIMIT)) + bytes(256 - _CODE_BYTE_LIMIT)
+_CODE_DROP = bytes(range(_CODE_BYTE_LIMIT, 256))
+
+
+def _generate_invitation_codes(count: int) -> List[str]:
+    """Сгенерировать count кодов разом: один вызов CSPRNG вместо secrets.choice на каждый символ."""
+    need = count * _CODE_LENGTH
+    chars = b""
+    while len(chars) < need:
+        raw = secrets.token_bytes((need - len(chars)) * 17 // 16 + 16)
+        chars += raw.translate(_CODE_TRANSLATE, _CODE_DROP)
+    text = chars[:need].decode("ascii")
+    return [text[i:i + _CODE_LENGTH] for i in range(0, need, _CODE_LENGTH)]
+
+
+def _insert_invitation_codes(cursor, rows: List[Tuple[int, str, Optional[int]]]) -> List[str]:
+    """
+    Вставить коды для строк (university_id, role, generated_by_user_id) пакетно, без проверки каждого кода.
+    Кандидаты уникальны в памяти, уникальность в БД обеспечивает UNIQUE(code) + INSERT OR IGNORE;
+    повторно генерируются только коды, совпавшие с уже существующими. Возвращает коды в порядке rows.
+    """
+    codes: List[Optional[str]] = [None] * len(rows)
+    seen = set()
+    pending = list(range(len(rows)))
+    while pending:
+        candidates = iter(_generate_invitation_codes(len(pending) + 16))
+        for i in pending:
+            code = next(candidates, None) or generate_invitation_code()
+            while code in seen:
+                code = next(candidates, None) or generate_invitation_code()
+            seen.add(code)
+            codes[i] = code
+        # Своя транзакция — единственный писатель, поэтому новые строки — это id > max_id
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM invitation_codes")
+        max_id = cursor.fetchone()[0]
+        cursor.executemany("""
+            INSERT OR IGNORE INTO invitation_codes (code, university_id, role, generated_by_user_id)
+            VALUES (?, ?, ?, ?)
+        """, [(codes[i],) + tuple(rows[i]) for i in pending])
+        if cursor.rowcount == len(pending):
+            break
+        cursor.execute("SELECT code FROM invitation_codes WHERE id > ?", (max_id,))
+        inserted = {row[0] for row in cursor.fetchall()}
+        pending = [i for i in pending if codes[i] not in inserted]
+    return codes
+
+
 def generate_invitation_codes_batch(university_id: int, role: str, generated_by_user_id: int, count: int = 1) -> List[str]:
     """Генерирует пакет кодов приглашения"""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
-    
-    codes = []
-    for _ in range(count):
-        # Генерируем уникальный код
-        while True:
-            code = generate_invitation_code()
-            # Проверяем уникальность
-            cursor.execute("SELECT id FROM invitation_codes WHERE code = ?", (code,))
-            if cursor.fetchone() is None:
-                break
-        
-        # Вставляем код в БД
-        cursor.execute("""
-            INSERT INTO invitation_codes (code, university_id, role, generated_by_user_id)
-            VALUES (?, ?, ?, ?)
-        """, (code, university_id, role, generated_by_user_id))
-        
-        codes.append(code)
-    
-    conn.commit()
-    conn.close()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        codes = _insert_invitation_codes(conn.cursor(), [(university_id, role, generated_by_user_id)] * count)
     
     return codes
 
 def get_invitation_codes_by_university(university_id: int, used: Optional[bool] = None) -> List[Dict]:
     """Получить коды приглашения для университета"""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    if used is None:
-        cursor.execute("""
-            SELECT * FROM invitation_codes
-            WHERE university_id = ?
-            ORDER BY created_at DESC
-        """, (university_id,))
-    elif used:
-        cursor.execute("""
-            SELECT * FROM invitation_codes
-            WHERE university_id = ? AND used_by_user_id IS NOT NULL
-            ORDER BY used_at DESC
-        """, (university_id,))
-    else:
-        cursor.execute("""
-            SELECT * FROM invitation_codes
-            WHERE university_id = ? AND used_by_user_id IS NULL
-            ORDER BY created_at DESC
-        """, (university_id,))
+        if used is None:
+            cursor.execute("""
+                SELECT * FROM invitation_codes
+                WHERE university_id = ?
+                ORDER BY created_at DESC
+            """, (university_id,))
+        elif used:
+            cursor.execute("""
+                SELECT * FROM invitation_codes
+                WHERE university_id = ? AND used_by_user_id IS NOT NULL
+                ORDER BY used_at DESC
+            """, (university_id,))
+        else:
+            cursor.execute("""
+                SELECT * FROM invitation_codes
+                WHERE university_id = ? AND used_by_user_id IS NULL
+                ORDER BY created_at DESC
+            """, (university_id,))
     
-    codes = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+        codes = [dict(row) for row in cursor.fetchall()]
     
     return codes
 
-def use_invitation_code(code: str, user_id: int) -> Optional[Dict]:
-    """Использовать код приглашения"""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+_CODE_LIST_COLUMNS = "id, code, university_id, role, generated_by_user_id, used_by_user_id, used_at, expires_at, created_at"
+
+
+def _encode_codes_cursor(row: Dict, used: Optional[bool]) -> str:
+    # Использованные коды упорядочены по (used_at, id), остальные — по id; used_at бывает NULL у старых строк
+    return f"{row['used_at'] or ''}|{row['id']}" if used else str(row["id"])
+
+
+def _decode_codes_cursor(cursor_value: str, used: Optional[bool]) -> Tuple:
+    try:
+        if used:
+            used_at, last_id = cursor_value.rsplit("|", 1)
+            return used_at, int(last_id)
+        return (int(cursor_value),)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def get_invitation_codes_page(university_id: int, used: Optional[bool] = None, role: Optional[str] = None,
+                              cursor_value: Optional[str] = None, limit: int = 100) -> Dict:
+    """
+    Страница кодов приглашения университета (keyset-пагинация, новые сначала).
+    used=True — использованные по used_at (без used_at — последними), иначе — по id (порядку создания).
+    Возвращает {"codes": [...], "next_cursor": str | None}; next_cursor передаётся в следующий вызов.
+    Каждая страница — спуск по индексу, время не зависит от числа кодов в таблице.
+    """
+    where = ["university_id = ?"]
+    params: List[Any] = [university_id]
+    if role:
+        where.append("role = ?")
+        params.append(role)
+    if used:
+        where.append("used_by_user_id IS NOT NULL")
+        order = "COALESCE(used_at, '') DESC, id DESC"
+        if cursor_value:
+            where.append("(COALESCE(used_at, ''), id) < (?, ?)")
+            params.extend(_decode_codes_cursor(cursor_value, used))
+    else:
+        if used is not None:
+            where.append("used_by_user_id IS NULL")
+        order = "id DESC"
+        if cursor_value:
+            where.append("id < ?")
+            params.extend(_decode_codes_cursor(cursor_value, used))
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT {_CODE_LIST_COLUMNS} FROM invitation_codes
+            WHERE {" AND ".join(where)}
+            ORDER BY {order}
+            LIMIT ?
+        """, params + [limit + 1])
+        codes = [dict(row) for row in cursor.fetchall()]
+    
+    next_cursor = None
+    if len(codes) > limit:
+        codes = codes[:limit]
+        next_cursor = _encode_codes_cursor(codes[-1], used)
+    return {"codes": codes, "next_cursor": next_cursor}
+
+def get_invitation_codes_summary(university_id: int) -> Dict:
+    """Количество кодов университета (всего / использовано / свободно) в целом и по ролям, без самих кодов"""
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT role, COUNT(*), COUNT(used_by_user_id)
+            FROM invitation_codes
+            WHERE university_id = ?
+            GROUP BY role
+        """, (university_id,))
+        rows = cursor.fetchall()
     
-    # Находим код
-    cursor.execute("""
-        SELECT * FROM invitation_codes
+    by_role = {role: {"total": total, "used": used, "unused": total - used} for role, total, used in rows}
+    total = sum(item["total"] for item in by_role.values())
+    used = sum(item["used"] for item in by_role.values())
+    return {"total": total, "used": used, "unused": total - used, "by_role": by_role}
+
+# RETURNING поддерживается с SQLite 3.35; на старых версиях — UPDATE и затем SELECT в той же транзакции
+_SQLITE_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def _claim_invitation_code(cursor, code: str, user_id: int) -> Optional[Dict]:
+    """
+    Занять свободный код одним условным UPDATE. Из нескольких одновременных попыток
+    с одним кодом строку меняет ровно одна; остальные получают None.
+    """
+    claim_sql = """
+        UPDATE invitation_codes
+        SET used_by_user_id = ?, used_at = CURRENT_TIMESTAMP
         WHERE code = ? AND used_by_user_id IS NULL
-    """, (code,))
-    
-    row = cursor.fetchone()
-    if not row:
-        conn.close()
+    """
+    if _SQLITE_RETURNING:
+        cursor.execute(claim_sql + " RETURNING id, code, university_id, role, used_by_user_id, used_at", (user_id, code))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    cursor.execute(claim_sql, (user_id, code))
+    if cursor.rowcount != 1:
         return None
-    
-    code_data = dict(row)
-    
-    # Помечаем код как использованный
     cursor.execute("""
-        UPDATE invitation_codes
-        SET used_by_user_id = ?, used_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    """, (user_id, code_data["id"]))
-    
-    conn.commit()
-    conn.close()
-    
+        SELECT id, code, university_id, role, used_by_user_id, used_at
+        FROM invitation_codes WHERE code = ?
+    """, (code,))
+    return dict(cursor.fetchone())
+
+def use_invitation_code(code: str, user_id: int) -> Optional[Dict]:
+    """Использовать код приглашения"""
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        return _claim_invitation_code(conn.cursor(), code, user_id)
+
+def redeem_invitation_code(code: str, user_id: int, max_user_id: int) -> Optional[Dict]:
+    """
+    Использовать код и привязать пользователя к его вузу и роли за один вызов.
+    Пользователь обновляется до фиксации транзакции с кодом: если обновление не удалось,
+    транзакция откатывается и код остаётся свободным. None — код не найден или уже использован.
+    """
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        code_data = _claim_invitation_code(conn.cursor(), code, user_id)
+        if code_data is not None:
+            update_user_with_invitation_code(
+                max_user_id, code_data["id"], code_data["role"], code_data["university_id"]
+            )
     return code_data
 
 def import_students_and_generate_codes(university_id: int, students: List[Dict], generated_by_user_id: int) -> List[Dict]:
     """Импортировать студентов и сгенерировать для них коды"""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
-    
-    results = []
+    roles = [student.get("role", "student") for student in students]
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        codes = _insert_invitation_codes(
+            conn.cursor(), [(university_id, role, generated_by_user_id) for role in roles]
+        )
     
-    for student in students:
-        student_name = student.get("name", "")
-        student_id = student.get("id", "")
-        role = student.get("role", "student")
-        
-        # Генерируем уникальный код
-        while True:
-            code = generate_invitation_code()
-            cursor.execute("SELECT id FROM invitation_codes WHERE code = ?", (code,))
-            if cursor.fetchone() is None:
-                break
-        
-        # Вставляем код в БД
-        cursor.execute("""
-            INSERT INTO invitation_codes (code, university_id, role, generated_by_user_id)
-            VALUES (?, ?, ?, ?)
-        """, (code, university_id, role, generated_by_user_id))
-        
-        results.append({
-            "student_name": student_name,
-            "student_id": student_id,
+    return [
+        {
+            "student_name": student.get("name", ""),
+            "student_id": student.get("id", ""),
             "role": role,
             "code": code
-        })
-    
-    conn.commit()
-    conn.close()
-    
-    return results
+        }
+        for student, role, code in zip(students, roles, codes)
+    ]
 
 
 # ============ ФУНКЦИИ ДЛЯ РАБОТЫ С ЗАЯВЛЕНИЯМИ АБИТУРИЕНТОВ ============
@@ -1270,39 +1482,57 @@ def get_education_levels() -> List[str]:
 
 def get_admission_directions(university_id: int, education_level: str) -> List[Dict]:
     """Получить направления подготовки для уровня образования"""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT * FROM admission_directions
-        WHERE university_id = ? AND education_level = ?
-        ORDER BY name ASC
-    """, (university_id, education_level))
-    
-    directions = []
-    for row in cursor.fetchall():
-        direction = dict(row)
-        # Парсим JSON поля
-        if direction.get("required_exams"):
-            try:
-                direction["required_exams"] = json.loads(direction["required_exams"])
-            except:
-                direction["required_exams"] = []
-        directions.append(direction)
+        cursor.execute("""
+            SELECT * FROM admission_directions
+            WHERE university_id = ? AND education_level = ?
+            ORDER BY name ASC
+        """, (university_id, education_level))
+    
+        directions = []
+        for row in cursor.fetchall():
+            direction = dict(row)
+            # Парсим JSON поля
+            if direction.get("required_exams"):
+                try:
+                    direction["required_exams"] = json.loads(direction["required_exams"])
+                except:
+                    direction["required_exams"] = []
+            directions.append(direction)
+
+    return directions
+
+def get_all_admission_directions() -> List[Dict]:
+    """Все направления подготовки всех вузов (для каталога в памяти, admission_catalog.py)"""
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM admission_directions
+            ORDER BY university_id, education_level, name ASC
+        """)
     
-    conn.close()
+        directions = []
+        for row in cursor.fetchall():
+            direction = dict(row)
+            # Парсим JSON поля
+            if direction.get("required_exams"):
+                try:
+                    direction["required_exams"] = json.loads(direction["required_exams"])
+                except:
+                    direction["required_exams"] = []
+            directions.append(direction)
+
     return directions
 
 def get_admission_direction(direction_id: int) -> Optional[Dict]:
     """Получить направление подготовки по ID"""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM admission_directions WHERE id = ?", (direction_id,))
-    row = cursor.fetchone()
-    conn.close()
+        cursor.execute("SELECT * FROM admission_directions WHERE id = ?", (direction_id,))
+        row = cursor.fetchone()
     
     if row:
         direction = dict(row)
@@ -1318,112 +1548,165 @@ def create_application(user_id: int, university_id: int, direction_id: int,
                       education_level: str, personal_info: Dict, exam_scores: Dict,
                       application_file_url: Optional[str] = None) -> int:
     """Создать заявление абитуриента"""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute("""
-        INSERT INTO applications 
-        (user_id, university_id, direction_id, education_level, personal_info, exam_scores, application_file_url, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, 'pending')
-    """, (
-        user_id,
-        university_id,
-        direction_id,
-        education_level,
-        json.dumps(personal_info),
-        json.dumps(exam_scores),
-        application_file_url
-    ))
-    
-    application_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+        cursor.execute("""
+            INSERT INTO applications 
+            (user_id, university_id, direction_id, education_level, personal_info, exam_scores, application_file_url, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 'pending')
+        """, (
+            user_id,
+            university_id,
+            direction_id,
+            education_level,
+            json.dumps(personal_info),
+            json.dumps(exam_scores),
+            application_file_url
+        ))
+    
+        application_id = cursor.lastrowid
     
     return application_id
 
 def get_user_applications(user_id: int) -> List[Dict]:
     """Получить заявления пользователя"""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT a.*, d.name as direction_name, d.code as direction_code
-        FROM applications a
-        LEFT JOIN admission_directions d ON a.direction_id = d.id
-        WHERE a.user_id = ?
-        ORDER BY a.created_at DESC
-    """, (user_id,))
-    
-    applications = []
-    for row in cursor.fetchall():
-        app = dict(row)
-        if app.get("personal_info"):
-            try:
-                app["personal_info"] = json.loads(app["personal_info"])
-            except:
-                app["personal_info"] = {}
-        if app.get("exam_scores"):
-            try:
-                app["exam_scores"] = json.loads(app["exam_scores"])
-            except:
-                app["exam_scores"] = {}
-        applications.append(app)
-    
-    conn.close()
+        cursor.execute("""
+            SELECT a.*, d.name as direction_name, d.code as direction_code
+            FROM applications a
+            LEFT JOIN admission_directions d ON a.direction_id = d.id
+            WHERE a.user_id = ?
+            ORDER BY a.created_at DESC
+        """, (user_id,))
+    
+        applications = []
+        for row in cursor.fetchall():
+            app = dict(row)
+            if app.get("personal_info"):
+                try:
+                    app["personal_info"] = json.loads(app["personal_info"])
+                except:
+                    app["personal_info"] = {}
+            if app.get("exam_scores"):
+                try:
+                    app["exam_scores"] = json.loads(app["exam_scores"])
+                except:
+                    app["exam_scores"] = {}
+            applications.append(app)
+
     return applications
 
 def get_pending_applications(university_id: int) -> List[Dict]:
     """Получить заявления на проверку для админов"""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    cursor.execute("""
-        SELECT a.*, d.name as direction_name, d.code as direction_code,
-               u.first_name, u.last_name, u.username
-        FROM applications a
-        LEFT JOIN admission_directions d ON a.direction_id = d.id
-        LEFT JOIN users u ON a.user_id = u.id
-        WHERE a.university_id = ? AND a.status = 'pending'
-        ORDER BY a.created_at ASC
-    """, (university_id,))
-    
-    applications = []
-    for row in cursor.fetchall():
-        app = dict(row)
-        if app.get("personal_info"):
-            try:
-                app["personal_info"] = json.loads(app["personal_info"])
-            except:
-                app["personal_info"] = {}
-        if app.get("exam_scores"):
-            try:
-                app["exam_scores"] = json.loads(app["exam_scores"])
-            except:
-                app["exam_scores"] = {}
-        applications.append(app)
+        cursor.execute("""
+            SELECT a.*, d.name as direction_name, d.code as direction_code,
+                   u.first_name, u.last_name, u.username
+            FROM applications a
+            LEFT JOIN admission_directions d ON a.direction_id = d.id
+            LEFT JOIN users u ON a.user_id = u.id
+            WHERE a.university_id = ? AND a.status = 'pending'
+            ORDER BY a.created_at ASC
+        """, (university_id,))
     
-    conn.close()
+        applications = []
+        for row in cursor.fetchall():
+            app = dict(row)
+            if app.get("personal_info"):
+                try:
+                    app["personal_info"] = json.loads(app["personal_info"])
+                except:
+                    app["personal_info"] = {}
+            if app.get("exam_scores"):
+                try:
+                    app["exam_scores"] = json.loads(app["exam_scores"])
+                except:
+                    app["exam_scores"] = {}
+            applications.append(app)
+
     return applications
 
+_APPLICATION_USER_FIELDS = ("first_name", "last_name", "username")
+
+
+def _decode_json_field(value: Optional[str]) -> Optional[Dict]:
+    if not value:
+        return value
+    try:
+        return json.loads(value)
+    except ValueError:
+        return {}
+
+
+def get_pending_applications_page(university_id: int, cursor_value: Optional[str] = None, limit: int = 50) -> Dict:
+    """
+    Страница очереди заявлений на проверку (старые сначала, keyset-пагинация по (created_at, id)).
+    Данные абитуриентов — одним пакетным запросом к базе пользователей (SQLite users.db или PostgreSQL),
+    JSON-поля разбираются только для строк страницы.
+    Возвращает {"applications": [...], "next_cursor": str | None, "total": число заявлений в очереди}
+    (total считается только для первой страницы, для следующих — None).
+    """
+    where = "a.university_id = ? AND a.status = 'pending'"
+    params: List[Any] = [university_id]
+    if cursor_value:
+        try:
+            created_at, last_id = cursor_value.rsplit("|", 1)
+            params.extend([created_at, int(last_id)])
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        where += " AND (a.created_at, a.id) > (?, ?)"
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT a.*, d.name as direction_name, d.code as direction_code
+            FROM applications a
+            LEFT JOIN admission_directions d ON a.direction_id = d.id
+            WHERE {where}
+            ORDER BY a.created_at ASC, a.id ASC
+            LIMIT ?
+        """, params + [limit + 1])
+        applications = [dict(row) for row in cursor.fetchall()]
+        total = None
+        if not cursor_value:
+            cursor.execute("""
+                SELECT COUNT(*) FROM applications WHERE university_id = ? AND status = 'pending'
+            """, (university_id,))
+            total = cursor.fetchone()[0]
+    
+    next_cursor = None
+    if len(applications) > limit:
+        applications = applications[:limit]
+        last = applications[-1]
+        next_cursor = f"{last['created_at']}|{last['id']}"
+    
+    users = get_users_by_ids([app["user_id"] for app in applications])
+    for app in applications:
+        user = users.get(app["user_id"]) or {}
+        for field in _APPLICATION_USER_FIELDS:
+            app[field] = user.get(field)
+        app["personal_info"] = _decode_json_field(app.get("personal_info"))
+        app["exam_scores"] = _decode_json_field(app.get("exam_scores"))
+    return {"applications": applications, "next_cursor": next_cursor, "total": total}
+
 def review_application(application_id: int, reviewed_by_user_id: int, 
                       status: str, review_notes: Optional[str] = None):
     """Проверить заявление (принять/отклонить)"""
     if status not in ['approved', 'rejected']:
         raise ValueError("Status must be 'approved' or 'rejected'")
     
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        UPDATE applications
-        SET status = ?, reviewed_by_user_id = ?, review_notes = ?, reviewed_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    """, (status, reviewed_by_user_id, review_notes, application_id))
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
     
-    conn.commit()
-    conn.close()
+        cursor.execute("""
+            UPDATE applications
+            SET status = ?, reviewed_by_user_id = ?, review_notes = ?, reviewed_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (status, reviewed_by_user_id, review_notes, application_id))
 
 
 # ============ STORIES ============
@@ -1432,146 +1715,224 @@ def create_story(author_id: int, university_id: int, slides: List[Dict], status:
     """Создать историю и слайды. Возвращает story id."""
     from datetime import timedelta
     expires_at = (datetime.utcnow() + timedelta(hours=24)).strftime("%Y-%m-%d %H:%M:%S")
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO stories (author_id, university_id, status, expires_at, slide_count)
-        VALUES (?, ?, ?, ?, ?)
-    """, (author_id, university_id, status, expires_at, len(slides)))
-    story_id = cursor.lastrowid
-    for i, s in enumerate(slides):
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cover_url = (slides[0].get("media_url") or None) if slides else None
         cursor.execute("""
-            INSERT INTO story_slides (story_id, position, type, media_url, text, duration_sec)
+            INSERT INTO stories (author_id, university_id, status, expires_at, slide_count, cover_url)
             VALUES (?, ?, ?, ?, ?, ?)
-        """, (story_id, i, s.get("type", "text"), s.get("media_url"), s.get("text"), s.get("duration_sec")))
-    conn.commit()
-    conn.close()
+        """, (author_id, university_id, status, expires_at, len(slides), cover_url))
+        story_id = cursor.lastrowid
+        for i, s in enumerate(slides):
+            cursor.execute("""
+                INSERT INTO story_slides (story_id, position, type, media_url, text, duration_sec)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (story_id, i, s.get("type", "text"), s.get("media_url"), s.get("text"), s.get("duration_sec")))
+
     return story_id
 
 
+def update_story_slide_media_url(story_id: int, position: int, media_url: str):
+    """Обновить media_url слайда (после переноса файла из _pending в каталог истории)."""
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        conn.execute("UPDATE story_slides SET media_url = ? WHERE story_id = ? AND position = ?",
+                     (media_url, story_id, position))
+        if position == 0:
+            conn.execute("UPDATE stories SET cover_url = ? WHERE id = ?", (media_url, story_id))
+
+
+def attach_story_slide_blob(story_id: int, position: int, sha256: str, ext: str, size: int, media_url: str):
+    """Привязать слайд к файлу хранилища (ref_count + 1) и обновить его media_url — одной транзакцией."""
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        conn.execute("""
+            INSERT INTO story_media_blobs (sha256, ext, size, ref_count) VALUES (?, ?, ?, 1)
+            ON CONFLICT(sha256) DO UPDATE SET ref_count = ref_count + 1
+        """, (sha256, ext, size))
+        conn.execute("UPDATE story_slides SET media_url = ?, blob_sha256 = ? WHERE story_id = ? AND position = ?",
+                     (media_url, sha256, story_id, position))
+        if position == 0:
+            conn.execute("UPDATE stories SET cover_url = ? WHERE id = ?", (media_url, story_id))
+
+
+def attach_story_slide_existing_blob(story_id: int, position: int, sha256: str, media_url: str) -> bool:
+    """
+    Привязать слайд к файлу, который уже есть в хранилище (media_url другой истории): ref_count + 1.
+    False — файла больше нет (ref_count дошёл до нуля, его удалит или уже удалил collect()).
+    """
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.execute(
+            "UPDATE story_media_blobs SET ref_count = ref_count + 1 WHERE sha256 = ? AND ref_count > 0", (sha256,)
+        )
+        if cursor.rowcount == 0:
+            return False
+        conn.execute("UPDATE story_slides SET media_url = ?, blob_sha256 = ? WHERE story_id = ? AND position = ?",
+                     (media_url, sha256, story_id, position))
+        if position == 0:
+            conn.execute("UPDATE stories SET cover_url = ? WHERE id = ?", (media_url, story_id))
+    return True
+
+
+def _release_story_blobs(cursor, story_ids_sql: str, params: tuple = ()):
+    """Уменьшить ref_count файлов слайдов удаляемых историй (story_ids_sql — подзапрос со списком id)."""
+    cursor.execute(f"""
+        UPDATE story_media_blobs SET ref_count = ref_count - (
+            SELECT COUNT(*) FROM story_slides sl
+            WHERE sl.blob_sha256 = story_media_blobs.sha256 AND sl.story_id IN ({story_ids_sql})
+        )
+        WHERE sha256 IN (SELECT blob_sha256 FROM story_slides WHERE story_id IN ({story_ids_sql}))
+    """, params + params)
+
+
+def delete_unreferenced_story_blobs(limit: int = 500) -> List[Tuple[str, str, int]]:
+    """
+    Удалить записи файлов, на которые не ссылается ни один слайд.
+    Возвращает (sha256, ext, size) — их файлы нужно удалить с диска.
+    """
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        rows = conn.execute(
+            "SELECT sha256, ext, size FROM story_media_blobs WHERE ref_count <= 0 LIMIT ?", (limit,)
+        ).fetchall()
+        blobs = [(row[0], row[1], row[2]) for row in rows]
+        conn.executemany("DELETE FROM story_media_blobs WHERE sha256 = ? AND ref_count <= 0",
+                         [(sha,) for sha, _, _ in blobs])
+    return blobs
+
+
 def get_story(story_id: int, include_expired: bool = False) -> Optional[Dict]:
     """Получить историю по id со слайдами. Если include_expired=False, истёкшие не возвращаются."""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    if include_expired:
-        cursor.execute("SELECT * FROM stories WHERE id = ?", (story_id,))
-    else:
-        cursor.execute("SELECT * FROM stories WHERE id = ? AND expires_at > datetime('now') AND status = 'published'", (story_id,))
-    row = cursor.fetchone()
-    if not row:
-        conn.close()
-        return None
-    story = dict(row)
-    cursor.execute("SELECT * FROM story_slides WHERE story_id = ? ORDER BY position", (story_id,))
-    story["slides"] = [dict(r) for r in cursor.fetchall()]
-    conn.close()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        if include_expired:
+            cursor.execute("SELECT * FROM stories WHERE id = ?", (story_id,))
+        else:
+            cursor.execute("SELECT * FROM stories WHERE id = ? AND expires_at > datetime('now') AND status = 'published'", (story_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        story = dict(row)
+        cursor.execute("SELECT * FROM story_slides WHERE story_id = ? ORDER BY position", (story_id,))
+        story["slides"] = [dict(r) for r in cursor.fetchall()]
+
     return story
 
 
-def get_stories_feed(university_id: Optional[int], limit: int = 50, offset: int = 0) -> List[Dict]:
-    """Лента историй: сначала своего вуза, потом по дате. Возвращает список без слайдов (только превью)."""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT s.* FROM stories s
-        WHERE s.expires_at > datetime('now') AND s.status = 'published'
-        ORDER BY CASE WHEN s.university_id = ? THEN 0 ELSE 1 END, s.created_at DESC
-        LIMIT ? OFFSET ?
-    """, (university_id or 0, limit, offset))
-    rows = cursor.fetchall()
-    stories = []
-    for row in rows:
-        s = dict(row)
-        cursor.execute("SELECT media_url, type FROM story_slides WHERE story_id = ? ORDER BY position LIMIT 1", (s["id"],))
-        first = cursor.fetchone()
-        s["cover_url"] = first["media_url"] if first and first["media_url"] else None
-        stories.append(s)
-    conn.close()
+def get_stories_feed(university_id: Optional[int], limit: int = 50, offset: int = 0,
+                     viewer_id: Optional[int] = None) -> List[Dict]:
+    """
+    Лента историй: сначала своего вуза, потом по дате. Возвращает список без слайдов (только превью).
+    Обложка и число реакций хранятся в stories; user_reacted (для viewer_id — internal user id)
+    считается в том же запросе, без отдельного запроса на каждую историю.
+    """
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT s.*,
+                   EXISTS(SELECT 1 FROM story_reactions ur
+                          WHERE ur.story_id = s.id AND ur.user_id = ?) AS user_reacted
+            FROM stories s
+            WHERE s.expires_at > datetime('now') AND s.status = 'published'
+            ORDER BY CASE WHEN s.university_id = ? THEN 0 ELSE 1 END, s.created_at DESC
+            LIMIT ? OFFSET ?
+        """, (viewer_id, university_id or 0, limit, offset))
+        stories = []
+        for row in cursor.fetchall():
+            s = dict(row)
+            s["cover_url"] = s["cover_url"] or None
+            s["user_reacted"] = bool(s["user_reacted"])
+            stories.append(s)
+
     return stories
 
 
 def record_story_view(story_id: int, user_id: int, slide_reached: Optional[int] = None) -> bool:
     """Записать просмотр. user_id — internal user id. Возвращает True если запись добавлена."""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
     try:
-        cursor.execute("INSERT OR IGNORE INTO story_views (story_id, user_id, slide_reached) VALUES (?, ?, ?)",
-                       (story_id, user_id, slide_reached))
-        inserted = cursor.rowcount > 0
-        if inserted:
-            cursor.execute("UPDATE stories SET view_count = view_count + 1 WHERE id = ?", (story_id,))
-        conn.commit()
+        with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT OR IGNORE INTO story_views (story_id, user_id, slide_reached) VALUES (?, ?, ?)",
+                           (story_id, user_id, slide_reached))
+            inserted = cursor.rowcount > 0
+            if inserted:
+                cursor.execute("UPDATE stories SET view_count = view_count + 1 WHERE id = ?", (story_id,))
         return inserted
     except Exception:
-        conn.rollback()
         return False
-    finally:
-        conn.close()
+
+
+def record_story_views_batch(views: List[Tuple[int, int, Optional[int]]]) -> int:
+    """
+    Записать пачку просмотров (story_id, user_id, slide_reached) одной транзакцией.
+    Повторные пары и просмотры удалённых историй игнорируются; view_count увеличивается только на новые просмотры.
+    Возвращает число добавленных записей.
+    """
+    if not views:
+        return 0
+    added: Dict[int, int] = {}
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        for story_id, user_id, slide_reached in views:
+            # История могла быть удалена, пока просмотр лежал в буфере
+            cursor.execute("""
+                INSERT OR IGNORE INTO story_views (story_id, user_id, slide_reached)
+                SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM stories WHERE id = ?)
+            """, (story_id, user_id, slide_reached, story_id))
+            if cursor.rowcount > 0:
+                added[story_id] = added.get(story_id, 0) + 1
+        cursor.executemany("UPDATE stories SET view_count = view_count + ? WHERE id = ?",
+                           [(count, story_id) for story_id, count in added.items()])
+    return sum(added.values())
 
 
 def get_my_stories(author_id: int) -> List[Dict]:
     """Истории текущего пользователя (для профиля). author_id — internal user id."""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT * FROM stories WHERE author_id = ? AND expires_at > datetime('now')
-        ORDER BY created_at DESC
-    """, (author_id,))
-    rows = cursor.fetchall()
-    stories = []
-    for row in rows:
-        s = dict(row)
-        cursor.execute("SELECT media_url FROM story_slides WHERE story_id = ? ORDER BY position LIMIT 1", (s["id"],))
-        first = cursor.fetchone()
-        s["cover_url"] = first["media_url"] if first and first["media_url"] else None
-        stories.append(s)
-    conn.close()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM stories WHERE author_id = ? AND expires_at > datetime('now')
+            ORDER BY created_at DESC
+        """, (author_id,))
+        stories = [dict(row) for row in cursor.fetchall()]
+
     return stories
 
 
 def delete_story(story_id: int, author_id: int) -> bool:
     """Удалить историю (только автор). Возвращает True если удалено."""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM stories WHERE id = ? AND author_id = ?", (story_id, author_id))
-    if not cursor.fetchone():
-        conn.close()
-        return False
-    cursor.execute("DELETE FROM story_reactions WHERE story_id = ?", (story_id,))
-    cursor.execute("DELETE FROM story_views WHERE story_id = ?", (story_id,))
-    cursor.execute("DELETE FROM story_slides WHERE story_id = ?", (story_id,))
-    cursor.execute("DELETE FROM stories WHERE id = ?", (story_id,))
-    conn.commit()
-    conn.close()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM stories WHERE id = ? AND author_id = ?", (story_id, author_id))
+        if not cursor.fetchone():
+            return False
+        _release_story_blobs(cursor, "?", (story_id,))
+        cursor.execute("DELETE FROM story_reactions WHERE story_id = ?", (story_id,))
+        cursor.execute("DELETE FROM story_views WHERE story_id = ?", (story_id,))
+        cursor.execute("DELETE FROM story_slides WHERE story_id = ?", (story_id,))
+        cursor.execute("DELETE FROM stories WHERE id = ?", (story_id,))
+
     return True
 
 
 def get_story_reaction_count(story_id: int) -> int:
     """Количество реакций на историю."""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM story_reactions WHERE story_id = ?", (story_id,))
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        row = conn.execute("SELECT reaction_count FROM stories WHERE id = ?", (story_id,)).fetchone()
+
+    return row[0] if row else 0
 
 
 def get_story_reaction_counts(story_ids: List[int]) -> Dict[int, int]:
     """Словарь story_id -> количество реакций для списка историй."""
     if not story_ids:
         return {}
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
-    placeholders = ",".join("?" * len(story_ids))
-    cursor.execute(
-        f"SELECT story_id, COUNT(*) FROM story_reactions WHERE story_id IN ({placeholders}) GROUP BY story_id",
-        story_ids,
-    )
-    out = {row[0]: row[1] for row in cursor.fetchall()}
-    conn.close()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        placeholders = ",".join("?" * len(story_ids))
+        cursor.execute(
+            f"SELECT id, reaction_count FROM stories WHERE id IN ({placeholders}) AND reaction_count > 0",
+            story_ids,
+        )
+        out = {row[0]: row[1] for row in cursor.fetchall()}
+
     return out
 
 
@@ -1579,37 +1940,96 @@ def get_user_reacted_story_ids(user_id: int, story_ids: List[int]) -> set:
     """Множество story_id, на которые поставил реакцию пользователь."""
     if not story_ids:
         return set()
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
-    placeholders = ",".join("?" * len(story_ids))
-    cursor.execute(
-        f"SELECT story_id FROM story_reactions WHERE user_id = ? AND story_id IN ({placeholders})",
-        [user_id] + list(story_ids),
-    )
-    out = {row[0] for row in cursor.fetchall()}
-    conn.close()
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        placeholders = ",".join("?" * len(story_ids))
+        cursor.execute(
+            f"SELECT story_id FROM story_reactions WHERE user_id = ? AND story_id IN ({placeholders})",
+            [user_id] + list(story_ids),
+        )
+        out = {row[0] for row in cursor.fetchall()}
+
     return out
 
 
 def toggle_story_reaction(story_id: int, user_id: int) -> tuple:
     """Переключить реакцию пользователя на историю. Возвращает (added: bool, new_count: int)."""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM story_reactions WHERE story_id = ? AND user_id = ?", (story_id, user_id))
-    exists = cursor.fetchone()
-    if exists:
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
         cursor.execute("DELETE FROM story_reactions WHERE story_id = ? AND user_id = ?", (story_id, user_id))
-        added = False
-    else:
-        cursor.execute("INSERT INTO story_reactions (story_id, user_id) VALUES (?, ?)", (story_id, user_id))
-        added = True
-    cursor.execute("SELECT COUNT(*) FROM story_reactions WHERE story_id = ?", (story_id,))
-    new_count = cursor.fetchone()[0]
-    conn.commit()
-    conn.close()
+        added = cursor.rowcount == 0
+        if added:
+            cursor.execute("INSERT INTO story_reactions (story_id, user_id) VALUES (?, ?)", (story_id, user_id))
+        cursor.execute("UPDATE stories SET reaction_count = MAX(reaction_count + ?, 0) WHERE id = ?",
+                       (1 if added else -1, story_id))
+        cursor.execute("SELECT reaction_count FROM stories WHERE id = ?", (story_id,))
+        row = cursor.fetchone()
+        new_count = row[0] if row else 0
+
     return (added, new_count)
 
 
+def update_story_slide_previews(story_id: int, position: int, thumb_url: Optional[str],
+                                poster_url: Optional[str] = None):
+    """Сохранить превью слайда, построенные фоновым конвейером медиа (story_media)."""
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        conn.execute("UPDATE story_slides SET thumb_url = ?, poster_url = ? WHERE story_id = ? AND position = ?",
+                     (thumb_url, poster_url, story_id, position))
+        if position == 0:
+            conn.execute("UPDATE stories SET thumb_url = ? WHERE id = ?", (thumb_url, story_id))
+
+
+def reconcile_story_counters() -> Dict[str, int]:
+    """
+    Пересчитать денормализованные поля stories (cover_url, thumb_url, reaction_count, view_count)
+    по story_slides / story_reactions / story_views, а также ref_count файлов story_media_blobs.
+    Возвращает число исправленных строк по полям.
+    """
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        fixed = {}
+        cursor.execute("""
+            UPDATE stories SET cover_url = (
+                SELECT sl.media_url FROM story_slides sl WHERE sl.story_id = stories.id ORDER BY sl.position LIMIT 1
+            )
+            WHERE cover_url IS NOT (
+                SELECT sl.media_url FROM story_slides sl WHERE sl.story_id = stories.id ORDER BY sl.position LIMIT 1
+            )
+        """)
+        fixed["cover_url"] = cursor.rowcount
+        cursor.execute("""
+            UPDATE stories SET thumb_url = (
+                SELECT sl.thumb_url FROM story_slides sl WHERE sl.story_id = stories.id ORDER BY sl.position LIMIT 1
+            )
+            WHERE thumb_url IS NOT (
+                SELECT sl.thumb_url FROM story_slides sl WHERE sl.story_id = stories.id ORDER BY sl.position LIMIT 1
+            )
+        """)
+        fixed["thumb_url"] = cursor.rowcount
+        cursor.execute("""
+            UPDATE stories SET reaction_count = (
+                SELECT COUNT(*) FROM story_reactions r WHERE r.story_id = stories.id
+            )
+            WHERE reaction_count != (SELECT COUNT(*) FROM story_reactions r WHERE r.story_id = stories.id)
+        """)
+        fixed["reaction_count"] = cursor.rowcount
+        cursor.execute("""
+            UPDATE stories SET view_count = (
+                SELECT COUNT(*) FROM story_views v WHERE v.story_id = stories.id
+            )
+            WHERE COALESCE(view_count, 0) != (SELECT COUNT(*) FROM story_views v WHERE v.story_id = stories.id)
+        """)
+        fixed["view_count"] = cursor.rowcount
+        cursor.execute("""
+            UPDATE story_media_blobs SET ref_count = (
+                SELECT COUNT(*) FROM story_slides sl WHERE sl.blob_sha256 = story_media_blobs.sha256
+            )
+            WHERE ref_count != (SELECT COUNT(*) FROM story_slides sl WHERE sl.blob_sha256 = story_media_blobs.sha256)
+        """)
+        fixed["blob_ref_count"] = cursor.rowcount
+    return fixed
+
+
 def get_story_media_relative_path(media_url: str) -> Optional[str]:
     """Проверить, что media_url безопасный (в рамках stories). Возвращает относительный путь для файла."""
     if not media_url or ".." in media_url or media_url.startswith("/") or "\\" in media_url:
@@ -1619,17 +2039,38 @@ def get_story_media_relative_path(media_url: str) -> Optional[str]:
     return media_url.replace("\\", "/")
 
 
-def delete_expired_stories() -> List[int]:
-    """Удалить истёкшие истории (expires_at < now) и их слайды/просмотры. Возвращает список удалённых story_id."""
-    conn = sqlite3.connect(UNIVERSITIES_DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM stories WHERE expires_at < datetime('now')")
-    ids = [row[0] for row in cursor.fetchall()]
-    for story_id in ids:
-        cursor.execute("DELETE FROM story_reactions WHERE story_id = ?", (story_id,))
-        cursor.execute("DELETE FROM story_views WHERE story_id = ?", (story_id,))
-        cursor.execute("DELETE FROM story_slides WHERE story_id = ?", (story_id,))
-        cursor.execute("DELETE FROM stories WHERE id = ?", (story_id,))
-    conn.commit()
-    conn.close()
-    return ids
+def delete_expired_stories_chunk(limit: int = 500) -> Tuple[List[int], int]:
+    """
+    Удалить до limit истёкших историй (expires_at < now) вместе со слайдами, просмотрами и реакциями.
+    Удаление — по одному DELETE на таблицу для всей пачки (id пачки во временной таблице).
+    Возвращает (список удалённых story_id, общее число удалённых строк).
+    """
+    with sqlite_connection(UNIVERSITIES_DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS expired_story_ids (id INTEGER PRIMARY KEY)")
+        cursor.execute("DELETE FROM temp.expired_story_ids")
+        cursor.execute("""
+            INSERT INTO temp.expired_story_ids (id)
+            SELECT id FROM stories WHERE expires_at < datetime('now') ORDER BY id LIMIT ?
+        """, (limit,))
+        ids = [row[0] for row in cursor.execute("SELECT id FROM temp.expired_story_ids ORDER BY id").fetchall()]
+        rows = 0
+        if ids:
+            _release_story_blobs(cursor, "SELECT id FROM temp.expired_story_ids")
+            for table, column in (("story_reactions", "story_id"), ("story_views", "story_id"),
+                                  ("story_slides", "story_id"), ("stories", "id")):
+                cursor.execute(f"DELETE FROM {table} WHERE {column} IN (SELECT id FROM temp.expired_story_ids)")
+                rows += cursor.rowcount
+        cursor.execute("DELETE FROM temp.expired_story_ids")
+
+    return ids, rows
+
+
+def delete_expired_stories(chunk_size: int = 500) -> List[int]:
+    """Удалить все истёкшие истории (пачками по chunk_size). Возвращает список удалённых story_id."""
+    ids: List[int] = []
+    while True:
+        chunk, _ = delete_expired_stories_chunk(chunk_size)
+        ids.extend(chunk)
+        if len(chunk) < chunk_size:
+            return ids
@@ -0,0 +1,379 @@
+"""
+Пул соединений с базами данных.
+
+- SQLite: одно постоянное соединение на поток и файл БД (sqlite3-соединение нельзя
+  делить между потоками), с ограничением времени жизни и периодической проверкой.
+- PostgreSQL: ограниченный пул psycopg2-соединений с ожиданием свободного соединения,
+  health check перед выдачей, max lifetime и метриками (размер, ожидание).
+
+Настройки через переменные окружения:
+  DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE   — границы пула PostgreSQL (по умолчанию 1 и 10)
+  DB_POOL_TIMEOUT                      — сколько секунд ждать свободное соединение (10)
+  DB_CONN_MAX_LIFETIME                 — время жизни соединения в секундах (1800)
+  DB_HEALTH_CHECK_INTERVAL             — проверять соединение, простоявшее дольше N секунд (30)
+  SQLITE_BUSY_TIMEOUT                  — сколько секунд SQLite ждёт снятия блокировки (5)
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+POOL_MIN_SIZE = int(_env_float("DB_POOL_MIN_SIZE", 1))
+POOL_MAX_SIZE = int(_env_float("DB_POOL_MAX_SIZE", 10))
+POOL_TIMEOUT = _env_float("DB_POOL_TIMEOUT", 10.0)
+CONN_MAX_LIFETIME = _env_float("DB_CONN_MAX_LIFETIME", 1800.0)
+HEALTH_CHECK_INTERVAL = _env_float("DB_HEALTH_CHECK_INTERVAL", 30.0)
+SQLITE_BUSY_TIMEOUT = _env_float("SQLITE_BUSY_TIMEOUT", 5.0)
+
+
+class PoolTimeout(Exception):
+    """Не удалось получить соединение из пула за DB_POOL_TIMEOUT секунд."""
+
+
+# ============ SQLITE ============
+
+class _SQLiteEntry:
+    __slots__ = ("conn", "created_at", "last_used", "depth")
+
+    def __init__(self, conn: sqlite3.Connection):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+        self.depth = 0
+
+
+class SQLitePool:
+    """Постоянные соединения SQLite: по одному на (поток, файл БД)."""
+
+    def __init__(self, max_lifetime: float = CONN_MAX_LIFETIME,
+                 health_check_interval: float = HEALTH_CHECK_INTERVAL):
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: List[_SQLiteEntry] = []
+        self._stats = {"opened": 0, "closed": 0, "checkouts": 0, "health_check_failures": 0}
+
+    def _entries(self) -> Dict[str, _SQLiteEntry]:
+        entries = getattr(self._local, "entries", None)
+        if entries is None:
+            entries = {}
+            self._local.entries = entries
+        return entries
+
+    def _open(self, path: str) -> _SQLiteEntry:
+        # check_same_thread=False только чтобы close_all() мог закрыть соединение из
+        # другого потока; в работе соединение используется лишь своим потоком.
+        conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.DatabaseError:
+            pass
+        entry = _SQLiteEntry(conn)
+        with self._lock:
+            self._all.append(entry)
+            self._stats["opened"] += 1
+        return entry
+
+    def _discard(self, entry: _SQLiteEntry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            if entry in self._all:
+                self._all.remove(entry)
+            self._stats["closed"] += 1
+
+    def _is_healthy(self, entry: _SQLiteEntry) -> bool:
+        try:
+            entry.conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            with self._lock:
+                self._stats["health_check_failures"] += 1
+            return False
+
+    def _acquire(self, path: str) -> _SQLiteEntry:
+        entries = self._entries()
+        entry = entries.get(path)
+        now = time.monotonic()
+        if entry is not None and entry.depth == 0:
+            expired = self.max_lifetime > 0 and now - entry.created_at > self.max_lifetime
+            stale = now - entry.last_used > self.health_check_interval
+            if expired or (stale and not self._is_healthy(entry)):
+                self._discard(entry)
+                entry = None
+        if entry is None:
+            entry = self._open(path)
+            entries[path] = entry
+        entry.last_used = now
+        with self._lock:
+            self._stats["checkouts"] += 1
+        return entry
+
+    @contextmanager
+    def connection(self, path: str):
+        """
+        Соединение с файлом БД для текущего потока.
+        На выходе — commit (или rollback при исключении); вложенные вызовы
+        используют то же соединение, фиксирует транзакцию только внешний.
+        """
+        entry = self._acquire(path)
+        entry.depth += 1
+        try:
+            yield entry.conn
+        except BaseException:
+            entry.depth -= 1
+            if entry.depth == 0:
+                try:
+                    entry.conn.rollback()
+                except sqlite3.Error:
+                    self._discard(entry)
+                    self._entries().pop(path, None)
+            raise
+        else:
+            entry.depth -= 1
+            if entry.depth == 0:
+                entry.conn.commit()
+
+    def close_all(self):
+        """Закрыть все соединения (при остановке приложения)."""
+        with self._lock:
+            entries = list(self._all)
+        for entry in entries:
+            self._discard(entry)
+        self._local = threading.local()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["open_connections"] = len(self._all)
+        return out
+
+
+# ============ POSTGRESQL ============
+
+class _PGEntry:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class PGPool:
+    """Ограниченный пул соединений psycopg2 с ожиданием, health check и max lifetime."""
+
+    def __init__(self, dsn: str, min_size: int = POOL_MIN_SIZE, max_size: int = POOL_MAX_SIZE,
+                 timeout: float = POOL_TIMEOUT, max_lifetime: float = CONN_MAX_LIFETIME,
+                 health_check_interval: float = HEALTH_CHECK_INTERVAL):
+        if psycopg2 is None:
+            raise RuntimeError("psycopg2 is not installed")
+        self.dsn = dsn
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self._cond = threading.Condition()
+        self._idle: List[_PGEntry] = []
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+        self._stats = {
+            "opened": 0, "closed": 0, "checkouts": 0, "waits": 0, "timeouts": 0,
+            "wait_time_total": 0.0, "wait_time_max": 0.0, "health_check_failures": 0,
+        }
+        for _ in range(self.min_size):
+            try:
+                entry = self._open()
+            except Exception:
+                break
+            with self._cond:
+                self._size += 1
+                self._idle.append(entry)
+
+    def _open(self) -> _PGEntry:
+        conn = psycopg2.connect(self.dsn)
+        with self._cond:
+            self._stats["opened"] += 1
+        return _PGEntry(conn)
+
+    def _close_entry(self, entry: _PGEntry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats["closed"] += 1
+
+    def _is_usable(self, entry: _PGEntry) -> bool:
+        now = time.monotonic()
+        if entry.conn.closed:
+            return False
+        if self.max_lifetime > 0 and now - entry.created_at > self.max_lifetime:
+            return False
+        if now - entry.last_used > self.health_check_interval:
+            try:
+                cur = entry.conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                entry.conn.rollback()
+            except Exception:
+                with self._cond:
+                    self._stats["health_check_failures"] += 1
+                return False
+        return True
+
+    def _checkout(self) -> _PGEntry:
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(f"No free PostgreSQL connection in {self.timeout:.1f}s")
+                    waited = True
+                    self._cond.wait(remaining)
+                entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    self._size += 1
+                self._in_use += 1
+            if entry is None:
+                try:
+                    entry = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_usable(entry):
+                self._close_entry(entry)
+                with self._cond:
+                    self._size -= 1
+                    self._in_use -= 1
+                continue
+            wait = time.monotonic() - start
+            with self._cond:
+                self._stats["checkouts"] += 1
+                if waited:
+                    self._stats["waits"] += 1
+                self._stats["wait_time_total"] += wait
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait)
+            return entry
+
+    def _checkin(self, entry: _PGEntry, broken: bool = False):
+        entry.last_used = time.monotonic()
+        if broken or entry.conn.closed or self._closed:
+            self._close_entry(entry)
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Взять соединение из пула: commit на выходе, rollback при исключении."""
+        entry = self._checkout()
+        broken = False
+        try:
+            yield entry.conn
+            entry.conn.commit()
+        except BaseException:
+            try:
+                entry.conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self._checkin(entry, broken=broken)
+
+    def close_all(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._close_entry(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            out = dict(self._stats)
+            out.update({
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "max_size": self.max_size,
+            })
+        checkouts = out["checkouts"] or 1
+        out["wait_time_avg"] = out["wait_time_total"] / checkouts
+        return out
+
+
+# ============ ГЛОБАЛЬНЫЕ ПУЛЫ ============
+
+sqlite_pool = SQLitePool()
+_pg_pool: Optional[PGPool] = None
+_pg_lock = threading.Lock()
+
+
+def get_pg_pool(dsn: str) -> PGPool:
+    """Ленивая инициализация пула PostgreSQL (DATABASE_URL может подгрузиться позже импорта)."""
+    global _pg_pool
+    if _pg_pool is None or _pg_pool.dsn != dsn:
+        with _pg_lock:
+            if _pg_pool is None or _pg_pool.dsn != dsn:
+                if _pg_pool is not None:
+                    _pg_pool.close_all()
+                _pg_pool = PGPool(dsn)
+    return _pg_pool
+
+
+def close_all():
+    """Закрыть все пулы."""
+    global _pg_pool
+    sqlite_pool.close_all()
+    with _pg_lock:
+        if _pg_pool is not None:
+            _pg_pool.close_all()
+            _pg_pool = None
+
+
+def stats() -> Dict[str, Any]:
+    """Метрики пулов для /api/metrics."""
+    return {
+        "sqlite": sqlite_pool.stats(),
+        "postgres": _pg_pool.stats() if _pg_pool is not None else None,
+    }
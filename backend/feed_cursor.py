@@ -0,0 +1,124 @@
+"""
+Постраничная лента хаба по курсору (GET /api/hub/feed?cursor=...).
+
+Лента — слияние двух потоков, упорядоченных от новых к старым по (date, id):
+посты cold_news и локальные объявления (моковые новости). Страница собирается лениво:
+посты сервиса запрашиваются порциями, пока после фильтра исключённого источника не наберётся
+ровно limit элементов (или оба потока не закончатся).
+
+Курсор — непрозрачная строка (base64url от «date|id|offset»): ключ последнего отданного поста
+и сколько постов сервиса уже прочитано. Следующая страница запрашивает у cold_news посты
+старше ключа (параметр before), поэтому глубокая страница стоит столько же, сколько первая.
+offset нужен только для cold_news без поддержки before — тогда чтение продолжается по смещению,
+а уже отданные посты отбрасываются по ключу.
+"""
+import base64
+import binascii
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# (время поста, id) — порядок ленты: больше — новее
+PostKey = Tuple[datetime, str]
+# (ключ, после которого читать, или None; сколько постов сервиса уже прочитано; сколько нужно)
+#   -> {"posts": [...], "total": N}
+UpstreamFetcher = Callable[[Optional[PostKey], int, int], Awaitable[Dict[str, Any]]]
+
+_EPOCH = datetime.fromtimestamp(0, timezone.utc)
+# Меньше этого посты у cold_news не запрашиваются: часть порции может отсеяться фильтром
+MIN_CHUNK = 20
+
+
+def _parse_date(value: Any) -> datetime:
+    if not value:
+        return _EPOCH
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return _EPOCH
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def post_key(post: Dict[str, Any]) -> PostKey:
+    """Ключ порядка ленты для поста cold_news или локального объявления."""
+    return (_parse_date(post.get("date")), str(post.get("id", "")))
+
+
+def format_key(key: PostKey) -> str:
+    """Ключ в виде «ISO-время|id» (параметр before у cold_news)."""
+    moment = key[0].astimezone(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+    return f"{moment}|{key[1]}"
+
+
+def encode_cursor(key: PostKey, upstream_offset: int) -> str:
+    raw = f"{format_key(key)}|{upstream_offset}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor_value: str) -> Tuple[PostKey, int]:
+    """Разобрать курсор; ValueError, если он повреждён."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor_value + "=" * (-len(cursor_value) % 4)).decode()
+        moment, post_id, upstream_offset = raw.rsplit("|", 2)
+        return (_parse_date(moment), post_id), max(0, int(upstream_offset))
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError("Invalid cursor")
+
+
+def index_after(posts: List[Dict[str, Any]], key: Optional[PostKey]) -> Optional[int]:
+    """Позиция первого поста старше key в упорядоченном списке (None — все посты не старше key)."""
+    if key is None:
+        return 0
+    for index, post in enumerate(posts):
+        if post_key(post) < key:
+            return index
+    return None
+
+
+async def merged_page(fetch_upstream: UpstreamFetcher, local_posts: List[Dict[str, Any]],
+                      is_excluded: Callable[[Dict[str, Any]], bool], cursor_value: Optional[str],
+                      limit: int) -> Dict[str, Any]:
+    """
+    Страница слитой ленты: ровно limit постов, если лента не закончилась.
+    Возвращает {"posts": [...], "total": N, "next_cursor": str | None}.
+    """
+    after, upstream_offset = decode_cursor(cursor_value) if cursor_value else (None, 0)
+    local = sorted((p for p in local_posts if after is None or post_key(p) < after), key=post_key, reverse=True)
+    buffer: deque = deque()
+    fetched_after = after
+    exhausted = False
+    total: Optional[int] = None
+    posts: List[Dict[str, Any]] = []
+    local_index = 0
+
+    while len(posts) < limit:
+        if not buffer and not exhausted:
+            requested = max(limit - len(posts), MIN_CHUNK)
+            data = await fetch_upstream(fetched_after, upstream_offset, requested)
+            batch = data.get("posts", [])
+            if total is None:
+                total = data.get("total", len(batch))
+            exhausted = len(batch) < requested
+            if batch:
+                fetched_after = post_key(batch[-1])
+            # Уже отданные посты (сервис без before или новые посты сдвинули смещение) отбрасываются по ключу
+            buffer.extend((upstream_offset + i, p) for i, p in enumerate(batch)
+                          if not is_excluded(p) and (after is None or post_key(p) < after))
+            upstream_offset += len(batch)
+            continue
+        upstream_head = buffer[0][1] if buffer else None
+        local_head = local[local_index] if local_index < len(local) else None
+        if upstream_head is None and local_head is None:
+            break
+        if local_head is None or (upstream_head is not None and post_key(upstream_head) > post_key(local_head)):
+            posts.append(buffer.popleft()[1])
+        else:
+            posts.append(local_head)
+            local_index += 1
+
+    has_more = bool(buffer) or not exhausted or local_index < len(local)
+    next_cursor = None
+    if posts and has_more:
+        # Непрочитанные посты порции запросятся снова — смещение первого из них
+        next_cursor = encode_cursor(post_key(posts[-1]), buffer[0][0] if buffer else upstream_offset)
+    return {"posts": posts, "total": (total or 0) + len(local_posts), "next_cursor": next_cursor}
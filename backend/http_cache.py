@@ -0,0 +1,76 @@
+"""
+Условные ответы (ETag / If-None-Match) для JSON-эндпоинтов запуска мини-приложения.
+
+Тело ответа сериализуется один раз (json_payload), ETag — хэш этих байт, поэтому он
+одинаков во всех воркерах и не зависит от порядка правок. Закэшированный payload
+(см. config_cache) отдаётся как есть или ответом 304 без сериализации.
+
+Метрики по эндпоинтам (ответов 200/304, сэкономленные байты) — /api/metrics, ключ http_cache.
+"""
+import hashlib
+import threading
+from typing import Any, Dict
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+# Клиент хранит ответ, но каждый раз перепроверяет его по ETag
+CACHE_CONTROL = "no-cache"
+
+
+class JSONPayload:
+    """Сериализованное JSON-тело и его ETag."""
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def json_payload(data: Any) -> JSONPayload:
+    """Сериализовать так же, как это сделал бы FastAPI для обычного return."""
+    return JSONPayload(JSONResponse(content=jsonable_encoder(data)).body)
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Сравнение для If-None-Match / If-Range (слабое: W/ игнорируется)."""
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _count(name: str, not_modified: bool, size: int):
+    with _lock:
+        entry = _stats.setdefault(name, {"ok": 0, "not_modified": 0, "bytes_sent": 0, "bytes_saved": 0})
+        if not_modified:
+            entry["not_modified"] += 1
+            entry["bytes_saved"] += size
+        else:
+            entry["ok"] += 1
+            entry["bytes_sent"] += size
+
+
+def respond(request: Request, payload: JSONPayload, name: str) -> Response:
+    """200 с телом и ETag или 304, если у клиента та же версия (name — ключ метрик)."""
+    headers = {"ETag": payload.etag, "Cache-Control": CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, payload.etag):
+        _count(name, True, len(payload.body))
+        return Response(status_code=304, headers=headers)
+    _count(name, False, len(payload.body))
+    return Response(content=payload.body, media_type="application/json", headers=headers)
+
+
+def stats() -> Dict[str, Any]:
+    """Метрики для /api/metrics."""
+    with _lock:
+        out = {name: dict(entry) for name, entry in _stats.items()}
+    for entry in out.values():
+        total = entry["ok"] + entry["not_modified"]
+        entry["hit_ratio"] = entry["not_modified"] / total if total else 0.0
+    return out
@@ -0,0 +1,158 @@
+"""
+Общие исходящие HTTP-клиенты (httpx.AsyncClient) на всё время жизни приложения.
+
+Прокси ленты хаба, мероприятий и методы MAXBotAPI раньше создавали новый клиент на каждый
+вызов — каждый запрос заново проходил DNS, TCP и TLS. Теперь для каждого внешнего сервиса
+есть один клиент с пулом keep-alive соединений: создаётся в startup, закрывается в shutdown.
+
+Сервисы и настройки (переменные окружения, <NAME> — HUB / EVENTS / MAX):
+    HTTP_<NAME>_TIMEOUT            — таймаут запроса по умолчанию, секунды
+    HTTP_<NAME>_MAX_CONNECTIONS    — максимум соединений в пуле
+    HTTP_<NAME>_MAX_KEEPALIVE      — сколько простаивающих соединений держать открытыми
+    HTTP_<NAME>_HTTP2              — 1, чтобы разрешить HTTP/2 (нужен пакет h2, иначе HTTP/1.1)
+
+Использование в main.py:
+    client = http_clients.registry.get("hub")
+    r = await client.get(url, timeout=5.0)
+
+Метрики (запросы, ошибки — исключения и ответы 5xx, время до ответа, соединения в пуле) —
+/api/metrics, ключ http_clients.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+except ImportError:
+    h2 = None
+
+log = logging.getLogger("uvicorn.error")
+
+
+def _env(name: str, key: str, default):
+    value = os.environ.get(f"HTTP_{name.upper()}_{key}")
+    if value is None or value == "":
+        return default
+    if isinstance(default, bool):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return type(default)(value)
+
+
+class Upstream:
+    """Настройки пула одного внешнего сервиса."""
+
+    def __init__(self, name: str, timeout: float, max_connections: int, max_keepalive: int, http2: bool = False):
+        self.name = name
+        self.timeout = _env(name, "TIMEOUT", timeout)
+        self.max_connections = _env(name, "MAX_CONNECTIONS", max_connections)
+        self.max_keepalive = _env(name, "MAX_KEEPALIVE", max_keepalive)
+        self.http2 = _env(name, "HTTP2", http2)
+
+
+UPSTREAMS = {
+    # cold_news: лента и источники для страницы хаба
+    "hub": Upstream("hub", timeout=10.0, max_connections=50, max_keepalive=20),
+    # API мероприятий (список, подробности, регистрация)
+    "events": Upstream("events", timeout=8.0, max_connections=20, max_keepalive=10),
+    # MAX platform API (сообщения и ответы бота)
+    "max": Upstream("max", timeout=15.0, max_connections=50, max_keepalive=20),
+}
+
+
+class _InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """Транспорт с пулом соединений, считающий запросы, ошибки и время до ответа."""
+
+    def __init__(self, stats: Dict[str, Any], lock: threading.Lock, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+        self._lock = lock
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["in_flight"] += 1
+        started = time.monotonic()
+        failed = True
+        try:
+            response = await super().handle_async_request(request)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            with self._lock:
+                self._stats["in_flight"] -= 1
+                self._stats["time_total"] += time.monotonic() - started
+                if failed:
+                    self._stats["errors"] += 1
+
+    def pool_stats(self) -> Dict[str, int]:
+        connections = list(self._pool.connections)
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {"connections": len(connections), "idle": idle, "active": len(connections) - idle}
+
+
+class ClientRegistry:
+    """По одному httpx.AsyncClient на внешний сервис и счётчики запросов к ним."""
+
+    def __init__(self, upstreams: Dict[str, Upstream] = UPSTREAMS):
+        self.upstreams = upstreams
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, _InstrumentedTransport] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {
+            name: {"requests": 0, "errors": 0, "in_flight": 0, "time_total": 0.0} for name in upstreams
+        }
+
+    def _create(self, upstream: Upstream) -> httpx.AsyncClient:
+        http2 = upstream.http2 and h2 is not None
+        if upstream.http2 and not http2:
+            log.warning("HTTP/2 for %s requested but h2 is not installed, using HTTP/1.1", upstream.name)
+        transport = _InstrumentedTransport(
+            self._stats[upstream.name], self._lock,
+            limits=httpx.Limits(max_connections=upstream.max_connections,
+                                max_keepalive_connections=upstream.max_keepalive),
+            http2=http2,
+        )
+        self._transports[upstream.name] = transport
+        return httpx.AsyncClient(timeout=upstream.timeout, transport=transport)
+
+    def start(self):
+        """Создать клиенты (из startup-обработчика)."""
+        for name in self.upstreams:
+            self.get(name)
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Клиент сервиса name; если startup ещё не выполнялся — создаётся при первом обращении."""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = self._create(self.upstreams[name])
+        return client
+
+    async def close(self):
+        """Закрыть все клиенты и их соединения (из shutdown-обработчика)."""
+        clients, self._clients = list(self._clients.values()), {}
+        self._transports = {}
+        for client in clients:
+            await client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /api/metrics."""
+        out = {}
+        for name, upstream in self.upstreams.items():
+            with self._lock:
+                entry = dict(self._stats[name])
+            completed = entry["requests"] - entry["in_flight"]
+            entry["time_avg"] = entry["time_total"] / completed if completed else 0.0
+            transport = self._transports.get(name)
+            entry.update(transport.pool_stats() if transport else {"connections": 0, "idle": 0, "active": 0})
+            entry["max_connections"] = upstream.max_connections
+            entry["http2"] = upstream.http2 and h2 is not None
+            out[name] = entry
+        return out
+
+
+registry = ClientRegistry()
@@ -0,0 +1,282 @@
+"""
+Фоновая предзагрузка ленты хаба и списка мероприятий.
+
+Раз в HUB_PREFETCH_INTERVAL секунд фоновая задача загружает из cold_news первые
+HUB_PREFETCH_PAGES страниц общей ленты по HUB_PREFETCH_PAGE_SIZE постов, первые
+HUB_PREFETCH_CHANNEL_PAGES страниц каждого канала из /api/sources (не больше
+HUB_PREFETCH_MAX_CHANNELS каналов) и список мероприятий (EVENTS_PREFETCH_LIMIT штук).
+
+Для каждого канала хранится окно «сырых» постов сервиса (до фильтрации), поэтому страница
+с любыми limit и offset внутри окна собирается из снимка точно так же, как при запросе
+к cold_news: те же посты, тот же фильтр исключённого источника, моковые новости на первой
+странице. Готовый JSON страницы запоминается; первая страница каждого канала сериализуется
+заранее. Мероприятия сервис отдаёт в одном порядке, поэтому список на меньший limit — начало
+загруженного списка.
+
+Ленте по курсору (feed_cursor.py) окно отдаёт посты сервиса после ключа курсора.
+
+GET /api/hub/feed и /api/external/events отвечают из снимка; если страница выходит за окно
+(глубокий offset) или снимок старше HUB_PREFETCH_MAX_AGE секунд (сервис недоступен),
+запрос идёт во внешний сервис как раньше. HUB_PREFETCH_INTERVAL=0 отключает предзагрузку.
+
+Метрики (попадания в снимок, обращения мимо него, длительность обновления) — /api/metrics,
+ключ hub_prefetch.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import feed_cursor
+import http_cache
+
+log = logging.getLogger("uvicorn.error")
+
+PREFETCH_INTERVAL = float(os.environ.get("HUB_PREFETCH_INTERVAL", 30.0))
+PREFETCH_MAX_AGE = float(os.environ.get("HUB_PREFETCH_MAX_AGE", PREFETCH_INTERVAL * 4))
+PREFETCH_PAGE_SIZE = int(os.environ.get("HUB_PREFETCH_PAGE_SIZE", 20))
+PREFETCH_PAGES = int(os.environ.get("HUB_PREFETCH_PAGES", 5))
+PREFETCH_CHANNEL_PAGES = int(os.environ.get("HUB_PREFETCH_CHANNEL_PAGES", 2))
+PREFETCH_MAX_CHANNELS = int(os.environ.get("HUB_PREFETCH_MAX_CHANNELS", 50))
+EVENTS_PREFETCH_LIMIT = int(os.environ.get("EVENTS_PREFETCH_LIMIT", 50))
+# Сколько каналов загружается одновременно
+PREFETCH_CONCURRENCY = 4
+MAX_PAGES_PER_WINDOW = 256
+
+# (limit, offset, channel) -> сырой ответ cold_news {"posts": [...], "total": N}
+FeedFetcher = Callable[[int, int, Optional[str]], Awaitable[Dict[str, Any]]]
+# (сырые посты, total сервиса, offset) -> тело ответа {"posts": [...], "total": N}
+PageBuilder = Callable[[List[Dict], int, int], Dict[str, Any]]
+
+
+class _FeedWindow:
+    """Первые посты канала в том виде, как их отдаёт cold_news, и собранные из них страницы."""
+
+    def __init__(self, posts: List[Dict], total: int, complete: bool):
+        self.posts = posts
+        self.total = total
+        # Сервис отдал все посты канала — любой offset отвечается из окна
+        self.complete = complete
+        self.pages: Dict[Tuple[int, int], http_cache.JSONPayload] = {}
+
+    def covers(self, limit: int, offset: int) -> bool:
+        return self.complete or offset + limit <= len(self.posts)
+
+
+class _EventsSnapshot:
+    """Список мероприятий на EVENTS_PREFETCH_LIMIT и готовые ответы на меньшие limit."""
+
+    def __init__(self, data: Dict[str, Any], limit: int):
+        self.data = data
+        self.limit = limit
+        self.payloads: Dict[int, Tuple[Dict[str, Any], http_cache.JSONPayload]] = {}
+
+
+class HubPrefetcher:
+    """Периодическое обновление снимка ленты и мероприятий."""
+
+    def __init__(self, interval: float = PREFETCH_INTERVAL, max_age: float = PREFETCH_MAX_AGE,
+                 page_size: int = PREFETCH_PAGE_SIZE, pages: int = PREFETCH_PAGES,
+                 channel_pages: int = PREFETCH_CHANNEL_PAGES, max_channels: int = PREFETCH_MAX_CHANNELS,
+                 events_limit: int = EVENTS_PREFETCH_LIMIT):
+        self.interval = interval
+        self.max_age = max_age
+        self.page_size = max(1, page_size)
+        self.pages = max(1, pages)
+        self.channel_pages = max(1, channel_pages)
+        self.max_channels = max(0, max_channels)
+        self.events_limit = max(1, events_limit)
+        self._fetch_feed: Optional[FeedFetcher] = None
+        self._build_page: Optional[PageBuilder] = None
+        self._fetch_channels: Optional[Callable[[], Awaitable[List[str]]]] = None
+        self._fetch_events: Optional[Callable[[int], Awaitable[Optional[Dict[str, Any]]]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self._windows: Dict[Optional[str], Tuple[float, _FeedWindow]] = {}
+        self._events: Optional[Tuple[float, _EventsSnapshot]] = None
+        self._stats = {"runs": 0, "failures": 0, "feed_hits": 0, "feed_misses": 0,
+                       "events_hits": 0, "events_misses": 0, "last_run_ms": 0.0}
+
+    # ============ ОБНОВЛЕНИЕ СНИМКА ============
+
+    async def _load_window(self, channel: Optional[str], pages: int) -> _FeedWindow:
+        posts: List[Dict] = []
+        total = 0
+        complete = False
+        for page in range(pages):
+            data = await self._fetch_feed(self.page_size, page * self.page_size, channel)
+            batch = data.get("posts", [])
+            posts.extend(batch)
+            total = data.get("total", len(posts))
+            if len(batch) < self.page_size or len(posts) >= total:
+                complete = True
+                break
+        window = _FeedWindow(posts, total, complete)
+        # Первая страница с размером по умолчанию — самый частый запрос, сериализуем заранее
+        self._page(window, self.page_size, 0)
+        return window
+
+    async def _refresh_channel(self, channel: Optional[str], pages: int, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            try:
+                window = await self._load_window(channel, pages)
+            except Exception as e:
+                # Старое окно остаётся в снимке, пока не истечёт HUB_PREFETCH_MAX_AGE
+                log.warning("Hub prefetch of channel %r failed: %s", channel, e)
+                return False
+        with self._lock:
+            self._windows[channel] = (time.monotonic(), window)
+        return True
+
+    async def refresh(self) -> Dict[str, Any]:
+        """Один проход: общая лента, каналы из /api/sources и мероприятия."""
+        started = time.monotonic()
+        semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+        jobs = [self._refresh_channel(None, self.pages, semaphore)]
+        channels: List[str] = []
+        if self.max_channels:
+            try:
+                channels = (await self._fetch_channels())[:self.max_channels]
+            except Exception as e:
+                log.warning("Hub prefetch of sources failed: %s", e)
+        jobs.extend(self._refresh_channel(channel, self.channel_pages, semaphore) for channel in channels)
+        results = await asyncio.gather(*jobs)
+
+        events_ok = True
+        try:
+            data = await self._fetch_events(self.events_limit)
+            if data is not None:
+                with self._lock:
+                    self._events = (time.monotonic(), _EventsSnapshot(data, self.events_limit))
+        except Exception as e:
+            events_ok = False
+            log.warning("Events prefetch failed: %s", e)
+
+        with self._lock:
+            # Каналы, пропавшие из /api/sources, больше не обновляются — убираем их окна
+            keep = set(channels) | {None}
+            for channel in [c for c in self._windows if c not in keep]:
+                del self._windows[channel]
+        result = {"channels": len(channels), "failed": results.count(False) + (0 if events_ok else 1),
+                  "duration_ms": (time.monotonic() - started) * 1000}
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["last_run_ms"] = result["duration_ms"]
+        return result
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                with self._lock:
+                    self._stats["failures"] += 1
+                log.warning("Hub prefetch failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self, fetch_feed: FeedFetcher, build_page: PageBuilder,
+              fetch_channels: Callable[[], Awaitable[List[str]]],
+              fetch_events: Callable[[int], Awaitable[Optional[Dict[str, Any]]]]):
+        """Запустить предзагрузку (из startup-обработчика); загрузчики и сборка страницы — из main.py."""
+        self._fetch_feed = fetch_feed
+        self._build_page = build_page
+        self._fetch_channels = fetch_channels
+        self._fetch_events = fetch_events
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ============ ОТВЕТЫ ИЗ СНИМКА ============
+
+    def _page(self, window: _FeedWindow, limit: int, offset: int) -> http_cache.JSONPayload:
+        payload = window.pages.get((limit, offset))
+        if payload is None:
+            data = self._build_page(window.posts[offset:offset + limit], window.total, offset)
+            payload = http_cache.json_payload(data)
+            with self._lock:
+                if len(window.pages) >= MAX_PAGES_PER_WINDOW:
+                    window.pages.clear()
+                window.pages[(limit, offset)] = payload
+        return payload
+
+    def _fresh(self, loaded_at: float) -> bool:
+        return time.monotonic() - loaded_at < self.max_age
+
+    def feed_page(self, limit: int, offset: int, channel: Optional[str]) -> Optional[http_cache.JSONPayload]:
+        """Готовая страница ленты или None, если её нужно запросить у cold_news."""
+        entry = self._windows.get(channel)
+        if entry is None or not self._fresh(entry[0]) or not entry[1].covers(limit, offset):
+            with self._lock:
+                self._stats["feed_misses"] += 1
+            return None
+        payload = self._page(entry[1], limit, offset)
+        with self._lock:
+            self._stats["feed_hits"] += 1
+        return payload
+
+    def upstream_after(self, channel: Optional[str], after: Optional[feed_cursor.PostKey],
+                       limit: int) -> Optional[Dict[str, Any]]:
+        """Посты cold_news старше ключа after из окна ({"posts", "total"}) или None, если окна не хватает."""
+        entry = self._windows.get(channel)
+        if entry is None or not self._fresh(entry[0]):
+            with self._lock:
+                self._stats["feed_misses"] += 1
+            return None
+        window = entry[1]
+        start = feed_cursor.index_after(window.posts, after)
+        if start is None and window.complete:
+            start = len(window.posts)
+        if start is None or not window.covers(limit, start):
+            with self._lock:
+                self._stats["feed_misses"] += 1
+            return None
+        with self._lock:
+            self._stats["feed_hits"] += 1
+        return {"posts": window.posts[start:start + limit], "total": window.total}
+
+    def events(self, limit: int) -> Optional[Tuple[Dict[str, Any], http_cache.JSONPayload]]:
+        """(данные, готовый JSON) списка мероприятий или None, если их нужно запросить у сервиса."""
+        entry = self._events
+        if entry is None or not self._fresh(entry[0]) or limit > entry[1].limit:
+            with self._lock:
+                self._stats["events_misses"] += 1
+            return None
+        snapshot = entry[1]
+        cached = snapshot.payloads.get(limit)
+        if cached is None:
+            data = dict(snapshot.data)
+            data["events"] = data.get("events", [])[:limit]
+            cached = (data, http_cache.json_payload(data))
+            with self._lock:
+                snapshot.payloads[limit] = cached
+        with self._lock:
+            self._stats["events_hits"] += 1
+        return cached
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /api/metrics."""
+        now = time.monotonic()
+        with self._lock:
+            out = dict(self._stats)
+            out["channels"] = len(self._windows)
+            out["posts"] = sum(len(window.posts) for _, window in self._windows.values())
+            out["pages_cached"] = sum(len(window.pages) for _, window in self._windows.values())
+            feed = self._windows.get(None)
+            out["feed_age"] = now - feed[0] if feed else None
+            out["events_age"] = now - self._events[0] if self._events else None
+        out["interval"] = self.interval
+        out["max_age"] = self.max_age
+        return out
+
+
+prefetcher = HubPrefetcher()
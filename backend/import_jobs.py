@@ -0,0 +1,379 @@
+"""
+Фоновый импорт студентов из CSV/XLSX с генерацией кодов приглашения.
+
+POST /api/admin/invitation-codes/import-students/upload сохраняет файл на диск по кускам
+и сразу возвращает id задачи. Задача читает строки потоково (csv.reader / openpyxl в режиме
+read_only), по IMPORT_BATCH_SIZE строк отдаёт их database.import_students_and_generate_codes
+(одна транзакция на пакет) и дописывает результат (имя → код) в CSV на диске. Ни исходный
+файл, ни результат целиком в памяти не держатся.
+
+Прогресс — GET .../import-jobs/{id}, CSV — GET .../import-jobs/{id}/result. Каждый пакет
+попадает в CSV только после фиксации в БД, поэтому если задача прервалась (ошибка в строке,
+остановка сервера при деплое), CSV прерванной задачи содержит ровно уже созданные коды
+(processed) — их можно скачать, повторно загружать файл целиком не нужно.
+
+Состояние задачи сохраняется рядом с результатом ({id}.json), поэтому статус и CSV доступны
+после перезапуска и из любого воркера uvicorn. Задача, которую прервал перезапуск, получает
+статус cancelled. Завершённые задачи и их файлы удаляются через IMPORT_JOB_TTL секунд
+(по умолчанию час).
+
+Формат CSV: разделитель , ; или табуляция, кодировка UTF-8 (с BOM или без) либо cp1251.
+Колонки определяются по заголовку (name/ФИО, id/номер, role/роль); без заголовка —
+по порядку: имя, номер, роль. Роль по умолчанию — student.
+"""
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+import database
+
+log = logging.getLogger("uvicorn.error")
+
+BATCH_SIZE = max(1, int(os.environ.get("IMPORT_BATCH_SIZE", 1000)))
+JOB_TTL = float(os.environ.get("IMPORT_JOB_TTL", 3600.0))
+MAX_UPLOAD_BYTES = int(os.environ.get("IMPORT_MAX_BYTES", 50 * 1024 * 1024))
+
+VALID_ROLES = {"student", "applicant", "employee", "teacher"}
+RESULT_COLUMNS = ["student_name", "student_id", "role", "code"]
+# Статусы, после которых задача больше не меняется; CSV с уже созданными кодами доступен во всех
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+_JOB_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+# Допустимые названия колонок в заголовке файла (в нижнем регистре)
+_HEADER_ALIASES = {
+    "name": {"name", "student_name", "fio", "full_name", "фио", "имя", "студент"},
+    "id": {"id", "student_id", "number", "номер", "зачетка", "зачётка", "табельный номер"},
+    "role": {"role", "роль"},
+}
+_SNIFF_BYTES = 64 * 1024
+
+
+def supported_format(filename: str) -> Optional[str]:
+    """'csv' / 'xlsx' по расширению имени файла или None, если формат не поддерживается."""
+    ext = Path(filename or "").suffix.lower()
+    if ext in (".csv", ".txt"):
+        return "csv"
+    if ext == ".xlsx" and openpyxl is not None:
+        return "xlsx"
+    return None
+
+
+def _detect_encoding(sample: bytes) -> str:
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # Кусок мог оборваться посреди многобайтового символа
+        if e.start < len(sample) - 3:
+            return "cp1251"
+    return "utf-8-sig"
+
+
+def _column_map(header: List[str]) -> Optional[Dict[str, int]]:
+    """Индексы колонок name/id/role по заголовку или None, если первая строка — не заголовок."""
+    mapping = {}
+    for index, title in enumerate(header):
+        title = str(title or "").strip().lower()
+        for field, aliases in _HEADER_ALIASES.items():
+            if title in aliases and field not in mapping:
+                mapping[field] = index
+    return mapping if "name" in mapping else None
+
+
+def _rows_to_students(rows: Iterator[Tuple[List[Any], float]]) -> Iterator[Tuple[Dict, float]]:
+    """Строки файла → словари студентов (name, id, role) с долей прочитанного файла."""
+    mapping = None
+    first = True
+    for cells, progress in rows:
+        cells = ["" if cell is None else str(cell).strip() for cell in cells]
+        if first:
+            first = False
+            mapping = _column_map(cells)
+            if mapping is not None:
+                continue
+            mapping = {"name": 0, "id": 1, "role": 2}
+        if not any(cells):
+            continue
+
+        def cell(field):
+            index = mapping.get(field)
+            return cells[index] if index is not None and index < len(cells) else ""
+
+        yield {"name": cell("name"), "id": cell("id"), "role": cell("role").lower() or "student"}, progress
+
+
+def _iter_csv(path: Path) -> Iterator[Tuple[List[str], float]]:
+    size = path.stat().st_size or 1
+    with open(path, "rb") as raw:
+        sample = raw.read(_SNIFF_BYTES)
+        raw.seek(0)
+        encoding = _detect_encoding(sample)
+        text = sample.decode(encoding, errors="ignore")
+        try:
+            dialect = csv.Sniffer().sniff(text.split("\n", 1)[0] or text, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(io.TextIOWrapper(raw, encoding=encoding, errors="replace", newline=""), dialect)
+        for cells in reader:
+            yield cells, min(raw.tell() / size, 1.0)
+
+
+def _iter_xlsx(path: Path) -> Iterator[Tuple[List[Any], float]]:
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        total = sheet.max_row or 0
+        for index, cells in enumerate(sheet.iter_rows(values_only=True), start=1):
+            yield list(cells), min(index / total, 1.0) if total else 0.0
+    finally:
+        workbook.close()
+
+
+class ImportCancelled(Exception):
+    """Задачу остановили (shutdown) — уже созданные коды остаются в CSV."""
+
+
+class ImportJob:
+    """Состояние одной задачи импорта."""
+
+    def __init__(self, job_id: str, university_id: int, generated_by_user_id: int,
+                 source: Path, file_format: str, filename: str):
+        self.id = job_id
+        self.university_id = university_id
+        self.generated_by_user_id = generated_by_user_id
+        self.source = source
+        self.result = source.with_name(f"{job_id}.result.csv")
+        self.file_format = file_format
+        self.filename = filename
+        self.status = "queued"
+        self.progress = 0.0
+        self.processed = 0
+        self.skipped = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.cancelled = threading.Event()
+
+    @property
+    def meta(self) -> Path:
+        return self.source.with_name(f"{self.id}.json")
+
+    @property
+    def result_available(self) -> bool:
+        return self.status in FINISHED_STATUSES and self.result.exists()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "university_id": self.university_id,
+            "filename": self.filename,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            # CSV с processed кодами; partial — задача не дошла до конца файла
+            "result_available": self.result_available,
+            "partial": self.status in ("failed", "cancelled"),
+        }
+
+    def save(self):
+        """Записать состояние задачи на диск (атомарно)."""
+        state = self.to_dict()
+        state.update(generated_by_user_id=self.generated_by_user_id, file_format=self.file_format)
+        tmp = self.meta.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.meta)
+
+    @classmethod
+    def load(cls, directory: Path, job_id: str) -> Optional["ImportJob"]:
+        """Задача из {id}.json или None."""
+        try:
+            state = json.loads((directory / f"{job_id}.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        job = cls(job_id, state["university_id"], state.get("generated_by_user_id"),
+                  directory / f"{job_id}.{state.get('file_format', 'csv')}",
+                  state.get("file_format", "csv"), state.get("filename"))
+        job.status = state["status"]
+        job.progress = state.get("progress", 0.0)
+        job.processed = state.get("processed", 0)
+        job.skipped = state.get("skipped", 0)
+        job.error = state.get("error")
+        job.created_at = state.get("created_at", job.created_at)
+        job.finished_at = state.get("finished_at")
+        return job
+
+
+def _flush_batch(job: ImportJob, batch: List[Dict], writer) -> None:
+    results = database.import_students_and_generate_codes(job.university_id, batch, job.generated_by_user_id)
+    writer.writerows([[r["student_name"], r["student_id"], r["role"], r["code"]] for r in results])
+    job.processed += len(results)
+
+
+def run_job(job: ImportJob) -> None:
+    """Обработать файл задачи (выполняется в отдельном потоке)."""
+    rows = _iter_xlsx(job.source) if job.file_format == "xlsx" else _iter_csv(job.source)
+    # utf-8-sig — чтобы Excel открыл результат с кириллицей без выбора кодировки
+    with open(job.result, "w", encoding="utf-8-sig", newline="") as out:
+        writer = csv.writer(out)
+        writer.writerow(RESULT_COLUMNS)
+        batch: List[Dict] = []
+        for student, progress in _rows_to_students(rows):
+            if job.cancelled.is_set():
+                raise ImportCancelled("Import cancelled (server shutdown)")
+            if not student["name"] or student["role"] not in VALID_ROLES:
+                job.skipped += 1
+                continue
+            batch.append(student)
+            if len(batch) >= BATCH_SIZE:
+                _flush_batch(job, batch, writer)
+                out.flush()
+                batch = []
+                job.progress = progress
+                job.save()
+        if batch:
+            _flush_batch(job, batch, writer)
+    job.progress = 1.0
+
+
+class ImportJobs:
+    """Реестр задач импорта процесса и их запуск в фоне."""
+
+    def __init__(self, job_ttl: float = JOB_TTL):
+        self.job_ttl = job_ttl
+        self.directory: Optional[Path] = None
+        self._jobs: Dict[str, ImportJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._stats = {"started": 0, "done": 0, "failed": 0, "cancelled": 0, "rows": 0, "skipped": 0}
+
+    def open(self, directory: Path):
+        """Каталог задач (из startup-обработчика). Задачи, прерванные падением процесса, помечаются cancelled."""
+        self.directory = directory
+        directory.mkdir(parents=True, exist_ok=True)
+        for meta in directory.glob("*.json"):
+            job = ImportJob.load(directory, meta.stem)
+            if job is not None and job.status not in FINISHED_STATUSES:
+                job.status = "cancelled"
+                job.error = "Import interrupted by server restart"
+                job.finished_at = job.finished_at or time.time()
+                job.source.unlink(missing_ok=True)
+                job.save()
+        self._prune_files()
+
+    def create(self, directory: Path, university_id: int, generated_by_user_id: int,
+               file_format: str, filename: str) -> ImportJob:
+        """Зарегистрировать задачу; файл нужно записать в job.source до start()."""
+        self.directory = directory
+        self._prune()
+        self._prune_files()
+        directory.mkdir(parents=True, exist_ok=True)
+        job_id = secrets.token_hex(16)
+        source = directory / f"{job_id}.{file_format}"
+        job = ImportJob(job_id, university_id, generated_by_user_id, source, file_format, filename)
+        self._jobs[job_id] = job
+        job.save()
+        return job
+
+    def discard(self, job: ImportJob):
+        """Удалить задачу, которая так и не была запущена (ошибка загрузки файла)."""
+        self._jobs.pop(job.id, None)
+        job.source.unlink(missing_ok=True)
+        job.meta.unlink(missing_ok=True)
+
+    def start(self, job: ImportJob):
+        self._stats["started"] += 1
+        self._tasks[job.id] = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: ImportJob):
+        job.status = "running"
+        job.save()
+        started = time.monotonic()
+        try:
+            await asyncio.to_thread(run_job, job)
+            job.status = "done"
+            self._stats["done"] += 1
+            log.info("Import job %s: %s rows (%s skipped) in %.1fs",
+                     job.id, job.processed, job.skipped, time.monotonic() - started)
+        except ImportCancelled as e:
+            job.status = "cancelled"
+            job.error = str(e)
+            self._stats["cancelled"] += 1
+            log.warning("Import job %s cancelled after %s rows", job.id, job.processed)
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            self._stats["failed"] += 1
+            log.warning("Import job %s failed after %s rows: %s", job.id, job.processed, e)
+        finally:
+            job.finished_at = time.time()
+            self._stats["rows"] += job.processed
+            self._stats["skipped"] += job.skipped
+            job.source.unlink(missing_ok=True)
+            job.save()
+            self._tasks.pop(job.id, None)
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        """Задача этого процесса или сохранённая на диске (другой воркер, до перезапуска)."""
+        job = self._jobs.get(job_id)
+        if job is None and self.directory is not None and _JOB_ID_RE.fullmatch(job_id or ""):
+            job = ImportJob.load(self.directory, job_id)
+        return job
+
+    def _prune(self):
+        """Забыть завершённые задачи старше job_ttl и удалить их файлы."""
+        if self.job_ttl <= 0:
+            return
+        deadline = time.time() - self.job_ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and job.finished_at < deadline:
+                del self._jobs[job_id]
+                job.result.unlink(missing_ok=True)
+                job.meta.unlink(missing_ok=True)
+
+    def _prune_files(self):
+        """То же для задач на диске (других воркеров и до перезапуска)."""
+        if self.job_ttl <= 0 or self.directory is None:
+            return
+        deadline = time.time() - self.job_ttl
+        for meta in self.directory.glob("*.json"):
+            job = ImportJob.load(self.directory, meta.stem)
+            if job is not None and job.finished_at is not None and job.finished_at < deadline:
+                job.result.unlink(missing_ok=True)
+                job.meta.unlink(missing_ok=True)
+
+    async def stop(self):
+        """Прервать выполняющиеся задачи (после текущего пакета) и дождаться их."""
+        for job_id, task in list(self._tasks.items()):
+            self._jobs[job_id].cancelled.set()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /api/metrics."""
+        self._prune()
+        out = dict(self._stats)
+        out["running"] = len(self._tasks)
+        out["jobs"] = len(self._jobs)
+        out["batch_size"] = BATCH_SIZE
+        out["xlsx_supported"] = openpyxl is not None
+        return out
+
+
+jobs = ImportJobs()
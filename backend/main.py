@@ -10,21 +10,37 @@ for name in (".env.events", ".env.database", ".env", ".env.bot"):
         load_dotenv(p)
     load_dotenv(Path.cwd() / name)  # на сервере WorkingDirectory=backend, cwd тоже подойдёт
 
-from fastapi import FastAPI, HTTPException, Header, Depends, BackgroundTasks, Request, File, UploadFile
+from fastapi import FastAPI, HTTPException, Header, Depends, BackgroundTasks, Request, File, Form, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import uvicorn
+import asyncio
 import json
 import hmac
 import hashlib
 import httpx
 from datetime import datetime, timedelta
 import uuid
-import shutil
-import sqlite3
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
 import database
+import db_pool
+import repository as repo
+import story_views
+import story_sweeper
+import story_media
+import story_storage
+import config_cache
+import http_cache
+import http_clients
+import swr_cache
+import single_flight
+import hub_prefetch
+import feed_cursor
+import admission_catalog
+import import_jobs
 
 app = FastAPI(title="Digital University MAX Bot + Mini-App", version="2.0.0")
 
@@ -41,20 +57,15 @@ async def startup_event():
     else:
         log.info("Database: SQLite only (DATABASE_URL not set)")
     
-    # Очистка истёкших историй и их файлов
-    try:
-        expired_ids = database.delete_expired_stories()
-        for sid in expired_ids:
-            story_dir = STORIES_MEDIA_DIR / str(sid)
-            if story_dir.exists():
-                try:
-                    shutil.rmtree(story_dir)
-                except Exception:
-                    pass
-        if expired_ids:
-            log.info("Stories cleanup: removed %s expired", len(expired_ids))
-    except Exception as e:
-        log.warning("Stories cleanup failed: %s", e)
+    # Периодическая очистка истёкших историй и их файлов (первый проход — сразу)
+    story_sweeper.sweeper.start(STORIES_MEDIA_DIR)
+    # Задачи импорта студентов, сохранённые до перезапуска (статус и CSV с кодами)
+    import_jobs.jobs.open(IMPORT_JOBS_DIR)
+    story_views.buffer.start()
+    # Исходящие HTTP-клиенты (лента хаба, мероприятия, MAX API) с пулами keep-alive соединений
+    http_clients.registry.start()
+    # Фоновая предзагрузка первых страниц ленты хаба, лент каналов и списка мероприятий
+    hub_prefetch.prefetcher.start(_fetch_hub_feed, _build_hub_feed_page, _fetch_hub_channels, _fetch_external_events)
     
     # Проверка токена бота
     if MAX_BOT_TOKEN:
@@ -62,6 +73,21 @@ async def startup_event():
     else:
         log.warning("MAX_BOT_TOKEN: not set (create backend/.env.bot with MAX_BOT_TOKEN=...)")
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Остановить фоновые задачи, сбросить буфер просмотров, закрыть HTTP-клиенты и соединения пулов БД."""
+    await story_sweeper.sweeper.stop()
+    await story_media.pipeline.stop()
+    await story_views.buffer.stop()
+    await import_jobs.jobs.stop()
+    await hub_prefetch.prefetcher.stop()
+    await hub_feed_cache.stop()
+    await single_flight.group.stop()
+    await http_clients.registry.close()
+    repo.shutdown()
+    db_pool.close_all()
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -154,38 +180,38 @@ class MAXBotAPI:
         reply_markup: Optional[Dict] = None
     ):
         """Отправка сообщения в MAX: пробуем platform-api и api.max.ru/bot, с chat_id и user_id."""
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            attachments = _reply_markup_to_max_attachments(reply_markup) if reply_markup else []
-            # 1) platform-api.max.ru (документация MAX)
-            for key in ("chat_id", "user_id"):
-                payload = {key: user_id, "text": text, "format": "markdown"}
-                if attachments:
-                    payload["attachments"] = attachments
-                try:
-                    r = await client.post(
-                        f"{self.base_url}/messages",
-                        headers=self.headers,
-                        json=payload
-                    )
-                    if r.status_code in (200, 201):
-                        return r.json() if r.content else {}
-                except Exception:
-                    pass
-            # 2) старый endpoint api.max.ru/bot/sendMessage
-            payload_fb = {"user_id": user_id, "text": text}
-            if reply_markup:
-                payload_fb["reply_markup"] = reply_markup
+        client = http_clients.registry.get("max")
+        attachments = _reply_markup_to_max_attachments(reply_markup) if reply_markup else []
+        # 1) platform-api.max.ru (документация MAX)
+        for key in ("chat_id", "user_id"):
+            payload = {key: user_id, "text": text, "format": "markdown"}
+            if attachments:
+                payload["attachments"] = attachments
             try:
-                r2 = await client.post(
-                    "https://api.max.ru/bot/sendMessage",
+                r = await client.post(
+                    f"{self.base_url}/messages",
                     headers=self.headers,
-                    json=payload_fb
+                    json=payload
                 )
-                if r2.status_code in (200, 201):
-                    return r2.json() if r2.content else {}
+                if r.status_code in (200, 201):
+                    return r.json() if r.content else {}
             except Exception:
                 pass
-            return {}
+        # 2) старый endpoint api.max.ru/bot/sendMessage
+        payload_fb = {"user_id": user_id, "text": text}
+        if reply_markup:
+            payload_fb["reply_markup"] = reply_markup
+        try:
+            r2 = await client.post(
+                "https://api.max.ru/bot/sendMessage",
+                headers=self.headers,
+                json=payload_fb
+            )
+            if r2.status_code in (200, 201):
+                return r2.json() if r2.content else {}
+        except Exception:
+            pass
+        return {}
     
     async def answer_callback_query(
         self, 
@@ -194,20 +220,20 @@ class MAXBotAPI:
         show_alert: bool = False
     ):
         """Ответ на нажатие inline кнопки"""
-        async with httpx.AsyncClient() as client:
-            payload = {
-                "callback_query_id": callback_query_id,
-            }
-            if text:
-                payload["text"] = text
-            payload["show_alert"] = show_alert
-            
-            response = await client.post(
-                f"{self.base_url}/answerCallbackQuery",
-                headers=self.headers,
-                json=payload
-            )
-            return response.json()
+        client = http_clients.registry.get("max")
+        payload = {
+            "callback_query_id": callback_query_id,
+        }
+        if text:
+            payload["text"] = text
+        payload["show_alert"] = show_alert
+        
+        response = await client.post(
+            f"{self.base_url}/answerCallbackQuery",
+            headers=self.headers,
+            json=payload
+        )
+        return response.json()
     
     async def edit_message_text(
         self,
@@ -217,27 +243,27 @@ class MAXBotAPI:
         reply_markup: Optional[Dict] = None
     ):
         """Редактирование сообщения (MAX: PUT /messages/{messageId}, клавиатура — attachments)."""
-        async with httpx.AsyncClient() as client:
-            payload = {"text": text, "format": "markdown"}
-            attachments = _reply_markup_to_max_attachments(reply_markup) if reply_markup else []
-            if attachments:
-                payload["attachments"] = attachments
-            response = await client.put(
-                f"{self.base_url}/messages/{message_id}",
+        client = http_clients.registry.get("max")
+        payload = {"text": text, "format": "markdown"}
+        attachments = _reply_markup_to_max_attachments(reply_markup) if reply_markup else []
+        if attachments:
+            payload["attachments"] = attachments
+        response = await client.put(
+            f"{self.base_url}/messages/{message_id}",
+            headers=self.headers,
+            json=payload
+        )
+        if response.status_code >= 400:
+            payload_fb = {"user_id": user_id, "message_id": message_id, "text": text}
+            if reply_markup:
+                payload_fb["reply_markup"] = reply_markup
+            r2 = await client.post(
+                "https://api.max.ru/bot/editMessageText",
                 headers=self.headers,
-                json=payload
+                json=payload_fb
             )
-            if response.status_code >= 400:
-                payload_fb = {"user_id": user_id, "message_id": message_id, "text": text}
-                if reply_markup:
-                    payload_fb["reply_markup"] = reply_markup
-                r2 = await client.post(
-                    "https://api.max.ru/bot/editMessageText",
-                    headers=self.headers,
-                    json=payload_fb
-                )
-                return r2.json()
-            return response.json()
+            return r2.json()
+        return response.json()
 
 bot_api = MAXBotAPI(MAX_BOT_TOKEN)
 
@@ -500,9 +526,9 @@ async def handle_start_command(user_id: int, user_data: Dict):
     first_name = user_data.get("first_name") or ""
     last_name = user_data.get("last_name") or ""
     username = user_data.get("username")
-    existing = database.get_user(user_id)
+    existing = await repo.users.get(user_id)
     if not existing:
-        database.create_user({
+        await repo.users.create({
             "max_user_id": user_id,
             "first_name": first_name,
             "last_name": last_name,
@@ -513,8 +539,8 @@ async def handle_start_command(user_id: int, user_data: Dict):
             "university_id": 1,
         })
     else:
-        database.update_user_profile(user_id, first_name=first_name, last_name=last_name, username=username)
-    existing = database.get_user(user_id)
+        await repo.users.update_profile(user_id, first_name=first_name, last_name=last_name, username=username)
+    existing = await repo.users.get(user_id)
     role = (existing or {}).get("role")
     users_db[user_id] = users_db.get(user_id) or {}
     if role:
@@ -566,7 +592,7 @@ async def handle_role_selection(user_id: int, callback_query_id: str, role: str,
         users_db[user_id] = {}
     users_db[user_id]["role"] = role
     users_db[user_id]["selected_at"] = datetime.now().isoformat()
-    database.update_user_role(user_id, role, 1)
+    await repo.users.update_role(user_id, role, 1)
     await bot_api.answer_callback_query(
         callback_query_id=callback_query_id,
         text=f"Роль выбрана: {get_role_name(role)}"
@@ -735,6 +761,26 @@ async def health_check():
     return {"status": "healthy", "bot_token_loaded": bool(MAX_BOT_TOKEN)}
 
 
+@app.get("/api/metrics")
+async def metrics():
+    """Внутренние метрики: пулы соединений с БД, пул потоков запросов к БД, фоновые задачи историй."""
+    return {
+        "db_pool": db_pool.stats(),
+        "db_executor": repo.stats(),
+        "story_views": story_views.buffer.stats(),
+        "stories_sweeper": story_sweeper.sweeper.stats(),
+        "stories_media": story_media.pipeline.stats(),
+        "config_cache": config_cache.cache.stats(),
+        "admission_catalog": admission_catalog.catalog.stats(),
+        "http_cache": http_cache.stats(),
+        "import_jobs": import_jobs.jobs.stats(),
+        "http_clients": http_clients.registry.stats(),
+        "hub_feed_cache": hub_feed_cache.stats(),
+        "single_flight": single_flight.group.stats(),
+        "hub_prefetch": hub_prefetch.prefetcher.stats(),
+    }
+
+
 class BotSyncUser(BaseModel):
     """Тело запроса от TS-бота для синхронизации пользователя."""
     max_user_id: int
@@ -761,19 +807,19 @@ async def bot_sync_user(
         raise HTTPException(status_code=401, detail="Invalid X-Bot-Secret")
     uid = body.max_user_id
     university_id = body.university_id or 1
-    existing = database.get_user(uid)
+    existing = await repo.users.get(uid)
     if existing:
         if body.first_name is not None or body.last_name is not None or body.username is not None:
-            database.update_user_profile(
+            await repo.users.update_profile(
                 uid,
                 first_name=body.first_name or existing.get("first_name") or "",
                 last_name=body.last_name if body.last_name is not None else existing.get("last_name"),
                 username=body.username if body.username is not None else existing.get("username"),
             )
         if body.role is not None:
-            database.update_user_role(uid, body.role, university_id)
+            await repo.users.update_role(uid, body.role, university_id)
     else:
-        database.create_user({
+        await repo.users.create({
             "max_user_id": uid,
             "first_name": body.first_name or "",
             "last_name": body.last_name,
@@ -783,7 +829,7 @@ async def bot_sync_user(
             "role": body.role,
             "university_id": university_id,
         })
-    user = database.get_user(uid)
+    user = await repo.users.get(uid)
     return user or {}
 
 
@@ -828,9 +874,9 @@ async def authenticate_user(user: User, x_max_init_data: Optional[str] = Header(
         "role": user.role,
         "university_id": user.university_id or 1
     }
-    existing_user = database.get_user(user.max_user_id)
+    existing_user = await repo.users.get(user.max_user_id)
     if existing_user:
-        database.update_user_profile(
+        await repo.users.update_profile(
             user.max_user_id,
             first_name=user_data["first_name"],
             last_name=user_data["last_name"],
@@ -839,10 +885,10 @@ async def authenticate_user(user: User, x_max_init_data: Optional[str] = Header(
             language_code=user_data["language_code"],
         )
         if user.role:
-            database.update_user_role(user.max_user_id, user.role, user_data["university_id"])
-        updated = database.get_user(user.max_user_id)
+            await repo.users.update_role(user.max_user_id, user.role, user_data["university_id"])
+        updated = await repo.users.get(user.max_user_id)
         return {"user": updated, "new_user": False, "message": "User updated"}
-    new_user = database.create_user(user_data)
+    new_user = await repo.users.create(user_data)
     return {"user": new_user, "new_user": True, "message": "User created successfully"}
 
 @app.put("/api/users/role")
@@ -855,7 +901,7 @@ async def update_user_role(
     Обновление роли пользователя
     """
     # Проверяем наличие пользователя в БД
-    existing_user = database.get_user(user_id)
+    existing_user = await repo.users.get(user_id)
     if not existing_user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -864,8 +910,8 @@ async def update_user_role(
         raise HTTPException(status_code=400, detail=f"Invalid role. Must be one of {valid_roles}")
     
     # Обновляем роль в БД
-    database.update_user_role(user_id, role, university_id or 1)
-    updated_user = database.get_user(user_id)
+    await repo.users.update_role(user_id, role, university_id or 1)
+    updated_user = await repo.users.get(user_id)
     
     return {
         "user": updated_user,
@@ -873,25 +919,25 @@ async def update_user_role(
     }
 
 @app.get("/api/universities/{university_id}")
-async def get_university(university_id: int):
+async def get_university(university_id: int, request: Request):
     """
     Получение информации о университете
     """
-    import sqlite3
-    conn = sqlite3.connect(database.UNIVERSITIES_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM universities WHERE id = ?", (university_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    if not row:
+    payload = await config_cache.cache.get_or_load(
+        ("university", university_id), lambda: _load_university_payload(university_id)
+    )
+    if payload is None:
         raise HTTPException(status_code=404, detail="University not found")
     
-    return dict(row)
+    return http_cache.respond(request, payload, "university")
+
+
+async def _load_university_payload(university_id: int) -> Optional[http_cache.JSONPayload]:
+    university = await repo.universities.get(university_id)
+    return http_cache.json_payload(university) if university else None
 
 @app.get("/api/universities/{university_id}/blocks")
-async def get_blocks_config(university_id: int, role: str):
+async def get_blocks_config(university_id: int, role: str, request: Request):
     """
     Получение конфигурации блоков для роли из БД
     """
@@ -899,19 +945,19 @@ async def get_blocks_config(university_id: int, role: str):
     if role not in valid_roles:
         raise HTTPException(status_code=400, detail=f"Invalid role. Must be one of {valid_roles}")
     
+    payload = await config_cache.cache.get_or_load(
+        ("blocks", university_id, role), lambda: _load_blocks_config(university_id, role)
+    )
+    return http_cache.respond(request, payload, "blocks")
+
+
+async def _load_blocks_config(university_id: int, role: str) -> http_cache.JSONPayload:
     # Получаем конфигурацию из БД
-    config = database.get_university_config(university_id, role)
+    config = await repo.config.get_university_config(university_id, role)
     
     # Получаем название университета
-    import sqlite3
-    conn = sqlite3.connect(database.UNIVERSITIES_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT name, short_name FROM universities WHERE id = ?", (university_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    university_name = row["name"] if row else "Университет"
+    university = await repo.universities.get(university_id)
+    university_name = university["name"] if university else "Университет"
     
     # Преобразуем структуру для совместимости
     all_blocks = []
@@ -919,13 +965,13 @@ async def get_blocks_config(university_id: int, role: str):
         for block in section["blocks"]:
             all_blocks.append(block["block_type"])
     
-    return {
+    return http_cache.json_payload({
         "blocks": all_blocks,
         "sections": config["sections"],
         "university_name": university_name,
         "header_color": config["header_color"],
         "role": role
-    }
+    })
 
 @app.get("/api/schedule")
 async def get_schedule(
@@ -944,7 +990,7 @@ async def get_schedule(
     # Получаем роль пользователя если есть
     role = None
     if user_id:
-        user = database.get_user(user_id)
+        user = await repo.users.get(user_id)
         if user:
             role = user.get("role")
     
@@ -1153,15 +1199,9 @@ async def get_events(university_id: Optional[int] = None):
     # Получаем название университета
     university_name = "Российская академия народного хозяйства"
     if university_id:
-        import sqlite3
-        conn = sqlite3.connect(database.UNIVERSITIES_DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM universities WHERE id = ?", (university_id,))
-        row = cursor.fetchone()
-        if row:
-            university_name = row["name"]
-        conn.close()
+        university = await repo.universities.get(university_id)
+        if university:
+            university_name = university["name"]
     
     mock_events = [
         {
@@ -1205,7 +1245,7 @@ async def register_for_event(
         user_id = 10001  # Дефолтный тестовый ID
     
     # Сохраняем регистрацию в БД
-    success = database.register_for_event(event_id, user_id)
+    success = await repo.events.register(event_id, user_id)
     
     if not success:
         raise HTTPException(status_code=400, detail="Already registered for this event")
@@ -1226,7 +1266,7 @@ async def get_user_registrations(user_id: Optional[int] = Header(None, alias="X-
         # В мок-режиме используем дефолтный ID
         user_id = 10001
     
-    event_ids = database.get_user_event_registrations(user_id)
+    event_ids = await repo.events.get_user_registrations(user_id)
     return {"event_ids": event_ids}
 
 class EventCreate(BaseModel):
@@ -1249,7 +1289,7 @@ async def create_event(
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID required")
     
-    user = database.get_user(user_id)
+    user = await repo.users.get(user_id)
     if not user or user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Only university admins can create events")
     
@@ -1284,7 +1324,7 @@ async def create_schedule_item(
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID required")
     
-    user = database.get_user(user_id)
+    user = await repo.users.get(user_id)
     if not user or user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Only university admins can create schedule items")
     
@@ -1306,7 +1346,7 @@ async def delete_schedule_item(
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID required")
     
-    user = database.get_user(user_id)
+    user = await repo.users.get(user_id)
     if not user or user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Only university admins can delete schedule items")
     
@@ -1384,7 +1424,7 @@ HUB_FEED_MOCK_POSTS = [
 def _is_post_from_excluded_source(post: dict) -> bool:
     """Проверяет, что пост от источника 1924118717 (исключаем из ленты)."""
     sid = HUB_FEED_EXCLUDED_SOURCE_ID
-    for key in ("channel_id", "source_id", "channel", "source"):
+    for key in ("channel_id", "channelId", "source_id", "channel", "source"):
         val = post.get(key)
         if val is None:
             continue
@@ -1393,47 +1433,152 @@ def _is_post_from_excluded_source(post: dict) -> bool:
     return False
 
 
+# Кэш страниц ленты по (limit, offset, channel): свежая запись — HUB_FEED_CACHE_TTL секунд,
+# затем ещё HUB_FEED_STALE_TTL секунд отдаётся с обновлением в фоне (swr_cache.py)
+hub_feed_cache = swr_cache.SWRCache(
+    "hub_feed",
+    ttl=float(os.environ.get("HUB_FEED_CACHE_TTL", 30.0)),
+    stale_ttl=float(os.environ.get("HUB_FEED_STALE_TTL", 300.0)),
+    max_entries=int(os.environ.get("HUB_FEED_CACHE_SIZE", 512)),
+)
+
+
+async def _fetch_upstream_json(upstream: str, url: str, params: Optional[Dict[str, Any]] = None,
+                               timeout: Optional[float] = None) -> Any:
+    """GET к внешнему сервису; одновременные одинаковые запросы (URL + параметры) делят один вызов."""
+    timeout = timeout or http_clients.UPSTREAMS[upstream].timeout
+
+    async def fetch():
+        client = http_clients.registry.get(upstream)
+        r = await client.get(url, params=params, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    return await single_flight.group.do(single_flight.key(url, params), fetch, timeout=timeout)
+
+
+async def _fetch_hub_feed(limit: int, offset: int, channel: Optional[str]) -> Dict[str, Any]:
+    """Страница ленты cold_news как есть: {"posts": [...], "total": N}."""
+    params = {"limit": limit, "offset": offset, "exclude_channel": HUB_FEED_EXCLUDED_SOURCE_ID}
+    if channel:
+        params["channel"] = channel
+    return await _fetch_upstream_json("hub", f"{COLD_NEWS_FEED_URL}/api/feed", params)
+
+
+def _hub_feed_upstream(channel: Optional[str]) -> feed_cursor.UpstreamFetcher:
+    """Чтение постов cold_news для ленты по курсору: из снимка предзагрузки или запросом с before."""
+    async def fetch(after: Optional[feed_cursor.PostKey], upstream_offset: int, limit: int) -> Dict[str, Any]:
+        data = hub_prefetch.prefetcher.upstream_after(channel, after, limit)
+        if data is not None:
+            return data
+        if after is None:
+            return await _fetch_hub_feed(limit, 0, channel)
+        params = {"limit": limit, "before": feed_cursor.format_key(after),
+                  "exclude_channel": HUB_FEED_EXCLUDED_SOURCE_ID}
+        if channel:
+            params["channel"] = channel
+        data = await _fetch_upstream_json("hub", f"{COLD_NEWS_FEED_URL}/api/feed", params)
+        posts = data.get("posts", [])
+        if posts and feed_cursor.post_key(posts[0]) >= after:
+            # cold_news без поддержки before отдал начало ленты — читаем дальше по смещению
+            data = await _fetch_hub_feed(limit, upstream_offset, channel)
+        return data
+
+    return fetch
+
+
+async def _load_hub_feed_by_cursor(limit: int, cursor: Optional[str], channel: Optional[str]) -> http_cache.JSONPayload:
+    """Страница ленты по курсору: посты cold_news и моковые новости, слитые по дате."""
+    page = await feed_cursor.merged_page(_hub_feed_upstream(channel), HUB_FEED_MOCK_POSTS,
+                                         _is_post_from_excluded_source, cursor, limit)
+    page["has_more"] = page["next_cursor"] is not None
+    return http_cache.json_payload(page)
+
+
+def _build_hub_feed_page(raw_posts: List[Dict], total: int, offset: int) -> Dict[str, Any]:
+    """Страница ленты для клиента: без источника 1924118717, с моковыми новостями на первой странице."""
+    # Убираем все посты от источника 1924118717
+    posts = [p for p in raw_posts if not _is_post_from_excluded_source(p)]
+    removed = len(raw_posts) - len(posts)
+    total = max(0, total - removed)
+
+    # На первой странице в начало ленты добавляем моковые новости
+    if offset == 0:
+        posts = list(HUB_FEED_MOCK_POSTS) + posts
+        total += len(HUB_FEED_MOCK_POSTS)
+
+    return {"posts": posts, "total": total}
+
+
+async def _load_hub_feed(limit: int, offset: int, channel: Optional[str]) -> http_cache.JSONPayload:
+    """Загрузить страницу ленты из cold_news и собрать ответ клиенту."""
+    data = await _fetch_hub_feed(limit, offset, channel)
+    raw_posts = data.get("posts", [])
+    return http_cache.json_payload(_build_hub_feed_page(raw_posts, data.get("total", len(raw_posts)), offset))
+
+
+async def _fetch_hub_channels() -> List[str]:
+    """Каналы из /api/sources cold_news (для предзагрузки лент каналов)."""
+    data = await _fetch_upstream_json("hub", f"{COLD_NEWS_FEED_URL}/api/sources", timeout=5.0)
+    channels = []
+    for source in data.get("sources", []):
+        name = source.get("name") if isinstance(source, dict) else source
+        if isinstance(name, str) and name:
+            channels.append(name)
+    return channels
+
+
 @app.get("/api/hub/feed")
 async def get_hub_feed(
+    request: Request,
     limit: Optional[int] = 20,
-    offset: Optional[int] = 0,
+    offset: Optional[int] = None,
     channel: Optional[str] = None,
+    cursor: Optional[str] = None,
 ):
-    """Proxy to cold_news feed API for Hub page. Исключаем источник 1924118717, добавляем моковые новости."""
+    """
+    Лента хаба из cold_news: исключаем источник 1924118717, добавляем моковые новости.
+    По умолчанию — страницы по курсору (feed_cursor.py): ровно limit постов, следующая страница —
+    cursor=next_cursor из ответа, has_more=false на последней. Запрос с offset — прежний режим
+    проксирования по смещению (моковые новости только на первой странице).
+    Первые страницы отдаются из снимка фоновой предзагрузки (hub_prefetch.py), остальные кэшируются
+    (stale-while-revalidate); при недоступности cold_news отдаётся последняя загруженная страница.
+    """
+    limit = min(limit or 20, 100)
+    if offset is None:
+        if cursor:
+            try:
+                feed_cursor.decode_cursor(cursor)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        try:
+            payload = await hub_feed_cache.get(
+                ("cursor", limit, cursor or None, channel or None),
+                lambda: _load_hub_feed_by_cursor(limit, cursor, channel or None)
+            )
+        except Exception as e:
+            print(f"Hub feed proxy error: {e}")
+            return {"posts": [], "total": 0, "next_cursor": None, "has_more": False}
+        return http_cache.respond(request, payload, "hub_feed")
+
+    payload = hub_prefetch.prefetcher.feed_page(limit, offset, channel or None)
+    if payload is not None:
+        return http_cache.respond(request, payload, "hub_feed")
     try:
-        params = {"limit": min(limit or 20, 100), "offset": offset or 0}
-        if channel:
-            params["channel"] = channel
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.get(f"{COLD_NEWS_FEED_URL}/api/feed", params=params)
-            r.raise_for_status()
-            data = r.json()
-        raw_posts = data.get("posts", [])
-        total = data.get("total", len(raw_posts))
-
-        # Убираем все посты от источника 1924118717
-        posts = [p for p in raw_posts if not _is_post_from_excluded_source(p)]
-        removed = len(raw_posts) - len(posts)
-        total = max(0, total - removed)
-
-        # На первой странице в начало ленты добавляем моковые новости
-        if offset == 0 or offset is None:
-            posts = list(HUB_FEED_MOCK_POSTS) + posts
-            total += len(HUB_FEED_MOCK_POSTS)
-
-        return {"posts": posts, "total": total}
+        payload = await hub_feed_cache.get(
+            (limit, offset, channel or None),
+            lambda: _load_hub_feed(limit, offset, channel)
+        )
     except Exception as e:
         print(f"Hub feed proxy error: {e}")
         return {"posts": [], "total": 0}
+    return http_cache.respond(request, payload, "hub_feed")
 
 @app.get("/api/hub/sources")
 async def get_hub_sources():
     """Proxy to cold_news sources API for Hub feed source selector."""
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            r = await client.get(f"{COLD_NEWS_FEED_URL}/api/sources")
-            r.raise_for_status()
-            return r.json()
+        return await _fetch_upstream_json("hub", f"{COLD_NEWS_FEED_URL}/api/sources", timeout=5.0)
     except Exception as e:
         print(f"Hub sources proxy error: {e}")
         return {"sources": []}
@@ -1443,25 +1588,34 @@ EVENTS_API_URL = os.environ.get("EVENTS_API_URL", "").rstrip("/")
 EVENTS_BOT_LINK = os.environ.get("EVENTS_BOT_LINK", "https://t.me/event_ranepa_bot")
 EVENTS_API_SECRET = os.environ.get("EVENTS_API_SECRET", "").strip()
 
+async def _fetch_external_events(limit: int) -> Optional[Dict[str, Any]]:
+    """Список мероприятий {"events": [...], "bot_link": ...} из API мероприятий; None, если API не настроен."""
+    if not EVENTS_API_URL:
+        return None
+    raw = await _fetch_upstream_json("events", f"{EVENTS_API_URL}/events", {"limit": limit})
+    if isinstance(raw, list):
+        return {"events": raw, "bot_link": EVENTS_BOT_LINK}
+    return {"events": raw.get("events", raw.get("items", [])), "bot_link": raw.get("bot_link", EVENTS_BOT_LINK)}
+
+
 @app.get("/api/external/events")
 async def get_external_events(request: Request, limit: Optional[int] = 10):
     """Proxy to external events API (Public Events API). Returns list of events and bot_link. In browser returns HTML."""
+    payload = None
     if not EVENTS_API_URL:
         data = {"events": [], "bot_link": EVENTS_BOT_LINK}
     else:
         limit_val = min(limit or 10, 50)
-        try:
-            async with httpx.AsyncClient(timeout=8.0) as client:
-                r = await client.get(f"{EVENTS_API_URL}/events", params={"limit": limit_val})
-                r.raise_for_status()
-                raw = r.json()
-                if isinstance(raw, list):
-                    data = {"events": raw, "bot_link": EVENTS_BOT_LINK}
-                else:
-                    data = {"events": raw.get("events", raw.get("items", [])), "bot_link": raw.get("bot_link", EVENTS_BOT_LINK)}
-        except Exception as e:
-            print(f"External events proxy error: {e}")
-            data = {"events": [], "bot_link": EVENTS_BOT_LINK}
+        # Список из снимка фоновой предзагрузки; если его нет — запрос к API мероприятий
+        snapshot = hub_prefetch.prefetcher.events(limit_val)
+        if snapshot is not None:
+            data, payload = snapshot
+        else:
+            try:
+                data = await _fetch_external_events(limit_val)
+            except Exception as e:
+                print(f"External events proxy error: {e}")
+                data = {"events": [], "bot_link": EVENTS_BOT_LINK}
 
     accept = (request.headers.get("accept") or "").lower()
     if "text/html" in accept or request.query_params.get("format") == "html":
@@ -1491,6 +1645,8 @@ async def get_external_events(request: Request, limit: Optional[int] = 10):
             )
         html_parts.append(f"<p><small>JSON: <a href='?format=json'>?format=json</a></small></p></body></html>")
         return HTMLResponse("".join(html_parts))
+    if payload is not None:
+        return http_cache.respond(request, payload, "external_events")
     return data
 
 @app.get("/api/external/events/{event_id}")
@@ -1499,10 +1655,10 @@ async def get_external_event_detail(event_id: str):
     if not EVENTS_API_URL:
         raise HTTPException(status_code=404, detail="External events API not configured")
     try:
-        async with httpx.AsyncClient(timeout=8.0) as client:
-            r = await client.get(f"{EVENTS_API_URL}/events/{event_id}")
-            r.raise_for_status()
-            return r.json()
+        client = http_clients.registry.get("events")
+        r = await client.get(f"{EVENTS_API_URL}/events/{event_id}")
+        r.raise_for_status()
+        return r.json()
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail="Event not found")
     except Exception as e:
@@ -1544,14 +1700,15 @@ async def register_external_event(
         "event_id": body.event_id,
     }
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.post(
-                f"{EVENTS_API_URL}/register",
-                json=payload,
-                headers={"X-Events-Api-Key": EVENTS_API_SECRET, "Content-Type": "application/json"},
-            )
-            r.raise_for_status()
-            return r.json()
+        client = http_clients.registry.get("events")
+        r = await client.post(
+            f"{EVENTS_API_URL}/register",
+            json=payload,
+            headers={"X-Events-Api-Key": EVENTS_API_SECRET, "Content-Type": "application/json"},
+            timeout=10.0,
+        )
+        r.raise_for_status()
+        return r.json()
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail=e.response.text or "Registration failed")
     except Exception as e:
@@ -1583,8 +1740,15 @@ class SectionNameUpdate(BaseModel):
 class HeaderColorUpdate(BaseModel):
     color: str
 
+class OrderMove(BaseModel):
+    id: int
+    order_index: int  # новая позиция внутри раздела (для блоков) или среди разделов роли
+
+
 class BlockReorder(BaseModel):
-    block_ids: List[int]
+    """Полный новый порядок (block_ids) или только перемещённые элементы (moves)."""
+    block_ids: Optional[List[int]] = None
+    moves: Optional[List[OrderMove]] = None
 
 class BlockAdd(BaseModel):
     block_type: str
@@ -1606,15 +1770,18 @@ class TemplateSave(BaseModel):
 # ============ АДМИН-ПАНЕЛЬ API ============
 
 @app.get("/api/admin/config/{university_id}/{role}")
-async def get_admin_config(university_id: int, role: str):
+async def get_admin_config(university_id: int, role: str, request: Request):
     """Получить конфигурацию для редактирования (только для админов)"""
-    config = database.get_university_config(university_id, role)
-    return config
+    async def load():
+        return http_cache.json_payload(await repo.config.get_university_config(university_id, role))
+    payload = await config_cache.cache.get_or_load(("config", university_id, role), load)
+    return http_cache.respond(request, payload, "admin_config")
 
 @app.put("/api/admin/sections/{section_id}/name")
 async def update_section_name(section_id: int, data: SectionNameUpdate):
     """Обновить название раздела"""
-    database.update_section_name(section_id, data.name)
+    await repo.config.update_section_name(section_id, data.name)
+    config_cache.cache.bump()
     return {"success": True, "message": "Section name updated"}
 
 @app.put("/api/admin/config/{university_id}/{role}/header-color")
@@ -1624,68 +1791,74 @@ async def update_header_color_endpoint(
     data: HeaderColorUpdate
 ):
     """Обновить цвет хедера для роли"""
-    database.update_header_color(university_id, role, data.color)
+    await repo.config.update_header_color(university_id, role, data.color)
+    config_cache.cache.bump()
     return {"success": True, "message": "Header color updated"}
 
 @app.post("/api/admin/blocks/reorder")
 async def reorder_blocks_endpoint(data: BlockReorder):
     """Изменить порядок блоков (drag & drop)"""
-    database.reorder_blocks(data.block_ids)
-    return {"success": True, "message": "Blocks reordered"}
+    if data.moves:
+        updated = await repo.config.move_blocks([(m.id, m.order_index) for m in data.moves])
+    elif data.block_ids is not None:
+        updated = await repo.config.reorder_blocks(data.block_ids)
+    else:
+        raise HTTPException(status_code=400, detail="block_ids or moves required")
+    if updated:
+        config_cache.cache.bump()
+    return {"success": True, "message": "Blocks reordered", "updated": updated}
 
 @app.post("/api/admin/sections/{section_id}/blocks")
 async def add_block_endpoint(section_id: int, data: BlockAdd):
     """Добавить блок в раздел"""
-    block_id = database.add_block(section_id, data.block_type, data.name, data.order_index)
+    block_id = await repo.config.add_block(section_id, data.block_type, data.name, data.order_index)
+    config_cache.cache.bump()
     return {"success": True, "block_id": block_id}
 
 @app.delete("/api/admin/blocks/{block_id}")
 async def delete_block_endpoint(block_id: int):
     """Удалить блок"""
-    database.delete_block(block_id)
+    await repo.config.delete_block(block_id)
+    config_cache.cache.bump()
     return {"success": True, "message": "Block deleted"}
 
 @app.post("/api/admin/sections")
 async def add_section_endpoint(data: SectionAdd):
     """Добавить новый раздел"""
-    section_id = database.add_section(data.university_id, data.role, data.name, data.header_color)
+    section_id = await repo.config.add_section(data.university_id, data.role, data.name, data.header_color)
+    config_cache.cache.bump()
     return {"success": True, "section_id": section_id}
 
 @app.post("/api/admin/sections/reorder")
 async def reorder_sections_endpoint(data: BlockReorder):
     """Изменить порядок разделов (drag & drop)"""
-    # Обновляем order_index для разделов
-    import sqlite3
-    conn = sqlite3.connect(database.CONFIG_DB_PATH)
-    cursor = conn.cursor()
-    
-    for index, section_id in enumerate(data.block_ids):
-        cursor.execute("""
-            UPDATE sections 
-            SET order_index = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (index, section_id))
-    
-    conn.commit()
-    conn.close()
-    return {"success": True, "message": "Sections reordered"}
+    if data.moves:
+        updated = await repo.config.move_sections([(m.id, m.order_index) for m in data.moves])
+    elif data.block_ids is not None:
+        updated = await repo.config.reorder_sections(data.block_ids)
+    else:
+        raise HTTPException(status_code=400, detail="block_ids or moves required")
+    if updated:
+        config_cache.cache.bump()
+    return {"success": True, "message": "Sections reordered", "updated": updated}
 
 @app.delete("/api/admin/sections/{section_id}")
 async def delete_section_endpoint(section_id: int):
     """Удалить раздел"""
-    database.delete_section(section_id)
+    await repo.config.delete_section(section_id)
+    config_cache.cache.bump()
     return {"success": True, "message": "Section deleted"}
 
 @app.get("/api/admin/templates")
 async def get_templates_endpoint(role: Optional[str] = None):
     """Получить шаблоны"""
-    templates = database.get_templates(role)
+    templates = await repo.config.get_templates(role)
     return {"templates": templates}
 
 @app.post("/api/admin/templates")
 async def save_template_endpoint(data: TemplateSave):
     """Сохранить шаблон"""
-    template_id = database.save_template(data.name, data.description, data.role, data.config)
+    template_id = await repo.config.save_template(data.name, data.description, data.role, data.config)
     return {"success": True, "template_id": template_id}
 
 # ============ МОДЕРАЦИЯ КАСТОМНЫХ БЛОКОВ ============
@@ -1708,11 +1881,11 @@ async def submit_custom_block_endpoint(data: CustomBlockSubmit, user_id: int = H
         raise HTTPException(status_code=401, detail="User ID required")
     
     # Проверяем, что пользователь - админ университета
-    user = database.get_user(user_id)
+    user = await repo.users.get(user_id)
     if not user or user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Only university admins can submit custom blocks")
     
-    block_id = database.submit_custom_block(
+    block_id = await repo.config.submit_custom_block(
         university_id=user.get("university_id", 1),
         submitted_by_user_id=user_id,
         block_type=data.block_type,
@@ -1733,7 +1906,7 @@ async def get_pending_blocks_endpoint(user_id: int = Header(None, alias="X-MAX-U
     # TODO: Проверка на суперадмина приложения
     # Пока возвращаем для всех админов
     
-    blocks = database.get_pending_custom_blocks()
+    blocks = await repo.config.get_pending_custom_blocks()
     return {"blocks": blocks}
 
 @app.post("/api/admin/custom-blocks/{block_id}/review")
@@ -1748,13 +1921,13 @@ async def review_custom_block_endpoint(
     
     # TODO: Проверка на суперадмина приложения
     
-    database.review_custom_block(block_id, user_id, data.status, data.review_notes)
+    await repo.config.review_custom_block(block_id, user_id, data.status, data.review_notes)
     return {"success": True, "message": f"Block {data.status}"}
 
 @app.get("/api/admin/custom-blocks/approved")
 async def get_approved_blocks_endpoint(university_id: Optional[int] = None):
     """Получить одобренные кастомные блоки"""
-    blocks = database.get_approved_custom_blocks(university_id)
+    blocks = await repo.config.get_approved_custom_blocks(university_id)
     return {"blocks": blocks}
 
 # ============ КОДЫ ПРИГЛАШЕНИЯ ============
@@ -1770,25 +1943,19 @@ async def use_invitation_code_endpoint(data: InvitationCodeUse, user_id: Optiona
         user_id = 10001  # Fallback для мок-режима
     
     # Получаем пользователя по max_user_id
-    user = database.get_user(user_id)
+    user = await repo.users.get(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Используем внутренний ID пользователя для связи с кодом
     internal_user_id = user["id"]
     
-    result = database.use_invitation_code(data.code, internal_user_id)
+    # Код и пользователь обновляются одним вызовом: повторное или одновременное использование
+    # того же кода получает 400
+    result = await repo.codes.redeem(data.code, internal_user_id, user["max_user_id"])
     if not result:
         raise HTTPException(status_code=400, detail="Invalid or expired invitation code")
     
-    # Обновляем пользователя
-    database.update_user_with_invitation_code(
-        user["max_user_id"],
-        result["id"],
-        result["role"],
-        result["university_id"]
-    )
-    
     return {
         "success": True,
         "university_id": result["university_id"],
@@ -1810,14 +1977,14 @@ async def generate_invitation_codes_endpoint(
     if not user_id:
         user_id = 10001  # Fallback для мок-режима
     
-    user = database.get_user(user_id)
+    user = await repo.users.get(user_id)
     if not user or user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Only university admins can generate codes")
     
     # Используем внутренний ID пользователя
     internal_user_id = user["id"]
     
-    codes = database.generate_invitation_codes_batch(
+    codes = await repo.codes.generate_batch(
         data.university_id,
         data.role,
         internal_user_id,
@@ -1826,22 +1993,43 @@ async def generate_invitation_codes_endpoint(
     
     return {"success": True, "codes": codes, "count": len(codes)}
 
+INVITATION_CODES_PAGE_SIZE = 100
+INVITATION_CODES_MAX_PAGE_SIZE = 500
+
 @app.get("/api/admin/invitation-codes")
 async def get_invitation_codes_endpoint(
     university_id: int,
     used: Optional[bool] = None,
+    role: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    summary: bool = False,
     user_id: Optional[int] = Header(None, alias="X-MAX-User-ID")
 ):
-    """Получить коды приглашения"""
+    """
+    Получить коды приглашения постранично (новые сначала).
+    Следующая страница — с cursor=next_cursor из ответа; summary=true — только количество кодов.
+    Без limit, cursor и role — прежний ответ: все коды университета одним списком {"codes": [...]}.
+    """
     if not user_id:
         user_id = 10001  # Fallback для мок-режима
     
-    user = database.get_user(user_id)
+    user = await repo.users.get(user_id)
     if not user or user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Only university admins can view codes")
     
-    codes = database.get_invitation_codes_by_university(university_id, used)
-    return {"codes": codes}
+    if summary:
+        return {"summary": await repo.codes.get_summary(university_id)}
+    
+    if limit is None and not cursor and not role:
+        return {"codes": await repo.codes.get_by_university(university_id, used)}
+    
+    limit = max(1, min(limit or INVITATION_CODES_PAGE_SIZE, INVITATION_CODES_MAX_PAGE_SIZE))
+    try:
+        page = await repo.codes.get_page(university_id, used, role, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"codes": page["codes"], "next_cursor": page["next_cursor"], "has_more": page["next_cursor"] is not None}
 
 class StudentsImport(BaseModel):
     university_id: int
@@ -1856,14 +2044,14 @@ async def import_students_endpoint(
     if not user_id:
         user_id = 10001  # Fallback для мок-режима
     
-    user = database.get_user(user_id)
+    user = await repo.users.get(user_id)
     if not user or user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Only university admins can import students")
     
     # Используем внутренний ID пользователя
     internal_user_id = user["id"]
     
-    results = database.import_students_and_generate_codes(
+    results = await repo.codes.import_students(
         data.university_id,
         data.students,
         internal_user_id
@@ -1871,30 +2059,128 @@ async def import_students_endpoint(
     
     return {"success": True, "results": results, "count": len(results)}
 
+IMPORT_JOBS_DIR = Path(database.DB_DIR) / "imports"
+
+async def _require_import_admin(user_id: Optional[int]) -> Dict:
+    if not user_id:
+        user_id = 10001  # Fallback для мок-режима
+    user = await repo.users.get(user_id)
+    if not user or user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Only university admins can import students")
+    return user
+
+def _get_import_job(job_id: str) -> "import_jobs.ImportJob":
+    job = import_jobs.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+@app.post("/api/admin/invitation-codes/import-students/upload")
+async def import_students_upload_endpoint(
+    university_id: int = Form(...),
+    file: UploadFile = File(...),
+    user_id: Optional[int] = Header(None, alias="X-MAX-User-ID")
+):
+    """
+    Импорт студентов из файла CSV (или XLSX, если установлен openpyxl) фоновой задачей.
+    Файл пишется на диск по кускам, ответ — id задачи; прогресс и результат — по import-jobs/{id}.
+    """
+    user = await _require_import_admin(user_id)
+    file_format = import_jobs.supported_format(file.filename)
+    if file_format is None:
+        raise HTTPException(status_code=400, detail="Unsupported file format (expected .csv or .xlsx)")
+    
+    job = import_jobs.jobs.create(IMPORT_JOBS_DIR, university_id, user["id"], file_format, file.filename)
+    size = 0
+    out = await asyncio.to_thread(open, job.source, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > import_jobs.MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=400, detail=f"File too large (max {import_jobs.MAX_UPLOAD_BYTES // (1024*1024)} MB)")
+            await asyncio.to_thread(out.write, chunk)
+        await asyncio.to_thread(out.close)
+    except BaseException:
+        await asyncio.to_thread(out.close)
+        import_jobs.jobs.discard(job)
+        raise
+    
+    import_jobs.jobs.start(job)
+    return {"success": True, "job": job.to_dict()}
+
+@app.get("/api/admin/invitation-codes/import-jobs/{job_id}")
+async def get_import_job_endpoint(
+    job_id: str,
+    user_id: Optional[int] = Header(None, alias="X-MAX-User-ID")
+):
+    """Статус и прогресс задачи импорта"""
+    await _require_import_admin(user_id)
+    return {"job": _get_import_job(job_id).to_dict()}
+
+@app.get("/api/admin/invitation-codes/import-jobs/{job_id}/result")
+async def get_import_job_result_endpoint(
+    job_id: str,
+    user_id: Optional[int] = Header(None, alias="X-MAX-User-ID")
+):
+    """
+    Скачать CSV с кодами (student_name, student_id, role, code) завершённой задачи.
+    Для прерванной задачи (failed / cancelled) — уже созданные коды (processed), заголовок X-Import-Partial: true.
+    """
+    await _require_import_admin(user_id)
+    job = _get_import_job(job_id)
+    if not job.result_available:
+        raise HTTPException(status_code=409, detail=f"Import job is {job.status}")
+    partial = job.status != "done"
+    return FileResponse(
+        job.result,
+        media_type="text/csv; charset=utf-8",
+        filename=f"invitation_codes_{job.university_id}_{job.id[:8]}{'_partial' if partial else ''}.csv",
+        headers={"X-Import-Partial": "true" if partial else "false"}
+    )
+
 # ============ ЗАЯВЛЕНИЯ АБИТУРИЕНТОВ ============
 
+# Список уровней постоянный — тело ответа и ETag собираются один раз
+_EDUCATION_LEVELS_PAYLOAD = http_cache.json_payload(
+    {"levels": [{"id": level, "name": level.capitalize()} for level in database.get_education_levels()]}
+)
+
 @app.get("/api/admission/levels")
-async def get_education_levels():
+async def get_education_levels(request: Request):
     """Получить список уровней образования"""
-    levels = database.get_education_levels()
-    return {"levels": [{"id": level, "name": level.capitalize()} for level in levels]}
+    return http_cache.respond(request, _EDUCATION_LEVELS_PAYLOAD, "admission_levels")
 
 @app.get("/api/admission/directions")
 async def get_admission_directions(
     university_id: int,
-    education_level: str
+    education_level: str,
+    request: Request,
+    sort: Optional[str] = None,
+    order: str = "asc",
+    exam: Optional[str] = None
 ):
-    """Получить направления подготовки для уровня образования"""
-    directions = database.get_admission_directions(university_id, education_level)
-    return {"directions": directions}
+    """
+    Получить направления подготовки для уровня образования (из каталога в памяти).
+    sort — code / name / cost_per_year, order — asc / desc, exam — только направления с этим экзаменом.
+    """
+    try:
+        payload = await admission_catalog.catalog.listing(
+            university_id, education_level, sort, order.lower() == "desc", exam
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return http_cache.respond(request, payload, "admission_directions")
 
 @app.get("/api/admission/directions/{direction_id}")
-async def get_admission_direction(direction_id: int):
+async def get_admission_direction(direction_id: int, request: Request):
     """Получить направление подготовки по ID"""
-    direction = database.get_admission_direction(direction_id)
-    if not direction:
+    payload = await admission_catalog.catalog.direction(direction_id)
+    if payload is None:
         raise HTTPException(status_code=404, detail="Direction not found")
-    return direction
+    return http_cache.respond(request, payload, "admission_direction")
 
 class ApplicationSubmit(BaseModel):
     user_id: int
@@ -1915,13 +2201,13 @@ async def submit_application_endpoint(
         user_id = 10001  # Fallback для мок-режима
     
     # Получаем пользователя для получения внутреннего ID
-    user = database.get_user(user_id)
+    user = await repo.users.get(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     internal_user_id = user["id"]
     
-    application_id = database.create_application(
+    application_id = await repo.applications.create(
         internal_user_id,
         data.university_id,
         data.direction_id,
@@ -1942,30 +2228,44 @@ async def get_my_applications_endpoint(
     if not header_user_id:
         header_user_id = 10001  # Fallback для мок-режима
     
-    user = database.get_user(header_user_id)
+    user = await repo.users.get(header_user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     internal_user_id = user["id"]
-    applications = database.get_user_applications(internal_user_id)
+    applications = await repo.applications.get_by_user(internal_user_id)
     
     return {"applications": applications}
 
+APPLICATIONS_PAGE_SIZE = 50
+APPLICATIONS_MAX_PAGE_SIZE = 200
+
 @app.get("/api/admin/applications")
 async def get_pending_applications_endpoint(
     university_id: int,
+    cursor: Optional[str] = None,
+    limit: int = APPLICATIONS_PAGE_SIZE,
     user_id: Optional[int] = Header(None, alias="X-MAX-User-ID")
 ):
-    """Получить заявления на проверку (для админов)"""
+    """Получить заявления на проверку постранично, старые сначала (для админов). Следующая страница — cursor=next_cursor"""
     if not user_id:
         user_id = 10001  # Fallback для мок-режима
     
-    user = database.get_user(user_id)
+    user = await repo.users.get(user_id)
     if not user or user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Only university admins can view applications")
     
-    applications = database.get_pending_applications(university_id)
-    return {"applications": applications}
+    limit = max(1, min(limit, APPLICATIONS_MAX_PAGE_SIZE))
+    try:
+        page = await repo.applications.get_pending_page(university_id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "applications": page["applications"],
+        "next_cursor": page["next_cursor"],
+        "has_more": page["next_cursor"] is not None,
+        "total": page["total"]
+    }
 
 class ApplicationReview(BaseModel):
     status: str  # approved или rejected
@@ -1981,13 +2281,13 @@ async def review_application_endpoint(
     if not user_id:
         user_id = 10001  # Fallback для мок-режима
     
-    user = database.get_user(user_id)
+    user = await repo.users.get(user_id)
     if not user or user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Only university admins can review applications")
     
     internal_user_id = user["id"]
     
-    database.review_application(application_id, internal_user_id, data.status, data.review_notes)
+    await repo.applications.review(application_id, internal_user_id, data.status, data.review_notes)
     
     return {"success": True, "message": f"Application {data.status}"}
 
@@ -1998,6 +2298,12 @@ ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp"}
 ALLOWED_VIDEO_TYPES = {"video/mp4"}
 MAX_IMAGE_BYTES = 5 * 1024 * 1024   # 5 MB
 MAX_VIDEO_BYTES = 15 * 1024 * 1024  # 15 MB
+UPLOAD_CHUNK_BYTES = 256 * 1024     # загрузка читается и пишется кусками, не целиком
+# Файлы stories/{id}/ не меняются после переноса из _pending — кэшируются навсегда
+STORIES_MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+STORIES_PENDING_CACHE_CONTROL = "private, no-cache"
+# Если задан (например, /_stories_media/), байты отдаёт nginx через X-Accel-Redirect
+STORIES_MEDIA_ACCEL_PREFIX = os.environ.get("STORIES_MEDIA_ACCEL_PREFIX", "").strip()
 STORIES_UPLOAD_RATE_PER_HOUR = 30
 STORIES_CREATE_RATE_PER_DAY = 20
 
@@ -2005,10 +2311,10 @@ _stories_upload_count: Dict[int, List[float]] = {}  # max_user_id -> list of tim
 _stories_create_count: Dict[int, List[float]] = {}  # max_user_id -> list of (date, count) or just timestamps
 
 
-def _require_stories_user(header_user_id: Optional[int]) -> Dict:
+async def _require_stories_user(header_user_id: Optional[int]) -> Dict:
     if not header_user_id:
         header_user_id = 10001
-    user = database.get_user(header_user_id)
+    user = await repo.users.get(header_user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -2026,29 +2332,56 @@ class StoryCreate(BaseModel):
     university_id: int = 1
 
 
+async def _save_upload_stream(file: UploadFile, pending_dir: Path, ext: str, max_size: int) -> tuple:
+    """
+    Записать загружаемый файл в pending_dir по кускам UPLOAD_CHUNK_BYTES, считая sha256 в том же проходе.
+    Пишет во временный .part и после успешной загрузки переименовывает в {sha256}-{метка}.{ext}.
+    При превышении max_size прерывает чтение и удаляет частичный файл (HTTPException 400).
+    Возвращает (имя файла, размер в байтах, sha256 hex).
+    """
+    token = uuid.uuid4().hex
+    tmp_path = pending_dir / f"{token}.part"
+    hasher = hashlib.sha256()
+    size = 0
+    out = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(status_code=400, detail=f"File too large (max {max_size // (1024*1024)} MB)")
+            hasher.update(chunk)
+            await asyncio.to_thread(out.write, chunk)
+        await asyncio.to_thread(out.close)
+        sha256 = hasher.hexdigest()
+        name = story_storage.pending_name(sha256, token, ext)
+        await asyncio.to_thread(os.replace, tmp_path, pending_dir / name)
+    except BaseException:
+        await asyncio.to_thread(out.close)
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return name, size, sha256
+
+
 @app.post("/api/stories/upload-media")
 async def upload_story_media(
     file: UploadFile = File(...),
     user_id: Optional[int] = Header(None, alias="X-MAX-User-ID")
 ):
     """Загрузить один файл (фото/видео) для истории. Возвращает media_url для передачи в POST /api/stories."""
-    _require_stories_user(user_id)
+    await _require_stories_user(user_id)
     content_type = (file.content_type or "").strip().lower()
     if content_type not in ALLOWED_IMAGE_TYPES and content_type not in ALLOWED_VIDEO_TYPES:
         raise HTTPException(status_code=400, detail="Allowed types: image/jpeg, image/png, image/webp, video/mp4")
-    contents = await file.read()
     max_size = MAX_VIDEO_BYTES if content_type in ALLOWED_VIDEO_TYPES else MAX_IMAGE_BYTES
-    if len(contents) > max_size:
-        raise HTTPException(status_code=400, detail=f"File too large (max {max_size // (1024*1024)} MB)")
     ext = "jpg" if "jpeg" in content_type else "png" if "png" in content_type else "webp" if "webp" in content_type else "mp4"
     pending_dir = STORIES_MEDIA_DIR / "_pending"
     pending_dir.mkdir(parents=True, exist_ok=True)
-    name = f"{uuid.uuid4().hex}.{ext}"
-    path = pending_dir / name
-    with open(path, "wb") as f:
-        f.write(contents)
+    name, size, sha256 = await _save_upload_stream(file, pending_dir, ext, max_size)
     media_url = f"stories/_pending/{name}"
-    return {"media_url": media_url}
+    return {"media_url": media_url, "size": size, "sha256": sha256}
 
 
 @app.post("/api/stories")
@@ -2057,32 +2390,47 @@ async def create_story_endpoint(
     user_id: Optional[int] = Header(None, alias="X-MAX-User-ID")
 ):
     """Создать историю из загруженных слайдов."""
-    user = _require_stories_user(user_id)
+    user = await _require_stories_user(user_id)
     internal_id = user["id"]
     university_id = user.get("university_id") or data.university_id
     if not data.slides:
         raise HTTPException(status_code=400, detail="At least one slide required")
+    # media_url слайда — только свежая загрузка (stories/_pending/...) или файл хранилища (stories/blobs/...):
+    # на любой другой путь не ведётся учёт ссылок, и collect() удалил бы файл из-под слайда
+    pending = set()  # один и тот же загруженный файл может стоять в нескольких слайдах
+    for slide in data.slides:
+        if not slide.media_url:
+            continue
+        if slide.media_url.startswith("stories/_pending/"):
+            name = slide.media_url[len("stories/_pending/"):]
+            if name in pending:
+                continue
+            if not name or "/" in name or "\\" in name or name.startswith(".") \
+                    or not (STORIES_MEDIA_DIR / "_pending" / name).is_file():
+                raise HTTPException(status_code=400, detail="Uploaded media not found, upload it again")
+            pending.add(name)
+        elif story_storage.parse_blob_media_url(slide.media_url) is None:
+            raise HTTPException(status_code=400, detail="Invalid media_url")
     slides_data = [{"type": s.type, "media_url": s.media_url, "text": s.text, "duration_sec": s.duration_sec} for s in data.slides]
-    story_id = database.create_story(internal_id, university_id, slides_data, status="published")
-    base_dir = STORIES_MEDIA_DIR / str(story_id)
-    base_dir.mkdir(parents=True, exist_ok=True)
+    story_id = await repo.stories.create(internal_id, university_id, slides_data, status="published")
+    moved = []
     for i, slide in enumerate(data.slides):
-        if slide.media_url and slide.media_url.startswith("stories/_pending/"):
-            parts = slide.media_url.replace("\\", "/").split("/")
-            old_path = STORIES_MEDIA_DIR / parts[1] / parts[2] if len(parts) >= 3 else STORIES_MEDIA_DIR / "_pending" / parts[-1]
-            if not old_path.exists():
-                old_path = STORIES_MEDIA_DIR / "_pending" / (slide.media_url.split("/")[-1] if "/" in slide.media_url else slide.media_url)
-            if old_path.exists():
-                ext = old_path.suffix or ".jpg"
-                new_name = f"{i}{ext}"
-                new_path = base_dir / new_name
-                shutil.move(str(old_path), str(new_path))
-                rel = f"stories/{story_id}/{new_name}"
-                conn = sqlite3.connect(database.UNIVERSITIES_DB_PATH)
-                cursor = conn.cursor()
-                cursor.execute("UPDATE story_slides SET media_url = ? WHERE story_id = ? AND position = ?", (rel, story_id, i))
-                conn.commit()
-                conn.close()
+        if not slide.media_url:
+            continue
+        if slide.media_url.startswith("stories/_pending/"):
+            old_path = STORIES_MEDIA_DIR / "_pending" / slide.media_url[len("stories/_pending/"):]
+            # Файл уходит в общее хранилище по хэшу; одинаковые загрузки делят один файл
+            rel = await story_storage.store.attach(STORIES_MEDIA_DIR, story_id, i, old_path)
+            moved.append((i, slide.type, rel))
+        elif not await story_storage.store.attach_existing(STORIES_MEDIA_DIR, story_id, i, slide.media_url):
+            # Файла уже нет — история не создаётся; привязанные выше файлы освободит delete
+            await repo.stories.delete(story_id, internal_id)
+            raise HTTPException(status_code=400, detail="Media file no longer exists")
+        else:
+            # Превью файла уже лежат рядом с ним — обработка только проставит их слайду
+            moved.append((i, slide.type, slide.media_url))
+    # Превью строятся в фоне и появятся в ленте после обработки
+    story_media.pipeline.schedule(STORIES_MEDIA_DIR, story_id, moved)
     return {"success": True, "story_id": story_id}
 
 
@@ -2094,16 +2442,13 @@ async def get_stories_feed_endpoint(
     user_id: Optional[int] = Header(None, alias="X-MAX-User-ID")
 ):
     """Лента историй для главной/хаба."""
-    user = _require_stories_user(user_id)
+    user = await _require_stories_user(user_id)
     uid = user.get("university_id") or university_id or 1
-    items = database.get_stories_feed(uid, limit=limit, offset=offset)
-    story_ids = [s["id"] for s in items]
-    reaction_counts = database.get_story_reaction_counts(story_ids)
-    internal_id = user.get("id")
-    user_reacted_ids = set(database.get_user_reacted_story_ids(internal_id, story_ids)) if internal_id else set()
+    items = await repo.stories.get_feed(uid, limit=limit, offset=offset, viewer_id=user.get("id"))
+    authors = await repo.users.get_by_ids([s["author_id"] for s in items])
     result = []
     for s in items:
-        author = database.get_user_by_id(s["author_id"])
+        author = authors.get(s["author_id"])
         result.append({
             "id": s["id"],
             "author_id": s["author_id"],
@@ -2111,10 +2456,11 @@ async def get_stories_feed_endpoint(
             "avatar_url": author.get("photo_url") if author else None,
             "university_id": s["university_id"],
             "cover_url": s.get("cover_url"),
+            "thumb_url": s.get("thumb_url"),
             "slide_count": s["slide_count"],
             "view_count": s.get("view_count", 0),
-            "reaction_count": reaction_counts.get(s["id"], 0),
-            "user_reacted": s["id"] in user_reacted_ids,
+            "reaction_count": s["reaction_count"],
+            "user_reacted": s["user_reacted"],
             "created_at": s["created_at"],
             "expires_at": s["expires_at"],
         })
@@ -2126,14 +2472,15 @@ async def get_my_stories_endpoint(
     user_id: Optional[int] = Header(None, alias="X-MAX-User-ID")
 ):
     """Мои истории для профиля."""
-    user = _require_stories_user(user_id)
+    user = await _require_stories_user(user_id)
     internal_id = user["id"]
-    items = database.get_my_stories(internal_id)
+    items = await repo.stories.get_my(internal_id)
     result = []
     for s in items:
         result.append({
             "id": s["id"],
             "cover_url": s.get("cover_url"),
+            "thumb_url": s.get("thumb_url"),
             "slide_count": s["slide_count"],
             "view_count": s.get("view_count", 0),
             "created_at": s["created_at"],
@@ -2142,8 +2489,100 @@ async def get_my_stories_endpoint(
     return {"stories": result}
 
 
+def _not_modified_since(header: Optional[str], mtime: float) -> bool:
+    if not header:
+        return False
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def _parse_range(header: str, size: int) -> Optional[tuple]:
+    """
+    Один диапазон bytes=a-b / a- / -n -> (start, end) включительно.
+    None — заголовок не разобран или диапазонов несколько (отдаём файл целиком),
+    (-1, -1) — диапазон вне файла (416).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            start, end = max(0, size - int(last)), size - 1
+    except ValueError:
+        return None
+    if start > end and first and last:
+        return None
+    if start >= size or end < start:
+        return (-1, -1)
+    return start, min(end, size - 1)
+
+
+def _iter_file_range(path: Path, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(UPLOAD_CHUNK_BYTES, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _story_media_response(request: Request, full: Path, rel: str, cache_control: str) -> Response:
+    """Ответ с ETag/Last-Modified, 304 на условные запросы, 206 на Range или X-Accel-Redirect для nginx."""
+    st = full.stat()
+    etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    media_type = mimetypes.guess_type(full.name)[0] or "application/octet-stream"
+
+    if STORIES_MEDIA_ACCEL_PREFIX:
+        # nginx сам обработает Range и условные запросы для internal-локации
+        headers["X-Accel-Redirect"] = STORIES_MEDIA_ACCEL_PREFIX.rstrip("/") + "/" + rel
+        return Response(headers=headers, media_type=media_type)
+
+    if_none_match = request.headers.get("if-none-match")
+    if (if_none_match and http_cache.etag_matches(if_none_match, etag)) or \
+            (not if_none_match and _not_modified_since(request.headers.get("if-modified-since"), st.st_mtime)):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range:
+        # Частичный ответ только если у клиента та же версия файла
+        if if_range.strip().startswith(("\"", "W/")):
+            range_header = range_header if http_cache.etag_matches(if_range, etag) else None
+        elif not _not_modified_since(if_range, st.st_mtime):
+            range_header = None
+    if range_header:
+        byte_range = _parse_range(range_header, st.st_size)
+        if byte_range == (-1, -1):
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{st.st_size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+            headers["Content-Length"] = str(length)
+            return StreamingResponse(_iter_file_range(full, start, length), status_code=206,
+                                     headers=headers, media_type=media_type)
+
+    return FileResponse(full, headers=headers, media_type=media_type, stat_result=st)
+
+
 @app.get("/api/stories/media")
-async def get_story_media_endpoint(path: str):
+async def get_story_media_endpoint(path: str, request: Request):
     """Отдать медиафайл истории по безопасному пути (только stories/...)."""
     safe = database.get_story_media_relative_path(path)
     if not safe:
@@ -2153,7 +2592,8 @@ async def get_story_media_endpoint(path: str):
     root = STORIES_MEDIA_DIR.resolve()
     if not full.exists() or not str(full).startswith(str(root)):
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(full)
+    cache_control = STORIES_PENDING_CACHE_CONTROL if rel.startswith("_pending") else STORIES_MEDIA_CACHE_CONTROL
+    return _story_media_response(request, full, rel.replace(os.sep, "/"), cache_control)
 
 
 @app.get("/api/stories/{story_id}")
@@ -2162,21 +2602,22 @@ async def get_story_endpoint(
     user_id: Optional[int] = Header(None, alias="X-MAX-User-ID")
 ):
     """Детали одной истории (все слайды) для просмотра."""
-    user = _require_stories_user(user_id)
-    story = database.get_story(story_id, include_expired=False)
+    user = await _require_stories_user(user_id)
+    story = await repo.stories.get(story_id, include_expired=False)
     if not story:
         raise HTTPException(status_code=404, detail="Story not found or expired")
-    author = database.get_user_by_id(story["author_id"])
+    author = await repo.users.get_by_id(story["author_id"])
     slides_out = []
     for sl in story.get("slides", []):
         slides_out.append({
             "type": sl["type"],
             "media_url": sl.get("media_url"),
+            "thumb_url": sl.get("thumb_url"),
+            "poster_url": sl.get("poster_url"),
             "text": sl.get("text"),
             "duration_sec": sl.get("duration_sec"),
         })
-    reaction_count = database.get_story_reaction_count(story_id)
-    user_reacted = story_id in database.get_user_reacted_story_ids(user["id"], [story_id])
+    user_reacted = story_id in await repo.stories.get_user_reacted_ids(user["id"], [story_id])
 
     return {
         "id": story["id"],
@@ -2185,7 +2626,7 @@ async def get_story_endpoint(
         "avatar_url": author.get("photo_url") if author else None,
         "slides": slides_out,
         "view_count": story.get("view_count", 0),
-        "reaction_count": reaction_count,
+        "reaction_count": story.get("reaction_count", 0),
         "user_reacted": user_reacted,
         "created_at": story.get("created_at"),
         "expires_at": story["expires_at"],
@@ -2198,10 +2639,9 @@ async def record_story_view_endpoint(
     slide_reached: Optional[int] = None,
     user_id: Optional[int] = Header(None, alias="X-MAX-User-ID")
 ):
-    """Зафиксировать просмотр истории."""
-    user = _require_stories_user(user_id)
-    internal_id = user["id"]
-    database.record_story_view(story_id, internal_id, slide_reached=slide_reached)
+    """Зафиксировать просмотр истории (запись в БД — пакетом из буфера story_views)."""
+    user = await _require_stories_user(user_id)
+    story_views.buffer.add(story_id, user["id"], slide_reached=slide_reached)
     return {"success": True}
 
 
@@ -2211,11 +2651,11 @@ async def toggle_story_reaction_endpoint(
     user_id: Optional[int] = Header(None, alias="X-MAX-User-ID")
 ):
     """Поставить или убрать реакцию на историю."""
-    user = _require_stories_user(user_id)
-    story = database.get_story(story_id, include_expired=False)
+    user = await _require_stories_user(user_id)
+    story = await repo.stories.get(story_id, include_expired=False)
     if not story:
         raise HTTPException(status_code=404, detail="Story not found or expired")
-    added, new_count = database.toggle_story_reaction(story_id, user["id"])
+    added, new_count = await repo.stories.toggle_reaction(story_id, user["id"])
     return {"reacted": added, "reaction_count": new_count}
 
 
@@ -2225,17 +2665,13 @@ async def delete_story_endpoint(
     user_id: Optional[int] = Header(None, alias="X-MAX-User-ID")
 ):
     """Удалить свою историю."""
-    user = _require_stories_user(user_id)
+    user = await _require_stories_user(user_id)
     internal_id = user["id"]
-    if not database.delete_story(story_id, internal_id):
+    if not await repo.stories.delete(story_id, internal_id):
         raise HTTPException(status_code=404, detail="Story not found or not yours")
-    import pathlib
-    story_dir = STORIES_MEDIA_DIR / str(story_id)
-    if story_dir.exists():
-        try:
-            shutil.rmtree(story_dir)
-        except Exception:
-            pass
+    # Каталог stories/{id}/ остался только у историй, созданных до общего хранилища
+    await asyncio.to_thread(story_sweeper.remove_story_dirs, STORIES_MEDIA_DIR, [story_id])
+    await story_storage.store.collect(STORIES_MEDIA_DIR)
     return {"success": True}
 
 # ============ ПАНЕЛЬ СУПЕРАДМИНА ============
@@ -2246,10 +2682,10 @@ async def get_all_universities_endpoint(user_id: int = Header(None, alias="X-MAX
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID required")
     
-    if not database.is_superadmin(user_id):
+    if not await repo.users.is_superadmin(user_id):
         raise HTTPException(status_code=403, detail="Only superadmins can access this")
     
-    universities = database.get_all_universities()
+    universities = await repo.universities.get_all()
     return {"universities": universities}
 
 class UniversityCreate(BaseModel):
@@ -2267,16 +2703,17 @@ async def create_university_endpoint(
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID required")
     
-    if not database.is_superadmin(user_id):
+    if not await repo.users.is_superadmin(user_id):
         raise HTTPException(status_code=403, detail="Only superadmins can create universities")
     
-    university_id = database.create_university(
+    university_id = await repo.universities.create(
         data.name,
         data.short_name,
         data.description,
         user_id,
         data.admin_user_id
     )
+    config_cache.cache.bump()
     
     return {"success": True, "university_id": university_id}
 
@@ -2290,10 +2727,12 @@ async def set_university_admin_endpoint(
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID required")
     
-    if not database.is_superadmin(user_id):
+    if not await repo.users.is_superadmin(user_id):
         raise HTTPException(status_code=403, detail="Only superadmins can set university admins")
     
-    database.set_university_admin(university_id, admin_user_id)
+    if not await repo.universities.set_admin(university_id, admin_user_id):
+        raise HTTPException(status_code=404, detail="University not found")
+    config_cache.cache.bump()
     return {"success": True, "message": "University admin set"}
 
 @app.get("/api/admin/custom-blocks/standards")
@@ -0,0 +1,38 @@
+"""
+Служебные команды бэкенда.
+
+Запуск из каталога backend (рядом с data/):
+    python manage.py reconcile-stories   — пересчитать cover_url / thumb_url / reaction_count / view_count историй
+"""
+import argparse
+import sys
+
+import database
+import db_pool
+
+
+def cmd_reconcile_stories(args) -> int:
+    database.init_stories_db()
+    fixed = database.reconcile_story_counters()
+    for field, count in fixed.items():
+        print(f"{field}: исправлено {count}")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Служебные команды MAX University backend")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    reconcile = subparsers.add_parser("reconcile-stories",
+                                      help="Пересчитать денормализованные счётчики историй")
+    reconcile.set_defaults(func=cmd_reconcile_stories)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    finally:
+        db_pool.close_all()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
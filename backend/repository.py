@@ -0,0 +1,182 @@
+"""
+Асинхронный слой доступа к данным для эндпоинтов FastAPI.
+
+Функции database.* синхронные (sqlite3/psycopg2). Эндпоинты вызывают их через
+репозитории ниже: запрос выполняется в отдельном ограниченном пуле потоков,
+поэтому медленная запись в SQLite или запрос к PostgreSQL не блокируют event loop
+и остальные запросы воркера продолжают обрабатываться.
+
+Использование в main.py:
+    import repository as repo
+    user = await repo.users.get(max_user_id)
+
+DB_EXECUTOR_WORKERS — число потоков (по умолчанию равно DB_POOL_MAX_SIZE, чтобы
+потоки не простаивали в ожидании соединения PostgreSQL).
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+import database
+import db_pool
+
+EXECUTOR_WORKERS = max(1, int(os.environ.get("DB_EXECUTOR_WORKERS", db_pool.POOL_MAX_SIZE)))
+
+_executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="db")
+_lock = threading.Lock()
+_stats = {"submitted": 0, "completed": 0, "failed": 0, "in_flight": 0,
+          "queue_time_total": 0.0, "run_time_total": 0.0, "run_time_max": 0.0}
+
+
+def _timed(fn: Callable, submitted_at: float, *args, **kwargs):
+    started = time.monotonic()
+    with _lock:
+        _stats["queue_time_total"] += started - submitted_at
+    try:
+        result = fn(*args, **kwargs)
+    except BaseException:
+        with _lock:
+            _stats["failed"] += 1
+        raise
+    finally:
+        elapsed = time.monotonic() - started
+        with _lock:
+            _stats["in_flight"] -= 1
+            _stats["completed"] += 1
+            _stats["run_time_total"] += elapsed
+            _stats["run_time_max"] = max(_stats["run_time_max"], elapsed)
+    return result
+
+
+async def run(fn: Callable, *args, **kwargs) -> Any:
+    """Выполнить синхронную функцию БД в пуле потоков и дождаться результата."""
+    with _lock:
+        _stats["submitted"] += 1
+        _stats["in_flight"] += 1
+    loop = asyncio.get_running_loop()
+    call = functools.partial(_timed, fn, time.monotonic(), *args, **kwargs)
+    return await loop.run_in_executor(_executor, call)
+
+
+def _wrap(name: str) -> Callable:
+    # Функция берётся из database в момент вызова, а не импорта модуля.
+    async def method(*args, **kwargs):
+        return await run(getattr(database, name), *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(database, name).__doc__
+    return method
+
+
+class _Repository:
+    """Набор асинхронных обёрток над функциями database.* (атрибут -> имя функции)."""
+
+    def __init__(self, **functions: str):
+        for attr, name in functions.items():
+            setattr(self, attr, _wrap(name))
+
+
+users = _Repository(
+    get="get_user",
+    get_by_id="get_user_by_id",
+    get_by_ids="get_users_by_ids",
+    create="create_user",
+    update_role="update_user_role",
+    update_profile="update_user_profile",
+    update_with_invitation_code="update_user_with_invitation_code",
+    is_superadmin="is_superadmin",
+)
+
+universities = _Repository(
+    get="get_university",
+    get_all="get_all_universities",
+    create="create_university",
+    set_admin="set_university_admin",
+)
+
+config = _Repository(
+    get_university_config="get_university_config",
+    update_section_name="update_section_name",
+    update_header_color="update_header_color",
+    reorder_blocks="reorder_blocks",
+    reorder_sections="reorder_sections",
+    move_blocks="move_blocks",
+    move_sections="move_sections",
+    add_block="add_block",
+    delete_block="delete_block",
+    add_section="add_section",
+    delete_section="delete_section",
+    get_templates="get_templates",
+    save_template="save_template",
+    submit_custom_block="submit_custom_block",
+    get_pending_custom_blocks="get_pending_custom_blocks",
+    review_custom_block="review_custom_block",
+    get_approved_custom_blocks="get_approved_custom_blocks",
+)
+
+events = _Repository(
+    register="register_for_event",
+    get_user_registrations="get_user_event_registrations",
+)
+
+codes = _Repository(
+    generate_batch="generate_invitation_codes_batch",
+    get_by_university="get_invitation_codes_by_university",
+    get_page="get_invitation_codes_page",
+    get_summary="get_invitation_codes_summary",
+    use="use_invitation_code",
+    redeem="redeem_invitation_code",
+    import_students="import_students_and_generate_codes",
+)
+
+applications = _Repository(
+    get_directions="get_admission_directions",
+    get_direction="get_admission_direction",
+    get_all_directions="get_all_admission_directions",
+    create="create_application",
+    get_by_user="get_user_applications",
+    get_pending="get_pending_applications",
+    get_pending_page="get_pending_applications_page",
+    review="review_application",
+)
+
+stories = _Repository(
+    create="create_story",
+    update_slide_media_url="update_story_slide_media_url",
+    update_slide_previews="update_story_slide_previews",
+    attach_slide_blob="attach_story_slide_blob",
+    attach_slide_existing_blob="attach_story_slide_existing_blob",
+    delete_unreferenced_blobs="delete_unreferenced_story_blobs",
+    get="get_story",
+    get_feed="get_stories_feed",
+    record_view="record_story_view",
+    record_views_batch="record_story_views_batch",
+    get_my="get_my_stories",
+    delete="delete_story",
+    get_reaction_count="get_story_reaction_count",
+    get_reaction_counts="get_story_reaction_counts",
+    get_user_reacted_ids="get_user_reacted_story_ids",
+    toggle_reaction="toggle_story_reaction",
+    delete_expired="delete_expired_stories",
+    delete_expired_chunk="delete_expired_stories_chunk",
+    reconcile_counters="reconcile_story_counters",
+)
+
+
+def shutdown():
+    """Дождаться выполняющихся запросов и остановить пул потоков."""
+    _executor.shutdown(wait=True)
+
+
+def stats() -> Dict[str, Any]:
+    """Метрики пула потоков для /api/metrics."""
+    with _lock:
+        out = dict(_stats)
+    out["workers"] = EXECUTOR_WORKERS
+    done = out["completed"] or 1
+    out["queue_time_avg"] = out["queue_time_total"] / done
+    out["run_time_avg"] = out["run_time_total"] / done
+    return out
@@ -0,0 +1,96 @@
+"""
+Объединение одинаковых одновременных запросов к внешним сервисам (single-flight).
+
+Когда страницу хаба открывают тысячи пользователей сразу (начало перемены), каждый клиент
+вызывал /api/hub/feed, /api/hub/sources и /api/external/events, и каждый вызов шёл во внешний
+сервис отдельно. Теперь запросы с одинаковым ключом (URL + параметры) ждут один общий вызов
+и получают его результат (или его исключение).
+
+Общий вызов выполняется в отдельной задаче:
+    - отмена ожидающего запроса (клиент закрыл соединение) не отменяет вызов для остальных;
+    - вызов ограничен таймаутом ключа — зависший сервис не держит ключ занятым, и следующий
+      запрос начнёт новый вызов;
+    - ключ освобождается сразу после завершения вызова, результат не кэшируется
+      (кэширование — swr_cache.py).
+
+Результат общий для всех ожидающих — его нельзя изменять на месте.
+
+Использование в main.py:
+    data = await single_flight.group.do(single_flight.key(url, params), fetch, timeout=5.0)
+
+Метрики (вызовы, объединённые запросы, таймауты, ошибки) — /api/metrics, ключ single_flight.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+log = logging.getLogger("uvicorn.error")
+
+DEFAULT_TIMEOUT = 10.0
+
+
+def key(url: str, params: Optional[Dict[str, Any]] = None) -> Hashable:
+    """Ключ запроса: URL и параметры без учёта порядка (None-параметры не отправляются httpx и не учитываются)."""
+    items = tuple(sorted((str(k), str(v)) for k, v in (params or {}).items() if v is not None))
+    return (url, items)
+
+
+class SingleFlight:
+    """Ключ → задача, выполняющая общий вызов; ожидающие получают её результат."""
+
+    def __init__(self, name: str, timeout: float = DEFAULT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._stats = {"requests": 0, "calls": 0, "shared": 0, "timeouts": 0, "failures": 0}
+
+    async def _call(self, key: Hashable, fn: Callable[[], Awaitable[Any]], timeout: float) -> Any:
+        self._stats["calls"] += 1
+        try:
+            return await asyncio.wait_for(fn(), timeout)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            log.warning("%s: call %s timed out after %.1fs", self.name, key, timeout)
+            raise
+        except Exception:
+            self._stats["failures"] += 1
+            raise
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Исключение уже получили ожидающие; если их не осталось — не засоряем лог предупреждением asyncio
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """Результат fn() — общий для всех одновременных запросов с тем же ключом."""
+        self._stats["requests"] += 1
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(self._call(key, fn, timeout or self.timeout))
+            task.add_done_callback(lambda t: self._done(key, t))
+            self._calls[key] = task
+        else:
+            self._stats["shared"] += 1
+        # shield: отмена одного ожидающего не отменяет вызов для остальных
+        return await asyncio.shield(task)
+
+    async def stop(self):
+        """Отменить незавершённые вызовы (из shutdown-обработчика)."""
+        tasks = list(self._calls.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._calls.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /api/metrics."""
+        out = dict(self._stats)
+        out["in_flight"] = len(self._calls)
+        out["shared_ratio"] = out["shared"] / out["requests"] if out["requests"] else 0.0
+        return out
+
+
+group = SingleFlight("upstream")
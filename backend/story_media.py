@@ -0,0 +1,162 @@
+"""
+Фоновый конвейер превью для медиа историй.
+
+После того как create_story_endpoint перенёс файлы из _pending в хранилище (story_storage),
+рядом с файлом слайда {name}.{ext} строятся:
+  - {name}_thumb.webp  — уменьшенная WebP-копия (фото) или кадра видео;
+  - {name}_poster.jpg  — кадр-постер для MP4 (нужен ffmpeg в PATH).
+Файл хранилища общий для одинаковых загрузок, поэтому уже построенные превью переиспользуются.
+Ссылки сохраняются в story_slides.thumb_url / poster_url, превью первого слайда —
+в stories.thumb_url (его отдаёт лента как thumb_url).
+
+Обработка изображений выполняется в ограниченном пуле процессов
+(STORIES_MEDIA_WORKERS, по умолчанию 2), чтобы CPU-работа не занимала воркеры API.
+Pillow — необязательная зависимость: без неё превью не строятся, лента отдаёт только cover_url.
+
+Настройки: STORIES_THUMB_SIZE — максимальная сторона превью в пикселях (320).
+"""
+import asyncio
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+import repository as repo
+
+log = logging.getLogger("uvicorn.error")
+
+MEDIA_WORKERS = max(1, int(os.environ.get("STORIES_MEDIA_WORKERS", 2)))
+THUMB_SIZE = int(os.environ.get("STORIES_THUMB_SIZE", 320))
+THUMB_QUALITY = 80
+POSTER_SEEK_SEC = 0.5
+FFMPEG_TIMEOUT_SEC = 30
+
+
+# ============ РАБОТА В ДОЧЕРНЕМ ПРОЦЕССЕ ============
+
+def make_thumbnail(src: str, dst: str, size: int = THUMB_SIZE) -> bool:
+    """Уменьшить изображение до size по большей стороне и сохранить в WebP."""
+    with Image.open(src) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        img.thumbnail((size, size))
+        img.save(dst, "WEBP", quality=THUMB_QUALITY, method=4)
+    return True
+
+
+def make_video_previews(src: str, poster_dst: str, thumb_dst: str, size: int = THUMB_SIZE) -> bool:
+    """Вытащить кадр-постер из видео (ffmpeg) и построить по нему превью."""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return False
+    subprocess.run(
+        [ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-ss", str(POSTER_SEEK_SEC), "-i", src,
+         "-frames:v", "1", "-q:v", "3", poster_dst],
+        check=True, timeout=FFMPEG_TIMEOUT_SEC,
+    )
+    if not os.path.exists(poster_dst):
+        return False
+    if Image is not None:
+        make_thumbnail(poster_dst, thumb_dst, size)
+    return True
+
+
+# ============ ПЛАНИРОВЩИК ============
+
+class MediaPipeline:
+    """Очередь построения превью: asyncio-задачи поверх ограниченного пула процессов."""
+
+    def __init__(self, workers: int = MEDIA_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self._stats = {"scheduled": 0, "thumbnails": 0, "posters": 0, "reused": 0, "skipped": 0, "failed": 0}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self._stats[key] += n
+
+    async def _process_slide(self, media_dir: Path, story_id: int, position: int, slide_type: str, rel: str):
+        # rel — media_url слайда вида stories/.../{name}.{ext}
+        src = media_dir / rel.split("/", 1)[1]
+        thumb, poster = src.with_name(f"{src.stem}_thumb.webp"), src.with_name(f"{src.stem}_poster.jpg")
+        loop = asyncio.get_running_loop()
+        if thumb.exists() and (slide_type != "video" or poster.exists()):
+            self._count("reused")
+        elif slide_type == "video":
+            ok = await loop.run_in_executor(self._get_pool(), make_video_previews, str(src), str(poster), str(thumb))
+            if not ok:
+                self._count("skipped")
+                return
+            self._count("posters")
+            self._count("thumbnails", int(thumb.exists()))
+        else:
+            if Image is None:
+                self._count("skipped")
+                return
+            await loop.run_in_executor(self._get_pool(), make_thumbnail, str(src), str(thumb))
+            self._count("thumbnails")
+        prefix = rel.rsplit("/", 1)[0] + "/"
+        thumb_url = prefix + thumb.name if thumb.exists() else None
+        poster_url = prefix + poster.name if poster.exists() else None
+        await repo.stories.update_slide_previews(story_id, position, thumb_url, poster_url)
+
+    async def _process(self, media_dir: Path, story_id: int, slides: List[Tuple[int, str, str]]):
+        for position, slide_type, rel in slides:
+            try:
+                await self._process_slide(media_dir, story_id, position, slide_type, rel)
+            except Exception as e:
+                self._count("failed")
+                log.warning("Story %s slide %s preview failed: %s", story_id, position, e)
+
+    def schedule(self, media_dir: Path, story_id: int, slides: List[Tuple[int, str, str]]):
+        """
+        Поставить в очередь построение превью. slides — (position, type, media_url) для файлов,
+        уже перенесённых из _pending. Не ждёт завершения.
+        """
+        slides = [s for s in slides if s[2] and s[1] in ("image", "video")]
+        if not slides:
+            return
+        self._count("scheduled", len(slides))
+        task = asyncio.create_task(self._process(media_dir, story_id, slides))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        """Отменить незавершённые задачи и остановить пул процессов."""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /api/metrics."""
+        with self._lock:
+            out = dict(self._stats)
+        out["in_flight"] = len(self._tasks)
+        out["workers"] = self.workers
+        out["pillow"] = Image is not None
+        out["ffmpeg"] = shutil.which("ffmpeg") is not None
+        return out
+
+
+pipeline = MediaPipeline()
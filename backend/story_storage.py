@@ -0,0 +1,135 @@
+"""
+Хранилище медиа историй по хэшу содержимого.
+
+Файл слайда лежит в stories/blobs/{sha[:2]}/{sha256}.{ext}; одинаковые загрузки
+(один и тот же постер от нескольких авторов) хранятся и отдаются одним файлом.
+Учёт ссылок — в story_media_blobs.ref_count: create_story_endpoint увеличивает его
+(attach — новая загрузка, attach_existing — файл, уже используемый другой историей),
+delete_story и очистка истёкших историй уменьшают. Файлы без ссылок удаляет
+collect() — её вызывают sweeper и удаление истории. Рядом с файлом лежат его превью
+({sha}_thumb.webp, {sha}_poster.jpg); все файлы {sha}* удаляются вместе (в том числе копия
+с другим расширением, если те же байты загрузили с другим content-type).
+
+Привязка файла и сборка мусора сериализуются asyncio-замком, чтобы collect() не удалил
+файл, который в этот момент снова привязывается к новой истории (один процесс uvicorn).
+"""
+import asyncio
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import repository as repo
+
+BLOBS_DIR = "blobs"
+# Имя файла в _pending: {sha256}-{метка}.{ext} (хэш считается при загрузке)
+_PENDING_NAME_RE = re.compile(r"^([0-9a-f]{64})-[0-9a-f]+\.")
+_BLOB_URL_RE = re.compile(r"^stories/" + BLOBS_DIR + r"/([0-9a-f]{2})/([0-9a-f]{64})\.([a-z0-9]+)$")
+_HASH_CHUNK_BYTES = 256 * 1024
+
+
+def pending_name(sha256: str, token: str, ext: str) -> str:
+    return f"{sha256}-{token}.{ext}"
+
+
+def blob_media_url(sha256: str, ext: str) -> str:
+    """media_url файла хранилища (относительно корня медиа, как и остальные stories/...)."""
+    return f"stories/{BLOBS_DIR}/{sha256[:2]}/{sha256}.{ext}"
+
+
+def parse_blob_media_url(media_url: str) -> Optional[Tuple[str, str]]:
+    """(sha256, ext) для media_url файла хранилища или None."""
+    match = _BLOB_URL_RE.match(media_url or "")
+    if not match or match.group(2)[:2] != match.group(1):
+        return None
+    return match.group(2), match.group(3)
+
+
+def _blob_path(media_dir: Path, sha256: str, ext: str) -> Path:
+    return media_dir / BLOBS_DIR / sha256[:2] / f"{sha256}.{ext}"
+
+
+def _sha256_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_BYTES), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _place(pending: Path, target: Path) -> int:
+    """Перенести загруженный файл в хранилище (если такой уже есть — просто удалить копию)."""
+    if target.exists():
+        pending.unlink(missing_ok=True)
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(pending, target)
+    return target.stat().st_size
+
+
+def _remove_files(media_dir: Path, blobs: List[Tuple[str, str, int]]) -> int:
+    freed = 0
+    for sha256, ext, _ in blobs:
+        blob_dir = _blob_path(media_dir, sha256, ext).parent
+        for candidate in blob_dir.glob(sha256 + "*"):
+            try:
+                size = candidate.stat().st_size
+                candidate.unlink()
+                freed += size
+            except FileNotFoundError:
+                pass
+    return freed
+
+
+class BlobStore:
+    """Привязка загруженных файлов к слайдам и удаление файлов без ссылок."""
+
+    def __init__(self):
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def attach(self, media_dir: Path, story_id: int, position: int, pending: Path) -> str:
+        """Перенести файл из _pending в хранилище и привязать к слайду. Возвращает новый media_url."""
+        match = _PENDING_NAME_RE.match(pending.name)
+        sha256 = match.group(1) if match else await asyncio.to_thread(_sha256_file, pending)
+        ext = pending.suffix.lstrip(".").lower() or "jpg"
+        media_url = blob_media_url(sha256, ext)
+        async with self._get_lock():
+            size = await asyncio.to_thread(_place, pending, _blob_path(media_dir, sha256, ext))
+            await repo.stories.attach_slide_blob(story_id, position, sha256, ext, size, media_url)
+        return media_url
+
+    async def attach_existing(self, media_dir: Path, story_id: int, position: int, media_url: str) -> bool:
+        """
+        Привязать к слайду файл, уже лежащий в хранилище (media_url вида stories/blobs/...).
+        False — такого файла нет (или на него не осталось ссылок и его удаляет collect()).
+        """
+        parsed = parse_blob_media_url(media_url)
+        if parsed is None:
+            return False
+        sha256, ext = parsed
+        async with self._get_lock():
+            if not await asyncio.to_thread(_blob_path(media_dir, sha256, ext).is_file):
+                return False
+            return await repo.stories.attach_slide_existing_blob(story_id, position, sha256, media_url)
+
+    async def collect(self, media_dir: Path, limit: int = 500) -> Tuple[int, int]:
+        """Удалить файлы, на которые больше не ссылается ни один слайд. Возвращает (файлов, байт)."""
+        removed = freed = 0
+        async with self._get_lock():
+            while True:
+                blobs = await repo.stories.delete_unreferenced_blobs(limit)
+                if blobs:
+                    removed += len(blobs)
+                    freed += await asyncio.to_thread(_remove_files, media_dir, blobs)
+                if len(blobs) < limit:
+                    break
+        return removed, freed
+
+
+store = BlobStore()
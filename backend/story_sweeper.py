@@ -0,0 +1,136 @@
+"""
+Периодическая очистка истёкших историй.
+
+Фоновая задача раз в STORIES_SWEEP_INTERVAL секунд удаляет истёкшие истории пачками
+по STORIES_SWEEP_CHUNK (database.delete_expired_stories_chunk — набор DELETE ... IN (SELECT ...))
+и их медиа: уменьшает ссылки на файлы общего хранилища (story_storage) и удаляет файлы,
+на которые больше никто не ссылается, а также каталоги stories/{id}/ старых историй.
+Файлы удаляются в отдельном потоке, не на event loop. Первый проход выполняется сразу при старте.
+
+Метрики последнего прохода и суммарные — в /api/metrics, ключ stories_sweeper.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+import repository as repo
+import story_storage
+
+log = logging.getLogger("uvicorn.error")
+
+SWEEP_INTERVAL = float(os.environ.get("STORIES_SWEEP_INTERVAL", 300.0))
+SWEEP_CHUNK = int(os.environ.get("STORIES_SWEEP_CHUNK", 500))
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def remove_story_dirs(media_dir: Path, story_ids: Iterable[int]) -> int:
+    """Удалить каталоги медиа историй. Синхронная (вызывать вне event loop). Возвращает освобождённые байты."""
+    freed = 0
+    for story_id in story_ids:
+        story_dir = media_dir / str(story_id)
+        if not story_dir.exists():
+            continue
+        size = _dir_size(story_dir)
+        try:
+            shutil.rmtree(story_dir)
+            freed += size
+        except Exception:
+            pass
+    return freed
+
+
+class StorySweeper:
+    """Удаление истёкших историй пачками с метриками каждого прохода."""
+
+    def __init__(self, interval: float = SWEEP_INTERVAL, chunk_size: int = SWEEP_CHUNK):
+        self.interval = interval
+        self.chunk_size = max(1, chunk_size)
+        self.media_dir: Optional[Path] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self._last_run: Optional[Dict[str, Any]] = None
+        self._totals = {"runs": 0, "failures": 0, "stories_deleted": 0, "rows_deleted": 0,
+                        "blobs_deleted": 0, "bytes_freed": 0}
+
+    async def sweep(self) -> Dict[str, Any]:
+        """Один проход: удалить все истёкшие истории, пачка за пачкой."""
+        started = time.monotonic()
+        result = {"stories_deleted": 0, "rows_deleted": 0, "blobs_deleted": 0, "bytes_freed": 0, "chunks": 0}
+        while True:
+            ids, rows = await repo.stories.delete_expired_chunk(self.chunk_size)
+            if ids:
+                result["chunks"] += 1
+                result["stories_deleted"] += len(ids)
+                result["rows_deleted"] += rows
+                if self.media_dir is not None:
+                    result["bytes_freed"] += await asyncio.to_thread(remove_story_dirs, self.media_dir, ids)
+            if len(ids) < self.chunk_size:
+                break
+        if self.media_dir is not None:
+            blobs, freed = await story_storage.store.collect(self.media_dir, self.chunk_size)
+            result["blobs_deleted"] += blobs
+            result["bytes_freed"] += freed
+        result["duration_ms"] = (time.monotonic() - started) * 1000
+        result["finished_at"] = time.time()
+        with self._lock:
+            self._last_run = result
+            self._totals["runs"] += 1
+            for key in ("stories_deleted", "rows_deleted", "blobs_deleted", "bytes_freed"):
+                self._totals[key] += result[key]
+        if result["stories_deleted"] or result["blobs_deleted"]:
+            log.info("Stories sweep: removed %s expired (%s rows, %s files, %s bytes) in %.0f ms",
+                     result["stories_deleted"], result["rows_deleted"], result["blobs_deleted"],
+                     result["bytes_freed"], result["duration_ms"])
+        return result
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                with self._lock:
+                    self._totals["failures"] += 1
+                log.warning("Stories sweep failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self, media_dir: Path):
+        """Запустить периодическую очистку (из startup-обработчика)."""
+        self.media_dir = media_dir
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /api/metrics."""
+        with self._lock:
+            out = dict(self._totals)
+            out["last_run"] = dict(self._last_run) if self._last_run else None
+        out["interval"] = self.interval
+        out["chunk_size"] = self.chunk_size
+        return out
+
+
+sweeper = StorySweeper()
@@ -0,0 +1,133 @@
+"""
+Буфер просмотров историй (write-behind).
+
+POST /api/stories/{id}/view только кладёт пару (story_id, user_id) в память — без
+запроса к БД. Фоновая задача сбрасывает накопленные просмотры одной транзакцией
+(database.record_story_views_batch) раз в STORY_VIEWS_FLUSH_INTERVAL секунд или
+раньше, если в буфере набралось STORY_VIEWS_FLUSH_THRESHOLD просмотров.
+При остановке приложения буфер сбрасывается полностью.
+
+Повторные просмотры той же истории тем же пользователем схлопываются в памяти,
+а между сбросами — через INSERT OR IGNORE в story_views. view_count в ответах API
+может отставать от реального на время до одного сброса.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import repository as repo
+
+log = logging.getLogger("uvicorn.error")
+
+FLUSH_INTERVAL = float(os.environ.get("STORY_VIEWS_FLUSH_INTERVAL", 2.0))
+FLUSH_THRESHOLD = int(os.environ.get("STORY_VIEWS_FLUSH_THRESHOLD", 500))
+
+
+class ViewBuffer:
+    """Дедупликация просмотров в памяти и пакетная запись в БД."""
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, flush_threshold: int = FLUSH_THRESHOLD):
+        self.flush_interval = flush_interval
+        self.flush_threshold = max(1, flush_threshold)
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[int, int], Optional[int]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stats = {"received": 0, "deduplicated": 0, "flushed": 0, "ignored": 0,
+                       "flushes": 0, "flush_failures": 0, "last_flush_ms": 0.0}
+
+    def add(self, story_id: int, user_id: int, slide_reached: Optional[int] = None):
+        """Учесть просмотр. Не обращается к БД."""
+        key = (story_id, user_id)
+        with self._lock:
+            self._stats["received"] += 1
+            if key in self._pending:
+                self._stats["deduplicated"] += 1
+                previous = self._pending[key]
+                if slide_reached is not None and (previous is None or slide_reached > previous):
+                    self._pending[key] = slide_reached
+            else:
+                self._pending[key] = slide_reached
+            full = len(self._pending) >= self.flush_threshold
+        if full and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _take(self) -> Dict[Tuple[int, int], Optional[int]]:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        return batch
+
+    def _restore(self, batch: Dict[Tuple[int, int], Optional[int]]):
+        # Сброс не удался — вернуть просмотры в буфер, не затирая более свежие
+        with self._lock:
+            for key, slide_reached in batch.items():
+                self._pending.setdefault(key, slide_reached)
+
+    async def flush(self) -> int:
+        """Записать накопленные просмотры в БД. Возвращает число новых записей."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            batch = self._take()
+            if not batch:
+                return 0
+            rows = [(story_id, user_id, slide) for (story_id, user_id), slide in batch.items()]
+            started = time.monotonic()
+            try:
+                added = await repo.stories.record_views_batch(rows)
+            except Exception as e:
+                self._restore(batch)
+                with self._lock:
+                    self._stats["flush_failures"] += 1
+                log.warning("Story views flush failed (%s views kept in buffer): %s", len(rows), e)
+                return 0
+            with self._lock:
+                self._stats["flushes"] += 1
+                self._stats["flushed"] += added
+                self._stats["ignored"] += len(rows) - added
+                self._stats["last_flush_ms"] = (time.monotonic() - started) * 1000
+            return added
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        """Запустить периодический сброс (из startup-обработчика)."""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить фоновую задачу и сбросить всё, что осталось в буфере."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self._wakeup = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /api/metrics."""
+        with self._lock:
+            out = dict(self._stats)
+            out["pending"] = len(self._pending)
+        out["flush_interval"] = self.flush_interval
+        out["flush_threshold"] = self.flush_threshold
+        return out
+
+
+buffer = ViewBuffer()
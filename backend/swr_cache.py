@@ -0,0 +1,114 @@
+"""
+Кэш ответов внешних сервисов со stale-while-revalidate.
+
+Запись свежая TTL секунд — отдаётся без обращения к сервису. Следующие STALE_TTL секунд
+запись отдаётся как есть, а в фоне запускается одно обновление на ключ; клиент не ждёт
+внешний сервис. Если сервис недоступен (при промахе или при обновлении), отдаётся последняя
+успешно загруженная версия, сколько бы ей ни было, — вместо пустого ответа; повторная
+попытка по этому ключу — не раньше чем через TTL. Ошибка пробрасывается только если
+по ключу ещё ничего не загружалось.
+
+Используется для прокси ленты хаба (GET /api/hub/feed, ключ — limit, offset, channel).
+Метрики (попадания, устаревшие попадания, промахи, фоновые обновления) — /api/metrics.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+log = logging.getLogger("uvicorn.error")
+
+
+class SWRCache:
+    """Ключ → (значение, время загрузки) с фоновым обновлением устаревших записей."""
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float, max_entries: int = 256):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+        # После ошибки загрузки ключ не запрашивается у сервиса ещё ttl секунд — отдаётся старая версия
+        self._retry_after: Dict[Hashable, float] = {}
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0,
+                       "refresh_failures": 0, "load_failures": 0, "served_stale_on_error": 0}
+
+    def _put(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._retry_after.pop(evicted, None)
+
+    async def _refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        try:
+            self._put(key, await loader())
+            self._stats["refreshes"] += 1
+        except Exception as e:
+            self._stats["refresh_failures"] += 1
+            log.warning("%s: background refresh of %s failed: %s", self.name, key, e)
+        finally:
+            self._refreshing.pop(key, None)
+
+    def _schedule_refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        if key not in self._refreshing:
+            self._refreshing[key] = asyncio.create_task(self._refresh(key, loader))
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Значение по ключу; loader загружает его из внешнего сервиса (и может бросить исключение)."""
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            loaded_at, value = entry
+            age = now - loaded_at
+            if age < self.ttl:
+                self._stats["hits"] += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self._stats["stale_hits"] += 1
+                self._schedule_refresh(key, loader)
+                return value
+            if now < self._retry_after.get(key, 0.0):
+                self._stats["served_stale_on_error"] += 1
+                return value
+
+        self._stats["misses"] += 1
+        try:
+            value = await loader()
+        except Exception:
+            self._stats["load_failures"] += 1
+            if entry is None:
+                raise
+            self._retry_after[key] = now + self.ttl
+            self._stats["served_stale_on_error"] += 1
+            return entry[1]
+        self._retry_after.pop(key, None)
+        self._put(key, value)
+        return value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Последнее загруженное значение без учёта возраста (или None)."""
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else None
+
+    async def stop(self):
+        """Отменить фоновые обновления (из shutdown-обработчика)."""
+        tasks = list(self._refreshing.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._refreshing.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики для /api/metrics."""
+        out = dict(self._stats)
+        served = out["hits"] + out["stale_hits"] + out["misses"]
+        out["hit_ratio"] = (out["hits"] + out["stale_hits"]) / served if served else 0.0
+        out["entries"] = len(self._entries)
+        out["refreshing"] = len(self._refreshing)
+        out["ttl"] = self.ttl
+        out["stale_ttl"] = self.stale_ttl
+        return out
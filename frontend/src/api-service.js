@@ -461,14 +461,14 @@ class UniversityAPIService {
     }
   }
 
-  // Hub: лента постов (cold_news)
+  // Hub: лента постов (cold_news). params: { limit, channel, cursor } — следующая страница по next_cursor
   async getHubFeed(params = {}) {
     try {
       const response = await this.client.get('/hub/feed', { params });
       return response.data;
     } catch (error) {
       console.error('Get hub feed error:', error);
-      return { posts: [], total: 0 };
+      return { posts: [], total: 0, next_cursor: null, has_more: false };
     }
   }
 
@@ -1006,12 +1006,16 @@ class UniversityAPIService {
     }
   }
 
-  async getInvitationCodes(universityId, used = null) {
+  // Страница кодов: { cursor, limit, role }; следующая страница — с cursor = next_cursor из ответа
+  async getInvitationCodes(universityId, used = null, { cursor = null, limit = null, role = null } = {}) {
     try {
       const response = await this.client.get('/admin/invitation-codes', {
         params: {
           university_id: universityId,
-          ...(used !== null && { used })
+          ...(used !== null && { used }),
+          ...(cursor && { cursor }),
+          ...(limit && { limit }),
+          ...(role && { role })
         }
       });
       return response.data;
@@ -1019,11 +1023,25 @@ class UniversityAPIService {
       console.error('Get invitation codes error:', error);
       // Мок-данные при ошибке
       return {
-        codes: []
+        codes: [],
+        next_cursor: null,
+        has_more: false
       };
     }
   }
 
+  async getInvitationCodesSummary(universityId) {
+    try {
+      const response = await this.client.get('/admin/invitation-codes', {
+        params: { university_id: universityId, summary: true }
+      });
+      return response.data.summary;
+    } catch (error) {
+      console.error('Get invitation codes summary error:', error);
+      return { total: 0, used: 0, unused: 0, by_role: {} };
+    }
+  }
+
   async importStudents(universityId, students) {
     try {
       const response = await this.client.post('/admin/invitation-codes/import-students', {
@@ -1103,15 +1121,16 @@ class UniversityAPIService {
     }
   }
 
-  async getPendingApplications(universityId) {
+  // Очередь заявлений постранично; следующая страница — с cursor = next_cursor из ответа
+  async getPendingApplications(universityId, cursor = null) {
     try {
       const response = await this.client.get('/admin/applications', {
-        params: { university_id: universityId }
+        params: { university_id: universityId, ...(cursor && { cursor }) }
       });
       return response.data;
     } catch (error) {
       console.error('Get pending applications error:', error);
-      return { applications: [] };
+      return { applications: [], next_cursor: null, has_more: false };
     }
   }
 
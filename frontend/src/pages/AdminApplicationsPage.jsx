@@ -9,6 +9,9 @@ const AdminApplicationsPage = () => {
   const user = useSelector((state) => state.user);
   const [applications, setApplications] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [total, setTotal] = useState(0);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedApp, setSelectedApp] = useState(null);
   const [reviewNotes, setReviewNotes] = useState('');
 
@@ -21,6 +24,8 @@ const AdminApplicationsPage = () => {
       const universityId = user.universityId || parseInt(localStorage.getItem('universityId') || '1');
       const data = await apiService.getPendingApplications(universityId);
       setApplications(data.applications || []);
+      setNextCursor(data.next_cursor || null);
+      setTotal(data.total ?? (data.applications || []).length);
     } catch (error) {
       console.error('Error loading applications:', error);
       setApplications([]);
@@ -29,6 +34,21 @@ const AdminApplicationsPage = () => {
     }
   };
 
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const universityId = user.universityId || parseInt(localStorage.getItem('universityId') || '1');
+      const data = await apiService.getPendingApplications(universityId, nextCursor);
+      setApplications((prev) => [...prev, ...(data.applications || [])]);
+      setNextCursor(data.next_cursor || null);
+    } catch (error) {
+      console.error('Error loading applications:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleReview = async (applicationId, status) => {
     if (!reviewNotes.trim() && status === 'rejected') {
       alert('Укажите причину отклонения');
@@ -227,6 +247,15 @@ const AdminApplicationsPage = () => {
                 )}
               </div>
             ))}
+            {nextCursor && (
+              <button
+                className="btn btn-secondary"
+                onClick={loadMore}
+                disabled={loadingMore}
+              >
+                {loadingMore ? 'Загрузка...' : `Показать ещё (${total - applications.length})`}
+              </button>
+            )}
           </div>
         ) : (
           <div className="card">
@@ -22,7 +22,6 @@ const HubPage = () => {
   const { userInfo } = useMAXBridge();
   const { displayName, avatarUrl: userAvatar } = getDisplayUser(userInfo, user);
   const [feedPosts, setFeedPosts] = useState([]);
-  const [feedTotal, setFeedTotal] = useState(0);
   const [sources, setSources] = useState([]);
   const [selectedSources, setSelectedSources] = useState(getStoredSources);
   const [sourcesModalOpen, setSourcesModalOpen] = useState(false);
@@ -30,7 +29,7 @@ const HubPage = () => {
   const [storiesViewerIndex, setStoriesViewerIndex] = useState(null);
   const [storyDetailForViewer, setStoryDetailForViewer] = useState(null);
   const [feedLoading, setFeedLoading] = useState(true);
-  const [feedOffset, setFeedOffset] = useState(0);
+  const [feedCursor, setFeedCursor] = useState(null);
   const feedLimit = 20;
 
   useEffect(() => {
@@ -53,25 +52,25 @@ const HubPage = () => {
     setFeedLoading(true);
     try {
       const stored = selectedSources.length ? selectedSources : getStoredSources();
-      const params = { limit: feedLimit, offset: append ? feedOffset : 0 };
+      const params = { limit: feedLimit };
+      if (append && feedCursor) params.cursor = feedCursor;
       if (stored.length === 1) params.channel = stored[0];
       else if (stored.length > 1) params.channel = stored[0];
       const data = await apiService.getHubFeed(params);
       const posts = data.posts || [];
-      const total = data.total ?? 0;
       if (append) {
         setFeedPosts((prev) => [...prev, ...posts]);
       } else {
         setFeedPosts(posts);
       }
-      setFeedOffset((append ? feedOffset : 0) + posts.length);
-      setFeedTotal(total);
+      setFeedCursor(data.next_cursor || null);
     } catch (e) {
       if (!append) setFeedPosts([]);
+      setFeedCursor(null);
     } finally {
       setFeedLoading(false);
     }
-  }, [feedOffset, selectedSources]);
+  }, [feedCursor, selectedSources]);
 
   useEffect(() => {
     loadFeed(false);
@@ -125,7 +124,7 @@ const HubPage = () => {
   };
 
   const loadMore = () => {
-    if (!feedLoading && feedOffset < feedTotal) loadFeed(true);
+    if (!feedLoading && feedCursor) loadFeed(true);
   };
 
   return (
@@ -236,7 +235,7 @@ const HubPage = () => {
                 </p>
               </div>
             )}
-            {feedOffset < feedTotal && feedPosts.length > 0 && (
+            {feedCursor && feedPosts.length > 0 && (
               <Button
                 mode="secondary"
                 appearance="neutral"
@@ -7,7 +7,9 @@ import BackendWarning from '../components/BackendWarning.jsx';
 const InvitationCodesPage = () => {
   const navigate = useNavigate();
   const user = useSelector((state) => state.user);
-  const [codes, setCodes] = useState([]);
+  const [unusedCodes, setUnusedCodes] = useState([]);
+  const [usedCodes, setUsedCodes] = useState([]);
+  const [summary, setSummary] = useState({ total: 0, used: 0, unused: 0 });
   const [loading, setLoading] = useState(true);
   const [generating, setGenerating] = useState(false);
   const [showImport, setShowImport] = useState(false);
@@ -25,8 +27,15 @@ const InvitationCodesPage = () => {
   const loadCodes = async () => {
     try {
       const universityId = user.universityId || parseInt(localStorage.getItem('universityId') || '1');
-      const data = await apiService.getInvitationCodes(universityId);
-      setCodes(data.codes || []);
+      // Для экрана достаточно первых страниц и счётчиков — весь список не загружается
+      const [unused, used, counts] = await Promise.all([
+        apiService.getInvitationCodes(universityId, false, { limit: 20 }),
+        apiService.getInvitationCodes(universityId, true, { limit: 10 }),
+        apiService.getInvitationCodesSummary(universityId)
+      ]);
+      setUnusedCodes(unused.codes || []);
+      setUsedCodes(used.codes || []);
+      setSummary(counts);
     } catch (error) {
       console.error('Error loading codes:', error);
     } finally {
@@ -121,7 +130,17 @@ const InvitationCodesPage = () => {
     URL.revokeObjectURL(url);
   };
 
-  const downloadCodes = () => {
+  const downloadCodes = async () => {
+    // Все коды — постранично по курсору
+    const universityId = user.universityId || parseInt(localStorage.getItem('universityId') || '1');
+    const codes = [];
+    let cursor = null;
+    do {
+      const page = await apiService.getInvitationCodes(universityId, null, { cursor, limit: 500 });
+      codes.push(...(page.codes || []));
+      cursor = page.next_cursor;
+    } while (cursor);
+
     const csvHeader = 'Код,Роль,Использован,Дата создания\n';
     const csvRows = codes.map(c => 
       `"${c.code}","${c.role}","${c.used_by_user_id ? 'Да' : 'Нет'}","${c.created_at}"`
@@ -150,9 +169,6 @@ const InvitationCodesPage = () => {
     );
   }
 
-  const unusedCodes = codes.filter(c => !c.used_by_user_id);
-  const usedCodes = codes.filter(c => c.used_by_user_id);
-
   return (
     <div className="page">
       <BackendWarning />
@@ -301,10 +317,10 @@ const InvitationCodesPage = () => {
         </div>
 
         <div style={{ marginBottom: '16px' }}>
-          <h3 style={{ fontSize: '16px', marginBottom: '8px' }}>Неиспользованные ({unusedCodes.length})</h3>
+          <h3 style={{ fontSize: '16px', marginBottom: '8px' }}>Неиспользованные ({summary.unused})</h3>
           {unusedCodes.length > 0 ? (
             <div style={{ display: 'flex', flexDirection: 'column', gap: '8px' }}>
-              {unusedCodes.slice(0, 20).map((code) => (
+              {unusedCodes.map((code) => (
                 <div key={code.id} style={{ 
                   padding: '8px', 
                   background: 'var(--max-bg-secondary)', 
@@ -319,9 +335,9 @@ const InvitationCodesPage = () => {
                   </span>
                 </div>
               ))}
-              {unusedCodes.length > 20 && (
+              {summary.unused > unusedCodes.length && (
                 <p style={{ fontSize: '12px', color: 'var(--max-text-secondary)' }}>
-                  И ещё {unusedCodes.length - 20} кодов...
+                  И ещё {summary.unused - unusedCodes.length} кодов...
                 </p>
               )}
             </div>
@@ -331,10 +347,10 @@ const InvitationCodesPage = () => {
         </div>
 
         <div>
-          <h3 style={{ fontSize: '16px', marginBottom: '8px' }}>Использованные ({usedCodes.length})</h3>
+          <h3 style={{ fontSize: '16px', marginBottom: '8px' }}>Использованные ({summary.used})</h3>
           {usedCodes.length > 0 ? (
             <div style={{ display: 'flex', flexDirection: 'column', gap: '8px' }}>
-              {usedCodes.slice(0, 10).map((code) => (
+              {usedCodes.map((code) => (
                 <div key={code.id} style={{ 
                   padding: '8px', 
                   background: 'var(--max-bg-secondary)', 
@@ -350,9 +366,9 @@ const InvitationCodesPage = () => {
                   </span>
                 </div>
               ))}
-              {usedCodes.length > 10 && (
+              {summary.used > usedCodes.length && (
                 <p style={{ fontSize: '12px', color: 'var(--max-text-secondary)' }}>
-                  И ещё {usedCodes.length - 10} кодов...
+                  И ещё {summary.used - usedCodes.length} кодов...
                 </p>
               )}
             </div>
@@ -52,7 +52,7 @@ const MainPage = () => {
   const [searchQuery, setSearchQuery] = useState('');
   const [feedPosts, setFeedPosts] = useState([]);
   const [feedTotal, setFeedTotal] = useState(0);
-  const [feedOffset, setFeedOffset] = useState(0);
+  const [feedCursor, setFeedCursor] = useState(null);
   const [feedLoading, setFeedLoading] = useState(false);
   const [feedHasMore, setFeedHasMore] = useState(true);
   const [storiesFeed, setStoriesFeed] = useState([]);
@@ -78,8 +78,9 @@ const MainPage = () => {
   const loadFeed = useCallback(async (append = false) => {
     setFeedLoading(true);
     try {
-      const offset = append ? feedOffset : 0;
-      const data = await apiService.getHubFeed({ limit: feedLimit, offset });
+      const params = { limit: feedLimit };
+      if (append && feedCursor) params.cursor = feedCursor;
+      const data = await apiService.getHubFeed(params);
       const posts = data.posts || [];
       const total = data.total ?? 0;
       if (append) {
@@ -87,16 +88,16 @@ const MainPage = () => {
       } else {
         setFeedPosts(posts);
       }
-      setFeedOffset(offset + posts.length);
+      setFeedCursor(data.next_cursor || null);
       setFeedTotal(total);
-      setFeedHasMore(offset + posts.length < total);
+      setFeedHasMore(Boolean(data.next_cursor));
     } catch (_) {
       if (!append) setFeedPosts([]);
       setFeedHasMore(false);
     } finally {
       setFeedLoading(false);
     }
-  }, [feedOffset]);
+  }, [feedCursor]);
 
   useEffect(() => {
     loadFeed(false);
@@ -30,6 +30,8 @@ const NewsPostSchema = new mongoose.Schema({
   tema: { type: [String], default: [] },
   tags: [String],
 }, { collection: 'news_posts' });
+// Порядок ленты и keyset-пагинация (before) — по индексу
+NewsPostSchema.index({ date: -1, _id: -1 });
 
 const NewsPost = mongoose.models.newsPost || mongoose.model('newsPost', NewsPostSchema, 'news_posts');
 
@@ -48,24 +50,48 @@ app.get('/api/feed', async (req, res) => {
     const limit = Math.min(parseInt(req.query.limit, 10) || 20, 100);
     const offset = parseInt(req.query.offset, 10) || 0;
     const channel = req.query.channel ? String(req.query.channel).trim() : null;
+    const excludeChannel = req.query.exclude_channel ? String(req.query.exclude_channel).trim() : null;
+    // before=<ISO-дата>|<id> — посты старше указанного (keyset-пагинация вместо skip)
+    const before = req.query.before ? String(req.query.before) : null;
     const user_id = req.query.user_id; // optional: for future per-user sources
 
     if (!mongoose.connection.readyState) {
       return res.json({ posts: [], total: 0 });
     }
 
-    const filter = {};
+    const conditions = [];
     if (channel) {
-      filter.$or = [
+      conditions.push({ $or: [
         { channelUsername: new RegExp(channel, 'i') },
         { channel: new RegExp(channel, 'i') },
-      ];
+      ] });
+    }
+    if (excludeChannel) {
+      conditions.push({ channelId: { $ne: excludeChannel } }, { channel: { $ne: excludeChannel } });
+    }
+    const filter = conditions.length ? { $and: conditions } : {};
+
+    // Страница: с before — по ключу (date, _id), иначе по смещению; total — по всей ленте
+    let pageFilter = filter;
+    let skip = offset;
+    if (before) {
+      const sep = before.lastIndexOf('|');
+      const beforeDate = new Date(sep >= 0 ? before.slice(0, sep) : before);
+      const beforeId = sep >= 0 ? before.slice(sep + 1) : '';
+      if (Number.isNaN(beforeDate.getTime())) {
+        return res.status(400).json({ error: 'Invalid before', posts: [] });
+      }
+      const older = mongoose.Types.ObjectId.isValid(beforeId) && String(beforeId).length === 24
+        ? { $or: [{ date: { $lt: beforeDate } }, { date: beforeDate, _id: { $lt: new mongoose.Types.ObjectId(beforeId) } }] }
+        : { date: { $lte: beforeDate } };
+      pageFilter = { $and: [filter, older] };
+      skip = 0;
     }
 
     const [posts, total] = await Promise.all([
-      NewsPost.find(filter)
-        .sort({ date: -1 })
-        .skip(offset)
+      NewsPost.find(pageFilter)
+        .sort({ date: -1, _id: -1 })
+        .skip(skip)
         .limit(limit)
         .lean(),
       NewsPost.countDocuments(filter),